@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Meal, Category, Review
+from .models import Meal, Category, Review, Job
 from django.contrib.auth import get_user_model
 from rest_framework.authtoken.models import Token
 
@@ -27,3 +27,9 @@ class ReviewAdmin(admin.ModelAdmin):
     list_display = ('user', 'meal', 'rating', 'created_at')
     search_fields = ('user__username', 'meal__name')
     list_filter = ('rating',)
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('task', 'status', 'attempts', 'run_after', 'finished_at')
+    list_filter = ('status', 'task')
+    search_fields = ('key',)
@@ -0,0 +1,180 @@
+"""ASGI-native read endpoints for meals, reviews and categories.
+
+DRF views are synchronous, so under an ASGI server every request to them is
+handed to a worker thread. These views run on the event loop instead: they
+use the async ORM (`acount`, `aget`, `aiterator`) and the serializer-free row
+specs from `API.exports`, and return the same payloads as their DRF
+counterparts, including the `?fields=`/`?exclude=` sparse fieldsets. They authenticate with the same cached tokens and, like the
+rest of the API, require an authenticated user.
+"""
+import functools
+import math
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import ValidationError
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from .authentication import token_cache
+from .cache import category_index
+from .exports import MEAL_ROWS, REVIEW_ROWS, absolute_media
+from .filters import MealQuery
+from .histograms import BUCKETS, summarize
+from .models import Meal, Review, RatingHistogramBin
+from .pagination import StandardResultsSetPagination
+from .serializers import (
+    CategorySerializer, MealDetailSerializer, MealSerializer, ReviewSerializer, sparse_fieldset,
+)
+
+INVALID_PAGE = {'detail': 'Invalid page.'}
+
+
+def _json(data, status=200):
+    return JsonResponse(
+        data, status=status, safe=False, encoder=JSONEncoder, json_dumps_params={'ensure_ascii': False},
+    )
+
+
+async def _authenticate(request):
+    """Async twin of CachedTokenAuthentication; returns the user or None."""
+    header = request.headers.get('Authorization', '').split()
+    if len(header) != 2 or header[0] != 'Token':
+        return None
+    cached = token_cache.get(header[1])
+    if cached is not None:
+        return cached[0]
+    try:
+        token = await Token.objects.select_related('user').aget(key=header[1])
+    except Token.DoesNotExist:
+        return None
+    if not token.user.is_active:
+        return None
+    token_cache.set(header[1], token.user, token)
+    return token.user
+
+
+def authenticated(view):
+    """Allow only authenticated GET requests, like the DRF defaults."""
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method != 'GET':
+            return _json({'detail': f'Method "{request.method}" not allowed.'}, status=405)
+        request.user = await _authenticate(request)
+        if request.user is None:
+            return _json({'detail': 'Authentication credentials were not provided.'}, status=401)
+        return await view(request, *args, **kwargs)
+    return wrapper
+
+
+def _page_bounds(request, count):
+    """(page, page_size) with DRF's parameters and limits, or None if invalid."""
+    paginator = StandardResultsSetPagination
+    try:
+        page_size = int(request.GET[paginator.page_size_query_param])
+    except (KeyError, ValueError):
+        page_size = 0
+    page_size = min(page_size, paginator.max_page_size) if page_size > 0 else paginator.page_size
+    try:
+        page = int(request.GET.get(paginator.page_query_param, 1))
+    except ValueError:
+        return None
+    if not 1 <= page <= max(1, math.ceil(count / page_size)):
+        return None
+    return page, page_size
+
+
+def _page_envelope(request, count, page, page_size, results):
+    url = request.build_absolute_uri()
+    previous = None
+    if page > 1:
+        previous = remove_query_param(url, 'page') if page == 2 else replace_query_param(url, 'page', page - 1)
+    return {
+        'count': count,
+        'next': replace_query_param(url, 'page', page + 1) if page * page_size < count else None,
+        'previous': previous,
+        'results': results,
+    }
+
+
+async def _paginate(request, queryset, spec, fields=None):
+    count = await queryset.acount()
+    bounds = _page_bounds(request, count)
+    if bounds is None:
+        return None
+    page, page_size = bounds
+    start = (page - 1) * page_size
+    columns = spec.value_names if fields is None else spec.value_names_for(fields)
+    values = queryset.values(*columns)[start:start + page_size]
+    results = [
+        absolute_media(spec.to_row(row, fields), request.build_absolute_uri) async for row in values.aiterator()
+    ]
+    return _page_envelope(request, count, page, page_size, results)
+
+
+@authenticated
+async def meal_list(request):
+    try:
+        fields = sparse_fieldset(MealSerializer, request)
+        query = await sync_to_async(MealQuery)(request.GET)
+    except ValidationError as exc:
+        return _json(exc.detail, status=400)
+    data = await _paginate(request, query.apply(Meal.objects.all()), MEAL_ROWS, fields)
+    if data is None:
+        return _json(INVALID_PAGE, status=404)
+    return _json(data)
+
+
+@authenticated
+async def meal_detail(request, slug):
+    try:
+        fields = sparse_fieldset(MealDetailSerializer, request)
+    except ValidationError as exc:
+        return _json(exc.detail, status=400)
+    if fields is None:
+        fields = MealDetailSerializer.Meta.fields
+    row_fields = [field for field in fields if field in MEAL_ROWS.columns]
+    row = await Meal.objects.filter(slug=slug).values('id', *MEAL_ROWS.value_names_for(row_fields)).afirst()
+    if row is None:
+        return _json({'detail': 'No Meal matches the given query.'}, status=404)
+    data = absolute_media(MEAL_ROWS.to_row(row, row_fields), request.build_absolute_uri)
+    if 'rating_distribution' not in fields:
+        return _json(data)
+    histogram = [0] * BUCKETS
+    # values(), not values_list(): the latter opens its cursor outside the worker thread
+    async for entry in RatingHistogramBin.objects.filter(meal__slug=slug).values('bucket', 'count').aiterator():
+        histogram[entry['bucket']] = entry['count']
+    data['rating_distribution'] = summarize(histogram)
+    return _json(data)
+
+
+@authenticated
+async def review_list(request, meal_slug):
+    try:
+        fields = sparse_fieldset(ReviewSerializer, request)
+    except ValidationError as exc:
+        return _json(exc.detail, status=400)
+    reviews = Review.objects.filter(meal__slug=meal_slug).order_by('-created_at', '-id')
+    data = await _paginate(request, reviews, REVIEW_ROWS, fields)
+    if data is None:
+        return _json(INVALID_PAGE, status=404)
+    return _json(data)
+
+
+@authenticated
+async def category_list(request):
+    try:
+        fields = sparse_fieldset(CategorySerializer, request)
+    except ValidationError as exc:
+        return _json(exc.detail, status=400)
+    if fields is None:
+        fields = CategorySerializer.Meta.fields
+    index = await sync_to_async(category_index)()
+    rows = [{field: row[field] for field in fields} for row in index.values()]
+    bounds = _page_bounds(request, len(rows))
+    if bounds is None:
+        return _json(INVALID_PAGE, status=404)
+    page, page_size = bounds
+    results = rows[(page - 1) * page_size:page * page_size]
+    return _json(_page_envelope(request, len(rows), page, page_size, results))
@@ -0,0 +1,88 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from rest_framework.authentication import TokenAuthentication
+
+from .cache import bump_version, get_version
+
+
+def _user_namespace(user_id):
+    return f'user-tokens:{user_id}'
+
+
+class TokenUserCache:
+    """Bounded LRU of token key -> (user, token) with a per-entry TTL.
+
+    The LRU lives in each process, so every entry also records the version
+    of its user's namespace in the shared Django cache. `delete_user` bumps
+    that version, and a hit whose version is stale is dropped, so a change
+    made in one process invalidates the entries of all of them.
+    """
+
+    def __init__(self, maxsize=10000, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, version, user, token = entry
+        if expires < time.monotonic() or version != get_version(_user_namespace(user.pk)):
+            with self._lock:
+                if self._entries.get(key) is entry:
+                    del self._entries[key]
+            return None
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+        # Hand out copies so one request cannot mutate another's user
+        return copy.copy(user), token
+
+    def set(self, key, user, token):
+        version = get_version(_user_namespace(user.pk))
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, version, user, token)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        """Forget one key in this process only; see `delete_user`."""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def delete_user(self, user_id):
+        """Invalidate the user's tokens in every process."""
+        bump_version(_user_namespace(user_id))
+        with self._lock:
+            for key in [key for key, (_, _, user, _) in self._entries.items() if user.pk == user_id]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+token_cache = TokenUserCache(
+    maxsize=getattr(settings, 'API_TOKEN_CACHE_SIZE', 10000),
+    ttl=getattr(settings, 'API_TOKEN_CACHE_TTL', 300),
+)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication that skips the token lookup for recently seen keys."""
+
+    def authenticate_credentials(self, key):
+        cached = token_cache.get(key)
+        if cached is not None:
+            return cached
+        user, token = super().authenticate_credentials(key)
+        token_cache.set(key, user, token)
+        return user, token
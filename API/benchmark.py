@@ -0,0 +1,505 @@
+"""Helpers shared by the benchmark management commands."""
+import asyncio
+import json
+import platform
+import random
+import re
+import statistics
+import subprocess
+import time
+from collections import namedtuple
+from datetime import timedelta
+from decimal import Decimal
+from urllib.parse import urlencode, urlsplit
+from urllib.request import urlopen
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import connection
+from django.test import Client, RequestFactory
+from django.urls import resolve
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+
+from . import histograms, leaderboards
+from .cache import bump_version
+from .exports import MEAL_ROWS, REVIEW_ROWS, absolute_media
+from .fastpath import FastJSONRenderer
+from .models import Meal, Category, Review
+from .response_cache import response_cache
+from .serializers import MealSerializer, ReviewSerializer
+
+BENCH_PREFIX = 'bench'
+SCALES = {'10k': 10_000, '100k': 100_000, '1m': 1_000_000}  # reviews per dataset
+
+# Vocabulary for searchable meal names and descriptions
+DISHES = ('koshari', 'falafel', 'shawarma', 'molokhia', 'fattah', 'hawawshi', 'feteer', 'mahshi', 'kofta', 'tagine')
+STYLES = ('spicy', 'classic', 'grilled', 'crispy', 'smoky', 'creamy', 'vegan', 'family', 'street', 'royal')
+# Ratings 0.0-5.0 in half stars, skewed towards 4 like real review sites
+RATING_WEIGHTS = (1, 1, 2, 2, 4, 5, 8, 12, 20, 22, 23)
+COMMENTS = ('', '', '', 'Great portion.', 'Too salty for me.', 'Would order again!', 'Arrived cold.', 'Best in town.')
+
+
+def seed_dataset(reviews, meals=None, categories=20, batch_size=10000, seed=0, stdout=None):
+    """Bulk insert `reviews` reviews spread over enough users and meals.
+
+    Objects are named with BENCH_PREFIX so `clear_dataset` can remove them.
+    Signals are bypassed, so the stored rating totals are rebuilt at the end.
+    """
+    rng = random.Random(seed)
+    meals = meals or max(10, min(5000, reviews // 200))
+    users = -(-reviews // meals)  # ceil: every (user, meal) pair is unique
+    User = get_user_model()
+    password = make_password(None)
+
+    Category.objects.bulk_create(
+        [Category(name=f'{BENCH_PREFIX} category {i}', slug=f'{BENCH_PREFIX}-category-{i}') for i in range(categories)],
+        batch_size=batch_size,
+    )
+    category_names = dict(Category.objects.filter(slug__startswith=f'{BENCH_PREFIX}-').values_list('pk', 'name'))
+    category_ids = list(category_names)
+    meal_categories = [rng.choice(category_ids) for _ in range(meals)]
+    names = [f'{BENCH_PREFIX} {rng.choice(STYLES)} {rng.choice(DISHES)} {i}' for i in range(meals)]
+    descriptions = [f'{rng.choice(STYLES).title()} {rng.choice(DISHES)} with {rng.choice(DISHES)} on the side' for _ in range(meals)]
+    Meal.objects.bulk_create(
+        [
+            Meal(
+                name=names[i],
+                slug=f'{BENCH_PREFIX}-meal-{i}',
+                description=descriptions[i],
+                search_text=Meal.build_search_text(names[i], descriptions[i], category_names[meal_categories[i]]),
+                price=Decimal(rng.randint(100, 9999)) / 100,
+                category_id=meal_categories[i],
+            )
+            for i in range(meals)
+        ],
+        batch_size=batch_size,
+    )
+    User.objects.bulk_create(
+        [
+            User(
+                username=f'{BENCH_PREFIX}_user_{i}',
+                email=f'{BENCH_PREFIX}_user_{i}@example.com',
+                phone_number=f'9{i:010d}',
+                password=password,
+            )
+            for i in range(users)
+        ],
+        batch_size=batch_size,
+    )
+    meal_ids = list(Meal.objects.filter(slug__startswith=f'{BENCH_PREFIX}-').values_list('pk', flat=True))
+    user_ids = list(User.objects.filter(username__startswith=f'{BENCH_PREFIX}_').values_list('pk', flat=True))
+
+    batch = []
+    for n in range(reviews):
+        user_id, meal_id = user_ids[n // len(meal_ids)], meal_ids[n % len(meal_ids)]
+        half_stars = rng.choices(range(11), RATING_WEIGHTS)[0]
+        batch.append(Review(user_id=user_id, meal_id=meal_id, rating=Decimal(half_stars) / 2, comment=rng.choice(COMMENTS)))
+        if len(batch) == batch_size:
+            Review.objects.bulk_create(batch)
+            batch = []
+            if stdout:
+                stdout.write(f'  {n + 1} reviews inserted')
+    Review.objects.bulk_create(batch)
+    Meal.rebuild_rating_totals(meal_ids)
+    histograms.rebuild(meal_ids)
+    leaderboards.rebuild_all()
+    bump_version('categories', 'meals', 'meal-search')
+    return {'categories': len(category_ids), 'meals': len(meal_ids), 'users': len(user_ids), 'reviews': reviews}
+
+
+def clear_dataset():
+    # Raw delete skips the per-row Review signals, the meals go away right after
+    reviews = Review.objects.filter(meal__slug__startswith=f'{BENCH_PREFIX}-')
+    reviews._raw_delete(reviews.db)
+    Meal.objects.filter(slug__startswith=f'{BENCH_PREFIX}-').delete()
+    Category.objects.filter(slug__startswith=f'{BENCH_PREFIX}-').delete()
+    get_user_model().objects.filter(username__startswith=f'{BENCH_PREFIX}_').delete()
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def time_call(func, repeat=20):
+    """Run `func` `repeat` times and return latency stats in milliseconds."""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return {
+        'p50': statistics.median(samples),
+        'p95': percentile(samples, 95),
+        'max': max(samples),
+    }
+
+
+# ===============================
+# 🌐 HTTP LOAD
+# ===============================
+async def _read_response(reader):
+    """Read one HTTP/1.1 response; return (status, keep_alive)."""
+    head = await reader.readuntil(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    status = int(lines[0].split()[1])
+    headers = {}
+    for line in lines[1:]:
+        if ':' in line:
+            name, value = line.split(':', 1)
+            headers[name.strip().lower()] = value.strip()
+    if 'content-length' in headers:
+        await reader.readexactly(int(headers['content-length']))
+    elif headers.get('transfer-encoding') == 'chunked':
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            await reader.readexactly(size + 2)
+            if not size:
+                break
+    else:
+        await reader.read()
+        return status, False
+    return status, headers.get('connection', '').lower() != 'close'
+
+
+async def _client(url, method, headers, body, take, samples, errors):
+    parts = urlsplit(url)
+    path = parts.path + (f'?{parts.query}' if parts.query else '')
+    if body:
+        headers = {**headers, 'Content-Type': 'application/json', 'Content-Length': len(body)}
+    request = (
+        f'{method} {path} HTTP/1.1\r\nHost: {parts.netloc}\r\n'
+        + ''.join(f'{name}: {value}\r\n' for name, value in headers.items())
+        + '\r\n'
+    ).encode('latin-1') + body
+    connection = None
+    while take():
+        try:
+            if connection is None:
+                connection = await asyncio.open_connection(parts.hostname, parts.port or 80)
+            reader, writer = connection
+            start = time.perf_counter()
+            writer.write(request)
+            await writer.drain()
+            status, keep_alive = await _read_response(reader)
+            samples.append((time.perf_counter() - start) * 1000)
+            if status >= 400:
+                errors[status] = errors.get(status, 0) + 1
+        except (OSError, asyncio.IncompleteReadError, ValueError) as exc:
+            errors[type(exc).__name__] = errors.get(type(exc).__name__, 0) + 1
+            keep_alive = False
+        if not keep_alive and connection is not None:
+            connection[1].close()
+            connection = None
+    if connection is not None:
+        connection[1].close()
+
+
+async def _load(url, method, requests, concurrency, headers, body):
+    remaining = [requests]
+
+    def take():
+        if remaining[0] <= 0:
+            return False
+        remaining[0] -= 1
+        return True
+
+    samples, errors = [], {}
+    start = time.perf_counter()
+    await asyncio.gather(*(_client(url, method, headers, body, take, samples, errors) for _ in range(concurrency)))
+    return {**latency_stats(samples, time.perf_counter() - start), 'errors': errors}
+
+
+def latency_stats(samples, elapsed):
+    """Throughput and latency percentiles (milliseconds) for one run."""
+    return {
+        'requests': len(samples),
+        'rps': len(samples) / elapsed if elapsed else 0.0,
+        'p50': statistics.median(samples) if samples else 0.0,
+        'p95': percentile(samples, 95),
+        'p99': percentile(samples, 99),
+    }
+
+
+def load_test(url, requests=1000, concurrency=50, token=None, method='GET', body=None):
+    """Send `requests` requests to `url` over `concurrency` keep-alive connections.
+
+    Returns throughput and latency stats (milliseconds); `errors` counts HTTP
+    error statuses and connection failures. Plain HTTP only, no dependencies.
+    `body` is sent as JSON.
+    """
+    headers = {'Accept': 'application/json'}
+    if token:
+        headers['Authorization'] = f'Token {token}'
+    body = json.dumps(body).encode() if body is not None else b''
+    return asyncio.run(_load(url, method, requests, concurrency, headers, body))
+
+
+# ===============================
+# 🧪 ENDPOINT SUITE
+# ===============================
+# One entry per route in API/urls.py (and /metrics). Paths and bodies are
+# formatted with `suite_fixtures()`. `staff` endpoints use an admin token.
+# /tokenrequest/ and user registration are rate-limited by design and
+# user updates/deletes would change the fixtures, so they are left out.
+Endpoint = namedtuple('Endpoint', 'name method path params body staff', defaults=(None, None, False))
+
+ENDPOINTS = [
+    Endpoint('categories', 'GET', '/api/categories/'),
+    Endpoint('category-detail', 'GET', '/api/categories/{category}/'),
+    Endpoint('category-top', 'GET', '/api/categories/{category}/top/'),
+    Endpoint('meals', 'GET', '/api/meals/'),
+    Endpoint('meals-page-5', 'GET', '/api/meals/', {'page': 5}),
+    Endpoint('meals-cursor', 'GET', '/api/meals/', {'pagination': 'cursor'}),
+    Endpoint('meals-filtered', 'GET', '/api/meals/', {'category': '{category}', 'ordering': 'rating'}),
+    Endpoint('meals-top', 'GET', '/api/meals/top/', {'window': '7d'}),
+    Endpoint('meal-histograms', 'GET', '/api/meals/histograms/', {'slugs': '{meal_slugs}'}),
+    Endpoint('meal-batch', 'GET', '/api/meals/batch/', {'slugs': '{meal_slugs}'}),
+    Endpoint('meal-batch-fields', 'GET', '/api/meals/batch/', {'slugs': '{meal_slugs}', 'fields': 'name,price,average_rating'}),
+    Endpoint('meal-search', 'GET', '/api/meals/search/', {'q': 'spicy kofta'}),
+    Endpoint('meal-detail', 'GET', '/api/meals/{meal}/'),
+    Endpoint('reviews', 'GET', '/api/meals/{meal}/reviews/'),
+    Endpoint('reviews-cursor', 'GET', '/api/meals/{meal}/reviews/', {'pagination': 'cursor'}),
+    Endpoint('review-detail', 'GET', '/api/reviews/{meal}/'),
+    Endpoint('reviews-bulk', 'POST', '/api/reviews/bulk/', None, [{'user': '{username}', 'meal_slug': '{meal}', 'rating': '4.0'}], True),
+    Endpoint('export-meals', 'GET', '/api/export/meals/', {'since': '{recent}'}, None, True),
+    Endpoint('async-categories', 'GET', '/api/async/categories/'),
+    Endpoint('async-meals', 'GET', '/api/async/meals/'),
+    Endpoint('async-meal-detail', 'GET', '/api/async/meals/{meal}/'),
+    Endpoint('async-reviews', 'GET', '/api/async/meals/{meal}/reviews/'),
+    Endpoint('users', 'GET', '/api/users/'),
+    Endpoint('metrics', 'GET', '/metrics'),
+]
+
+
+def suite_fixtures():
+    """Values and tokens for the endpoint templates, from the seeded dataset."""
+    User = get_user_model()
+    user = User.objects.filter(username=f'{BENCH_PREFIX}_user_0').first()
+    if user is None:
+        raise LookupError("No benchmark dataset; run `manage.py seed_bench` first.")
+    admin, _ = User.objects.get_or_create(
+        username=f'{BENCH_PREFIX}_admin',
+        defaults={'email': f'{BENCH_PREFIX}_admin@example.com', 'phone_number': '8' * 11, 'is_staff': True},
+    )
+    meal = Meal.objects.filter(slug__startswith=f'{BENCH_PREFIX}-').order_by('-review_count', 'pk').first()
+    slugs = Meal.objects.filter(slug__startswith=f'{BENCH_PREFIX}-').order_by('pk').values_list('slug', flat=True)[:20]
+    return {
+        'meal': meal.slug,
+        'meal_slugs': ','.join(slugs),
+        'category': meal.category.slug,
+        'username': user.username,
+        'recent': (timezone.now() - timedelta(hours=1)).isoformat(),
+        'token': Token.objects.get_or_create(user=user)[0].key,
+        'staff_token': Token.objects.get_or_create(user=admin)[0].key,
+    }
+
+
+def _fill(value, fixtures):
+    if isinstance(value, str):
+        return value.format(**fixtures)
+    if isinstance(value, dict):
+        return {key: _fill(item, fixtures) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_fill(item, fixtures) for item in value]
+    return value
+
+
+def resolve_endpoint(endpoint, fixtures):
+    """(method, path with query string, JSON body or None, token)."""
+    path = _fill(endpoint.path, fixtures)
+    if endpoint.params:
+        path += '?' + urlencode(_fill(endpoint.params, fixtures))
+    token = fixtures['staff_token' if endpoint.staff else 'token']
+    return endpoint.method, path, _fill(endpoint.body, fixtures), token
+
+
+class _QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def run_in_process(endpoints, fixtures, repeat=50, warmup=2):
+    """Drive each endpoint through the Django test client, sequentially.
+
+    Repeating one request would mostly time response-cache hits, so each
+    endpoint is reported twice: as `name`, with the response cache cleared
+    before every request, and GETs also as `name:cached`, against a warm
+    cache. No conditional headers are sent, so neither run gets a 304.
+    """
+    results = {}
+    for endpoint in endpoints:
+        method, path, body, token = resolve_endpoint(endpoint, fixtures)
+        client = Client(HTTP_AUTHORIZATION=f'Token {token}', HTTP_HOST='localhost')
+
+        def call():
+            if method == 'GET':
+                response = client.get(path)
+            else:
+                response = client.generic(method, path, json.dumps(body), content_type='application/json')
+            if response.streaming:
+                b''.join(response.streaming_content)
+            return response.status_code
+
+        for cached in ((False, True) if method == 'GET' else (False,)):
+            for _ in range(warmup):
+                call()
+            samples, errors, counter = [], {}, _QueryCounter()
+            elapsed = 0.0
+            with connection.execute_wrapper(counter):
+                for _ in range(repeat):
+                    if not cached:
+                        response_cache().clear()  # outside the timed part
+                    began = time.perf_counter()
+                    status = call()
+                    samples.append((time.perf_counter() - began) * 1000)
+                    elapsed += samples[-1] / 1000
+                    if status >= 400:
+                        errors[status] = errors.get(status, 0) + 1
+            results[f'{endpoint.name}:cached' if cached else endpoint.name] = {
+                **latency_stats(samples, elapsed),
+                'queries_per_request': counter.count / repeat,
+                'errors': errors,
+            }
+    return results
+
+
+_METRIC_LINE = re.compile(r'^(api_db_queries_total|api_requests_total)\{view="([^"]*)",method="([^"]*)"[^}]*\} (\S+)$')
+
+
+def _scrape_queries(base_url):
+    """{(view, method): [queries, requests]} from the server's /metrics."""
+    parts = urlsplit(base_url)
+    totals = {}
+    try:
+        with urlopen(f'{parts.scheme}://{parts.netloc}/metrics', timeout=10) as response:
+            body = response.read().decode()
+    except OSError:
+        return None
+    for line in body.splitlines():
+        match = _METRIC_LINE.match(line)
+        if match:
+            name, view, method, value = match.groups()
+            entry = totals.setdefault((view, method), [0.0, 0.0])
+            entry[0 if name == 'api_db_queries_total' else 1] += float(value)
+    return totals
+
+
+def run_over_http(endpoints, fixtures, base_url, requests=1000, concurrency=50):
+    """Drive each endpoint at a running server; queries come from its /metrics.
+
+    With several workers /metrics shows only the one that answered the scrape,
+    so the per-request query count is a sample, not a total.
+    """
+    results = {}
+    for endpoint in endpoints:
+        method, path, body, token = resolve_endpoint(endpoint, fixtures)
+        view = resolve(path.split('?')[0]).view_name
+        before = _scrape_queries(base_url)
+        stats = load_test(base_url.rstrip('/') + path, requests, concurrency, token, method, body)
+        after = _scrape_queries(base_url)
+        queries = None
+        if before is not None and after is not None:
+            old, new = before.get((view, method), [0, 0]), after.get((view, method), [0, 0])
+            if new[1] > old[1]:
+                queries = (new[0] - old[0]) / (new[1] - old[1])
+        results[endpoint.name] = {**stats, 'queries_per_request': queries}
+    return results
+
+
+def run_metadata(mode, target=None):
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'timestamp': timezone.now().isoformat(),
+        'commit': commit,
+        'mode': mode,
+        'target': target,
+        'database': connection.vendor,
+        'reviews': Review.objects.filter(meal__slug__startswith=f'{BENCH_PREFIX}-').count(),
+        'python': platform.python_version(),
+    }
+
+
+def compare_results(previous, current, threshold=0.1):
+    """[(endpoint, old rps, new rps, old p99, new p99, regressed)] for shared endpoints.
+
+    An endpoint regressed when its throughput fell or its p99 rose by more
+    than `threshold` (a fraction).
+    """
+    rows = []
+    for name, new in current['endpoints'].items():
+        old = previous['endpoints'].get(name)
+        if old is None:
+            continue
+        regressed = (
+            new['rps'] < old['rps'] * (1 - threshold)
+            or new['p99'] > old['p99'] * (1 + threshold)
+        )
+        rows.append((name, old['rps'], new['rps'], old['p99'], new['p99'], regressed))
+    return rows
+
+
+def serialization_pages(page_size=100):
+    """{name: (queryset, serializer class, row spec)} for the fast-path list pages."""
+    meal = Meal.objects.order_by('-review_count').first()
+    return {
+        'meals': (
+            Meal.objects.select_related('category').order_by('-created_at', '-id')[:page_size],
+            MealSerializer, MEAL_ROWS,
+        ),
+        'reviews': (
+            Review.objects.filter(meal=meal).select_related('user', 'meal').order_by('-created_at', '-id')[:page_size],
+            ReviewSerializer, REVIEW_ROWS,
+        ),
+    }
+
+
+def serialization_cpu(page_size=100, repeat=50, warmup=3):
+    """CPU time per list page: serializer + JSONRenderer against rows + FastJSONRenderer.
+
+    Each page runs its query, formats `page_size` objects and renders them,
+    timed with `time.process_time`. Returns {name: {'serializer_ms',
+    'fast_ms', 'speedup', 'identical'}}; `identical` compares the bytes.
+    """
+    request = RequestFactory().get('/')  # serializers build absolute URLs from it
+    results = {}
+    for name, (queryset, serializer_class, spec) in serialization_pages(page_size).items():
+        def serializer_page():
+            data = serializer_class(queryset.all(), many=True, context={'request': request}).data
+            return JSONRenderer().render(data)
+
+        def fast_page():
+            data = [
+                absolute_media(spec.to_row(values), request.build_absolute_uri)
+                for values in queryset.values(*spec.value_names)
+            ]
+            return FastJSONRenderer().render(data)
+
+        timings = {}
+        for label, page in (('serializer_ms', serializer_page), ('fast_ms', fast_page)):
+            for _ in range(warmup):
+                page()
+            start = time.process_time()
+            for _ in range(repeat):
+                page()
+            timings[label] = (time.process_time() - start) * 1000 / repeat
+        results[name] = {
+            **timings,
+            'speedup': timings['serializer_ms'] / timings['fast_ms'] if timings['fast_ms'] else None,
+            'identical': serializer_page() == fast_page(),
+        }
+    return results
@@ -0,0 +1,92 @@
+import time
+
+from django.core.cache import cache
+from django.db import router
+from django.db.models import Count
+
+from .models import Category
+
+CATEGORY_INDEX_TIMEOUT = 60 * 60
+
+
+# ===============================
+# 🔑 VERSIONED KEYS
+# ===============================
+def _version_key(namespace):
+    return f'api:version:{namespace}'
+
+
+def _changed_key(namespace):
+    return f'api:changed:{namespace}'
+
+
+def get_version(namespace):
+    """Return the current version of a namespace, creating it on first use."""
+    version = cache.get(_version_key(namespace))
+    if version is None:
+        # Seed from the clock so a flushed cache never reuses an old version
+        cache.add(_version_key(namespace), time.time_ns(), None)
+        version = cache.get(_version_key(namespace))
+    return version
+
+
+def get_last_modified(namespace):
+    """Return the unix time (whole seconds) of the namespace's last change."""
+    changed = cache.get(_changed_key(namespace))
+    if changed is None:
+        cache.add(_changed_key(namespace), int(time.time()), None)
+        changed = cache.get(_changed_key(namespace))
+    return changed
+
+
+def bump_version(*namespaces):
+    """Invalidate every key built for the given namespaces."""
+    now = int(time.time())
+    for namespace in namespaces:
+        try:
+            cache.incr(_version_key(namespace))
+        except ValueError:
+            cache.set(_version_key(namespace), time.time_ns(), None)
+        cache.set(_changed_key(namespace), now, None)
+
+
+def meal_namespace(slug):
+    return f'meal:{slug}'
+
+
+def versioned_key(namespace, *parts):
+    return ':'.join(['api', namespace, str(get_version(namespace)), *map(str, parts)])
+
+
+# ===============================
+# 🌟 CATEGORY INDEX
+# ===============================
+def category_index():
+    """Return {slug: row} for every category, ordered by name, from the cache."""
+    key = versioned_key('categories', 'index')
+    index = cache.get(key)
+    if index is None:
+        categories = Category.objects.annotate(total_meals=Count('meals')).order_by('name')
+        index = {
+            category.slug: {
+                'id': category.pk,
+                'name': category.name,
+                'slug': category.slug,
+                'total_meals': category.total_meals,
+            }
+            for category in categories
+        }
+        cache.set(key, index, CATEGORY_INDEX_TIMEOUT)
+    return index
+
+
+def category_from_index(slug):
+    """Build a Category instance for `slug` from the cached index, or None."""
+    row = category_index().get(slug)
+    if row is None:
+        return None
+    category = Category.from_db(
+        router.db_for_read(Category), ['id', 'name', 'slug'], [row['id'], row['name'], row['slug']]
+    )
+    category.total_meals = row['total_meals']
+    return category
@@ -0,0 +1,43 @@
+import hashlib
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from .cache import get_version, get_last_modified
+
+
+class ConditionalGetMixin:
+    """Answer GET with 304 when the cache namespaces behind a view are unchanged.
+
+    Views list the namespaces their payload depends on in `get_cache_namespaces`;
+    the signals in `API/signals.py` bump those namespaces on every write, so the
+    ETag and Last-Modified are computed without touching the database.
+    """
+    cache_namespaces = ()
+
+    def get_cache_namespaces(self):
+        return list(self.cache_namespaces)
+
+    def get_validators(self, request):
+        namespaces = self.get_cache_namespaces()
+        params = sorted(request.query_params.lists())
+        fingerprint = repr((
+            request.path,
+            params,
+            request.accepted_renderer.media_type,
+            [(namespace, get_version(namespace)) for namespace in namespaces],
+        ))
+        etag = quote_etag(hashlib.sha1(fingerprint.encode()).hexdigest())
+        last_modified = max(get_last_modified(namespace) for namespace in namespaces)
+        return etag, last_modified
+
+    def get(self, request, *args, **kwargs):
+        etag, last_modified = self.get_validators(request)
+        not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if not_modified is not None:
+            return not_modified
+        response = super().get(request, *args, **kwargs)
+        if response.status_code == 200:
+            response['ETag'] = etag
+            response['Last-Modified'] = http_date(last_modified)
+        return response
@@ -0,0 +1,90 @@
+"""Send reads of safe requests to weighted read replicas.
+
+`REPLICA_WEIGHTS` maps replica aliases to integer weights. Reads go to a
+replica only while `ReplicaRoutingMiddleware` has marked the current request
+as replica-safe: a GET/HEAD/OPTIONS from a client that has not written within
+`REPLICA_STICKY_SECONDS`, so clients read their own writes from the primary.
+Everything else (writes, management commands, signals) uses `default`.
+
+A replica that fails to connect is skipped for `REPLICA_RETRY_SECONDS`; when
+none is usable, reads fall back to the primary. The response cache fills
+entries whose namespaces changed within the sticky window from the primary,
+so no client caches a lagging replica's rows under a new version; keep the
+window above the usual replication lag.
+"""
+import threading
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import SynchronousOnlyOperation
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+_replica_reads = ContextVar('replica_reads', default=False)
+
+
+def allow_replica_reads(allowed=True):
+    """Enable replica reads for the current context; returns a reset token."""
+    return _replica_reads.set(allowed)
+
+
+def reset_replica_reads(token):
+    _replica_reads.reset(token)
+
+
+class ReplicaRouter:
+    def __init__(self):
+        self.weights = {alias: weight for alias, weight in getattr(settings, 'REPLICA_WEIGHTS', {}).items() if weight > 0}
+        self.retry_seconds = getattr(settings, 'REPLICA_RETRY_SECONDS', 30)
+        self._current = dict.fromkeys(self.weights, 0)
+        self._down_until = {}
+        self._lock = threading.Lock()
+
+    def _next_replicas(self):
+        """Smooth weighted round-robin: the pick first, the others as fallbacks."""
+        with self._lock:
+            now = time.monotonic()
+            healthy = [alias for alias in self.weights if self._down_until.get(alias, 0) <= now]
+            if not healthy:
+                return []
+            total = sum(self.weights[alias] for alias in healthy)
+            for alias in healthy:
+                self._current[alias] += self.weights[alias]
+            ranked = sorted(healthy, key=lambda alias: -self._current[alias])
+            self._current[ranked[0]] -= total
+            return ranked
+
+    def _usable(self, alias):
+        try:
+            connections[alias].ensure_connection()
+        except SynchronousOnlyOperation:
+            return True  # called on the event loop; the query itself runs in a thread
+        except DatabaseError:
+            with self._lock:
+                self._down_until[alias] = time.monotonic() + self.retry_seconds
+            return False
+        return True
+
+    def db_for_read(self, model, **hints):
+        if not self.weights:
+            return None
+        if not _replica_reads.get():
+            return DEFAULT_DB_ALIAS
+        for alias in self._next_replicas():
+            if self._usable(alias):
+                return alias
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        # Explicit, or Django would write an instance back to the replica it was read from
+        return DEFAULT_DB_ALIAS if self.weights else None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        databases = {DEFAULT_DB_ALIAS, *self.weights}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return False if db in self.weights else None
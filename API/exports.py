@@ -0,0 +1,154 @@
+"""Streaming exports that reuse the serializer field sets without serializers."""
+import csv
+from decimal import Decimal
+
+from django.core.files.storage import default_storage
+from rest_framework.utils.encoders import JSONEncoder
+
+from .images import rendition_urls
+from .models import Meal, Review
+from .serializers import MealSerializer, ReviewSerializer
+
+EXPORT_FORMATS = ('ndjson', 'csv')
+CHUNK_SIZE = 2000
+
+
+def format_datetime(value):
+    """Same ISO 8601 form DRF's DateTimeField emits for UTC values."""
+    if value is None:
+        return None
+    value = value.isoformat()
+    if value.endswith('+00:00'):
+        value = value[:-6] + 'Z'
+    return value
+
+
+def format_decimal(places):
+    quantum = Decimal(1).scaleb(-places)
+
+    def formatter(value):
+        return None if value is None else format(Decimal(value).quantize(quantum), 'f')
+    return formatter
+
+
+def format_image(name):
+    return default_storage.url(name) if name else None
+
+
+def average_rating(rating_sum, review_count):
+    """Mirrors Meal.average_rating() on raw column values."""
+    return rating_sum / review_count if review_count else 0
+
+
+def absolute_media(row, build_url):
+    """Make a row's image URLs absolute, as serializers do when given the request."""
+    if row.get('image'):
+        row['image'] = build_url(row['image'])
+    for variants in (row.get('image_renditions') or {}).values():
+        for key, value in variants.items():
+            if key != 'width':
+                variants[key] = build_url(value)
+    return row
+
+
+class RowSpec:
+    """Maps every field of a serializer to a `.values()` column and a formatter.
+
+    `columns` is {field: (column, formatter)}; when column is a tuple of names
+    the formatter is called with all of them. Construction fails if the
+    serializer grows a field the spec does not cover, so exports cannot
+    silently drift.
+    """
+
+    def __init__(self, model, serializer_class, columns):
+        self.model = model
+        self.fields = list(serializer_class.Meta.fields)
+        missing = set(self.fields) - set(columns)
+        if missing:
+            raise ValueError(f"{serializer_class.__name__} fields without export column: {sorted(missing)}")
+        self.columns = columns
+        self.value_names = self.value_names_for(columns)
+
+    def value_names_for(self, fields):
+        """Columns behind a subset of the fields; fields without a column need none."""
+        columns = [self.columns[field][0] for field in fields if field in self.columns]
+        return sorted({name for column in columns for name in (column if isinstance(column, tuple) else [column])})
+
+    def only(self, queryset, fields, keep=()):
+        """Load just the columns (and relations) behind `fields`, plus `keep`."""
+        names = [*self.value_names_for(fields), *keep]
+        relations = {name.rsplit('__', 1)[0] for name in names if '__' in name}
+        return queryset.select_related(None).select_related(*relations).only(*names)
+
+    def to_row(self, values, fields=None):
+        row = {}
+        for field in self.fields if fields is None else fields:
+            column, formatter = self.columns[field]
+            if isinstance(column, tuple):
+                row[field] = formatter(*(values[name] for name in column))
+            else:
+                row[field] = formatter(values[column]) if formatter else values[column]
+        return row
+
+    def iter_rows(self, queryset, chunk_size=CHUNK_SIZE):
+        for values in queryset.values(*self.value_names).iterator(chunk_size=chunk_size):
+            yield self.to_row(values)
+
+
+MEAL_ROWS = RowSpec(Meal, MealSerializer, {
+    'slug': ('slug', None),
+    'name': ('name', None),
+    'description': ('description', None),
+    'price': ('price', format_decimal(2)),
+    'image': ('image', format_image),
+    'image_renditions': ('image_renditions', rendition_urls),
+    'category_slug': ('category__slug', None),
+    'no_of_reviews': ('review_count', None),
+    'average_rating': (('rating_sum', 'review_count'), average_rating),
+    'category': ('category__name', None),
+    'created_at': ('created_at', format_datetime),
+})
+
+REVIEW_ROWS = RowSpec(Review, ReviewSerializer, {
+    'id': ('id', None),
+    'user': ('user__username', None),
+    'meal_slug': ('meal__slug', None),
+    'rating': ('rating', format_decimal(1)),
+    'comment': ('comment', None),
+    'created_at': ('created_at', format_datetime),
+})
+
+EXPORTS = {
+    'meals': MEAL_ROWS,
+    'reviews': REVIEW_ROWS,
+}
+
+
+def export_queryset(spec, since=None):
+    queryset = spec.model.objects.order_by('created_at', 'id')
+    if since is not None:
+        queryset = queryset.filter(created_at__gte=since)
+    return queryset
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def stream_export(spec, queryset, export_format='ndjson', chunk_size=CHUNK_SIZE):
+    """Yield the export line by line; memory use does not grow with the table."""
+    rows = spec.iter_rows(queryset, chunk_size=chunk_size)
+    encoder = JSONEncoder(ensure_ascii=False)
+    if export_format == 'csv':
+        writer = csv.writer(_Echo())
+        yield writer.writerow(spec.fields)
+        for row in rows:
+            # Nested values (image_renditions) go in as JSON, not as their Python repr
+            yield writer.writerow([
+                encoder.encode(row[field]) if isinstance(row[field], (dict, list)) else row[field]
+                for field in spec.fields
+            ])
+    else:
+        for row in rows:
+            yield encoder.encode(row) + '\n'
@@ -0,0 +1,72 @@
+"""Serializer-free list responses for the busiest read endpoints.
+
+`RowListMixin` pages over `.values()` rows and formats them with a row spec
+from `API.exports`, so a list page builds no model instances and no
+serializer fields. `FastJSONRenderer` encodes the payload with orjson when it
+is installed. Both produce the same bytes as the serializer and DRF's
+JSONRenderer; `bench_serialization` compares the CPU time per page.
+"""
+from rest_framework.renderers import BrowsableAPIRenderer, JSONRenderer
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+from . import metrics
+from .exports import absolute_media
+from .serializers import sparse_fieldset
+
+try:
+    import orjson
+except ImportError:  # optional; DRF's json.dumps path is used instead
+    orjson = None
+
+_encoder = JSONEncoder()
+
+
+class FastJSONRenderer(JSONRenderer):
+    """JSONRenderer that encodes compact output with orjson when available.
+
+    Datetimes, decimals and anything else orjson does not know go through
+    DRF's encoder, and U+2028/U+2029 are escaped as DRF does. Indented
+    output, and payloads orjson rejects (non-string keys, huge integers),
+    fall back to DRF. orjson writes floats below 1e-4 or from 1e16 up
+    without json's exponent padding (`1e16`, not `1e+16`), so only use it
+    where floats stay in between.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (orjson is None or data is None or self.ensure_ascii or not self.compact
+                or self.get_indent(accepted_media_type, renderer_context or {}) is not None):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, default=_encoder.default, option=orjson.OPT_PASSTHROUGH_DATETIME)
+        except TypeError:  # orjson.JSONEncodeError is a TypeError
+            return super().render(data, accepted_media_type, renderer_context)
+        return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+
+
+class RowListMixin:
+    """List GET responses from `.values()` rows shaped by `row_spec`.
+
+    Only the columns behind the request's sparse fieldset are selected, plus
+    those of the view's `keyset_ordering`, so cursor pagination can read its
+    position from the rows.
+    """
+    row_spec = None
+    renderer_classes = (FastJSONRenderer, BrowsableAPIRenderer)
+
+    def list(self, request, *args, **kwargs):
+        spec = self.row_spec
+        fields = sparse_fieldset(self.get_serializer_class(), request)
+        columns = spec.value_names if fields is None else spec.value_names_for(fields)
+        queryset = self.filter_queryset(self.get_queryset())  # may set keyset_ordering
+        ordering = {field.lstrip('-') for field in getattr(self, 'keyset_ordering', ())}
+        rows = queryset.values(*sorted({*columns, *ordering}))
+        page = self.paginate_queryset(rows)
+        with metrics.serializing():
+            results = [
+                absolute_media(spec.to_row(values, fields), request.build_absolute_uri)
+                for values in (rows if page is None else page)
+            ]
+        if page is None:
+            return Response(results)
+        return self.get_paginated_response(results)
@@ -0,0 +1,94 @@
+"""Query-parameter filtering and ordering for the meal list.
+
+Every accepted combination is served by one of the `Meal.Meta.indexes`: an
+optional category equality filter, at most one range filter, and an ordering
+on the same column as that range. Anything else is rejected up front instead
+of falling back to a full scan and sort.
+"""
+import math
+from decimal import Decimal, InvalidOperation
+
+from rest_framework.exceptions import ValidationError
+
+from .cache import category_index
+
+# ordering name -> (indexed column, order_by fields)
+ORDERINGS = {
+    'newest': ('created_at', ('-created_at', '-id')),
+    'rating': ('rating_avg', ('-rating_avg', '-id')),
+    'price': ('price', ('price', 'id')),
+    '-price': ('price', ('-price', '-id')),
+    'most_reviewed': ('review_count', ('-review_count', '-id')),
+}
+DEFAULT_ORDERING = 'newest'
+
+
+def finite(parse):
+    """`parse`, rejecting NaN and infinities with a ValueError."""
+    def parse_finite(value):
+        number = parse(value)
+        if not math.isfinite(number):  # signaling NaNs raise ValueError here too
+            raise ValueError(value)
+        return number
+    return parse_finite
+
+
+# query parameter -> (indexed column, lookup, parser)
+RANGE_FILTERS = {
+    'min_price': ('price', 'gte', finite(Decimal)),
+    'max_price': ('price', 'lte', finite(Decimal)),
+    'min_rating': ('rating_avg', 'gte', finite(float)),
+    'min_reviews': ('review_count', 'gte', int),
+}
+# the ordering used when a range filter is given without one
+RANGE_DEFAULT_ORDERING = {
+    'price': 'price',
+    'rating_avg': 'rating',
+    'review_count': 'most_reviewed',
+}
+
+QUERY_PARAMS = ('category', 'ordering', *RANGE_FILTERS)
+
+
+class MealQuery:
+    """Parsed and validated meal list parameters."""
+
+    def __init__(self, params):
+        errors = {}
+        self.category_id = None
+        slug = params.get('category')
+        if slug:
+            row = category_index().get(slug)
+            if row is None:
+                errors['category'] = [f"Unknown category '{slug}'."]
+            else:
+                self.category_id = row['id']
+
+        self.ranges = {}
+        for param, (column, lookup, parse) in RANGE_FILTERS.items():
+            if param in params:
+                try:
+                    self.ranges[f'{column}__{lookup}'] = parse(params[param])
+                except (ValueError, InvalidOperation):
+                    errors[param] = ['A number is required.']
+        range_columns = {key.split('__')[0] for key in self.ranges}
+
+        ordering = params.get('ordering')
+        if ordering is None:
+            ordering = RANGE_DEFAULT_ORDERING[next(iter(range_columns))] if len(range_columns) == 1 else DEFAULT_ORDERING
+        if ordering not in ORDERINGS:
+            errors['ordering'] = [f"Choose one of: {', '.join(ORDERINGS)}."]
+        elif len(range_columns) > 1:
+            errors['non_field_errors'] = ['Only one of price, rating or review-count ranges can be combined.']
+        elif range_columns and range_columns != {ORDERINGS[ordering][0]}:
+            errors['non_field_errors'] = [
+                f"A {next(iter(range_columns))} range can only be combined with an ordering on the same column."
+            ]
+        if errors:
+            raise ValidationError(errors)
+        self.ordering = ORDERINGS[ordering][1]
+
+    def apply(self, queryset):
+        if self.category_id is not None:
+            queryset = queryset.filter(category_id=self.category_id)
+        return queryset.filter(**self.ranges).order_by(*self.ordering)
@@ -0,0 +1,81 @@
+"""Per-meal rating histograms: 11 half-star buckets, 0★ to 5★."""
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.db import transaction
+from django.db.models import Count
+
+from .cache import bump_version, meal_namespace
+from .models import Meal, Review, RatingHistogramBin, increment_counters
+
+BUCKETS = 11
+PERCENTILES = (25, 50, 75, 90)
+
+
+def bucket_of(rating):
+    """Round a rating to the nearest half star and return its bucket index."""
+    return int((Decimal(rating) * 2).to_integral_value(rounding=ROUND_HALF_UP))
+
+
+def stars(bucket):
+    return bucket / 2
+
+
+def apply_delta(meal_id, rating, delta):
+    increment_counters(RatingHistogramBin, {'meal_id': meal_id, 'bucket': bucket_of(rating)}, count=delta)
+
+
+def histograms_for(meal_ids):
+    """{meal_id: [count per bucket]} for every requested meal, in one query."""
+    histograms = {meal_id: [0] * BUCKETS for meal_id in meal_ids}
+    rows = RatingHistogramBin.objects.filter(meal_id__in=meal_ids).values_list('meal_id', 'bucket', 'count')
+    for meal_id, bucket, count in rows:
+        histograms[meal_id][bucket] = count
+    return histograms
+
+
+def percentile(histogram, pct):
+    """The rating (in stars) at or below which `pct` percent of reviews fall."""
+    total = sum(histogram)
+    if not total:
+        return None
+    threshold = total * pct / 100
+    running = 0
+    for bucket, count in enumerate(histogram):
+        running += count
+        if running >= threshold and count:
+            return stars(bucket)
+    return stars(BUCKETS - 1)
+
+
+def summarize(histogram):
+    return {
+        'histogram': histogram,
+        'count': sum(histogram),
+        'median': percentile(histogram, 50),
+        'percentiles': {f'p{pct}': percentile(histogram, pct) for pct in PERCENTILES},
+    }
+
+
+def rebuild(meal_ids=None):
+    """Recompute histograms with one GROUP BY over (meal, rating).
+
+    Bumps the namespace of every rebuilt meal, whose detail shows the histogram.
+    """
+    reviews = Review.objects.all()
+    bins = RatingHistogramBin.objects.all()
+    if meal_ids is not None:
+        reviews = reviews.filter(meal_id__in=meal_ids)
+        bins = bins.filter(meal_id__in=meal_ids)
+    counts = {}
+    for meal_id, rating, count in reviews.values_list('meal_id', 'rating').annotate(n=Count('id')).iterator():
+        key = (meal_id, bucket_of(rating))
+        counts[key] = counts.get(key, 0) + count
+    with transaction.atomic():
+        bins.delete()
+        RatingHistogramBin.objects.bulk_create(
+            [RatingHistogramBin(meal_id=meal_id, bucket=bucket, count=count) for (meal_id, bucket), count in counts.items()],
+            batch_size=5000,
+        )
+    meals = Meal.objects.all() if meal_ids is None else Meal.objects.filter(pk__in=meal_ids)
+    bump_version(*(meal_namespace(slug) for slug in meals.values_list('slug', flat=True)))
+    return len(counts)
@@ -0,0 +1,100 @@
+"""Meal image renditions: downscaled, EXIF-free JPEG and WebP variants."""
+import os
+from functools import partial
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image, ImageOps
+
+from . import jobs
+from .cache import bump_version, meal_namespace
+from .models import Meal
+
+# name -> maximum width in pixels; images are only ever scaled down
+RENDITIONS = {
+    'thumbnail': 160,
+    'card': 480,
+    'full': 1600,
+}
+FORMATS = {
+    'jpeg': ('JPEG', 'jpg', {'quality': 82, 'optimize': True, 'progressive': True}),
+    'webp': ('WEBP', 'webp', {'quality': 80, 'method': 4}),
+}
+
+def rendition_dir(image_name):
+    folder, filename = os.path.split(image_name)
+    return os.path.join(folder, 'renditions', os.path.splitext(filename)[0])
+
+
+def render_image(source):
+    """Return {rendition: {'width': w, 'jpeg': bytes, 'webp': bytes}} for an image file."""
+    with Image.open(source) as original:
+        # Bake the EXIF orientation into the pixels; the metadata is not written back
+        image = ImageOps.exif_transpose(original).convert('RGB')
+    output = {}
+    for name, max_width in RENDITIONS.items():
+        variant = image.copy()
+        variant.thumbnail((max_width, max_width * 4), Image.LANCZOS)
+        output[name] = {'width': variant.width}
+        for key, (pil_format, _, options) in FORMATS.items():
+            buffer = BytesIO()
+            variant.save(buffer, pil_format, **options)
+            output[name][key] = buffer.getvalue()
+    return output
+
+
+def delete_renditions(renditions):
+    for variants in (renditions or {}).values():
+        for key in FORMATS:
+            if variants.get(key):
+                default_storage.delete(variants[key])
+
+
+@jobs.task('meal-renditions', max_attempts=3)
+def build_renditions(meal_id):
+    """Render and store every rendition of a meal's image, then record them.
+
+    The previous files are deleted once the new set is committed.
+    """
+    meal = Meal.objects.filter(pk=meal_id).only('slug', 'image', 'image_renditions').first()
+    if meal is None:
+        return None
+    renditions = {}
+    try:
+        if meal.image:
+            with default_storage.open(meal.image.name, 'rb') as source:
+                rendered = render_image(source)
+            folder = rendition_dir(meal.image.name)
+            for name, variants in rendered.items():
+                renditions[name] = {'width': variants['width']}
+                for key, (_, extension, _) in FORMATS.items():
+                    # save() picks a free name, so the files in use are never overwritten
+                    path = os.path.join(folder, f'{name}.{extension}')
+                    renditions[name][key] = default_storage.save(path, ContentFile(variants[key]))
+    except Exception:
+        delete_renditions(renditions)  # the previous renditions stay in use
+        raise
+    # update() keeps the save signals from scheduling another render
+    Meal.objects.filter(pk=meal_id).update(image_renditions=renditions)
+    bump_version('meals', meal_namespace(meal.slug))
+    transaction.on_commit(partial(delete_renditions, meal.image_renditions))
+    return renditions
+
+
+def schedule_renditions(meal_id, image_name):
+    """Queue the render; the key makes repeated saves of one upload render it once."""
+    jobs.enqueue('meal-renditions', meal_id, key=f'meal-renditions:{meal_id}:{image_name or ""}')
+
+
+def rendition_urls(renditions, build_url=None):
+    """srcset-style map {rendition: {'width': w, 'jpeg': url, 'webp': url}}."""
+    build_url = build_url or (lambda url: url)
+    return {
+        name: {
+            'width': variants['width'],
+            **{key: build_url(default_storage.url(variants[key])) for key in FORMATS if variants.get(key)},
+        }
+        for name, variants in (renditions or {}).items()
+    }
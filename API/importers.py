@@ -0,0 +1,122 @@
+"""Batched review import shared by the bulk endpoint and `import_reviews`."""
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from rest_framework import serializers
+
+from .cache import bump_version, meal_namespace
+from .models import Meal, Review
+from .signals import apply_review_changes
+
+SKIP = 'skip'
+UPSERT = 'upsert'
+CONFLICT_MODES = (SKIP, UPSERT)
+
+
+class ReviewImportSerializer(serializers.Serializer):
+    """Validates one import row without resolving relations."""
+    user = serializers.CharField(max_length=150)
+    meal_slug = serializers.SlugField()
+    rating = serializers.DecimalField(max_digits=3, decimal_places=1, min_value=0, max_value=5)
+    comment = serializers.CharField(allow_blank=True, required=False, default='')
+
+
+def batched(rows, size):
+    rows = iter(rows)
+    while batch := list(islice(rows, size)):
+        yield batch
+
+
+def import_reviews(rows, on_conflict=SKIP, batch_size=1000):
+    """Import review dicts in batches and return counts plus per-row errors.
+
+    Each batch costs one query for users, one for meals, one for existing
+    reviews, the bulk insert and one rating-totals update per meal it
+    touched; the histograms and leaderboards follow in one queued job.
+    """
+    if on_conflict not in CONFLICT_MODES:
+        raise ValueError(f"on_conflict must be one of {CONFLICT_MODES}")
+    result = {'created': 0, 'updated': 0, 'skipped': 0, 'errors': []}
+    offset = 0
+    for batch in batched(rows, batch_size):
+        _import_batch(batch, offset, on_conflict, result)
+        offset += len(batch)
+    return result
+
+
+def _import_batch(batch, offset, on_conflict, result):
+    valid = []
+    for index, row in enumerate(batch, start=offset):
+        serializer = ReviewImportSerializer(data=row)
+        if serializer.is_valid():
+            valid.append((index, serializer.validated_data))
+        else:
+            result['errors'].append({'row': index, 'errors': serializer.errors})
+
+    users = dict(
+        get_user_model().objects.filter(username__in={data['user'] for _, data in valid})
+        .values_list('username', 'pk')
+    )
+    meals = dict(
+        Meal.objects.filter(slug__in={data['meal_slug'] for _, data in valid}).values_list('slug', 'pk')
+    )
+
+    reviews = {}
+    for index, data in valid:
+        errors = {}
+        if data['user'] not in users:
+            errors['user'] = [f"User '{data['user']}' does not exist."]
+        if data['meal_slug'] not in meals:
+            errors['meal_slug'] = [f"Meal '{data['meal_slug']}' does not exist."]
+        if errors:
+            result['errors'].append({'row': index, 'errors': errors})
+            continue
+        key = (users[data['user']], meals[data['meal_slug']])
+        if key in reviews and on_conflict == SKIP:
+            result['skipped'] += 1
+            continue
+        reviews[key] = Review(
+            user_id=key[0], meal_id=key[1], rating=data['rating'], comment=data['comment'],
+        )
+    if not reviews:
+        return
+
+    meal_ids = {meal_id for _, meal_id in reviews}
+    with transaction.atomic():
+        found = Review.objects.filter(user_id__in={user_id for user_id, _ in reviews}, meal_id__in=meal_ids)
+        if on_conflict == UPSERT:
+            found = found.select_for_update()  # the changes below start from the ratings being replaced
+        existing = {
+            (user_id, meal_id): (rating, created_at)
+            for user_id, meal_id, rating, created_at in found.values_list('user_id', 'meal_id', 'rating', 'created_at')
+            if (user_id, meal_id) in reviews
+        }
+
+        if on_conflict == SKIP:
+            new = [review for key, review in reviews.items() if key not in existing]
+            Review.objects.bulk_create(new, ignore_conflicts=True)
+            result['created'] += len(new)
+            result['skipped'] += len(existing)
+            changes = [(review.meal_id, review.rating, 1, review.created_at) for review in new]
+        else:
+            Review.objects.bulk_create(
+                list(reviews.values()),
+                update_conflicts=True,
+                unique_fields=['user', 'meal'],
+                update_fields=['rating', 'comment'],
+            )
+            result['created'] += len(reviews) - len(existing)
+            result['updated'] += len(existing)
+            changes = []
+            for key, review in reviews.items():
+                if key not in existing:
+                    changes.append((review.meal_id, review.rating, 1, review.created_at))
+                elif existing[key][0] != review.rating:
+                    rating, created_at = existing[key]  # an edit keeps the review's creation time
+                    changes += [(review.meal_id, rating, -1, created_at), (review.meal_id, review.rating, 1, created_at)]
+        # bulk_create skips the Review signals, so apply this batch's changes as they would
+        apply_review_changes(changes)
+
+    slugs = Meal.objects.filter(pk__in=meal_ids).values_list('slug', flat=True)
+    bump_version('meals', *(meal_namespace(slug) for slug in slugs))
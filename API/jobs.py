@@ -0,0 +1,169 @@
+"""Database-backed queue for the side effects of writes.
+
+Signal handlers call `enqueue('task-name', *args)` instead of doing the work
+in the request. The job row is inserted in the writer's transaction, so it
+exists exactly when the write committed. `manage.py run_workers` claims
+pending jobs and runs each in a transaction together with marking it done,
+so a job's database effects happen once even when it is retried.
+
+- Tasks are registered with `@task('name')` and take JSON-serializable
+  arguments.
+- A failed job is retried with exponential backoff
+  (`API_JOBS_RETRY_DELAY` * 2 ** attempts) until `max_attempts`, then
+  marked failed with its traceback.
+- An idempotency `key` makes repeated enqueues of the same work a no-op
+  while the first job exists, unless it failed: enqueueing a failed key
+  queues it again with a fresh set of attempts.
+- Jobs left running by a dead worker are claimed again after
+  `API_JOBS_LEASE_SECONDS`. A worker whose lease was taken over rolls its
+  run back instead of marking the job done.
+- Workers purge jobs finished more than `API_JOBS_KEEP_DAYS` ago every
+  `API_JOBS_PURGE_INTERVAL` seconds.
+- With `API_JOBS_SYNC` (set by the test runner), `enqueue` runs the task
+  inline instead.
+"""
+import logging
+import os
+import socket
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+TASKS = {}
+
+
+def task(name, max_attempts=5):
+    """Register a function as the task `name`."""
+    def register(func):
+        func.task_name = name
+        func.max_attempts = max_attempts
+        TASKS[name] = func
+        return func
+    return register
+
+
+def enqueue(name, *args, key=None, delay=0):
+    """Queue `TASKS[name](*args)`; returns the Job, or None when run inline."""
+    func = TASKS[name]
+    if getattr(settings, 'API_JOBS_SYNC', False):
+        func(*args)
+        return None
+    fields = {
+        'task': name,
+        'args': list(args),
+        'max_attempts': func.max_attempts,
+        'run_after': timezone.now() + timedelta(seconds=delay),
+    }
+    if key is None:
+        return Job.objects.create(**fields)
+    job, created = Job.objects.get_or_create(key=key, defaults=fields)
+    # A failed job would hold its key forever; the new enqueue retries it
+    if not created and job.status == Job.FAILED:
+        Job.objects.filter(pk=job.pk, status=Job.FAILED).update(
+            status=Job.PENDING, attempts=0, locked_by='', locked_at=None, last_error='', finished_at=None, **fields,
+        )
+        job.refresh_from_db()
+    return job
+
+
+def worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def claim(worker):
+    """Mark the next due job as running for `worker` and return it, or None."""
+    now = timezone.now()
+    lease = now - timedelta(seconds=getattr(settings, 'API_JOBS_LEASE_SECONDS', 300))
+    due = (
+        Job.objects.filter(Q(status=Job.PENDING, run_after__lte=now) | Q(status=Job.RUNNING, locked_at__lt=lease))
+        .order_by('run_after', 'id')
+    )
+    for job in due[:10]:
+        # Conditional update: of several workers racing for a job, one wins
+        claimed = Job.objects.filter(pk=job.pk, status=job.status, locked_at=job.locked_at).update(
+            status=Job.RUNNING, locked_by=worker, locked_at=now, attempts=job.attempts + 1,
+        )
+        if claimed:
+            job.status, job.locked_by, job.locked_at, job.attempts = Job.RUNNING, worker, now, job.attempts + 1
+            return job
+    return None
+
+
+class LeaseLost(Exception):
+    """The job was claimed again by another worker while it ran."""
+
+
+def _held(job):
+    """The job's row, as long as this claim still holds it."""
+    return Job.objects.filter(pk=job.pk, status=Job.RUNNING, locked_by=job.locked_by, locked_at=job.locked_at)
+
+
+def run(job):
+    """Run a claimed job; True when it succeeded."""
+    try:
+        with transaction.atomic():
+            TASKS[job.task](*job.args)
+            if not _held(job).update(status=Job.DONE, finished_at=timezone.now(), last_error=''):
+                raise LeaseLost  # the other worker's run counts, undo this one
+        return True
+    except LeaseLost:
+        logger.warning("Job %s was claimed again while running, rolled back", job)
+        return False
+    except Exception:
+        error = traceback.format_exc()
+    if job.attempts >= job.max_attempts:
+        logger.error("Job %s failed after %d attempts:\n%s", job, job.attempts, error)
+        _held(job).update(status=Job.FAILED, finished_at=timezone.now(), last_error=error)
+    else:
+        backoff = getattr(settings, 'API_JOBS_RETRY_DELAY', 5) * 2 ** (job.attempts - 1)
+        logger.warning("Job %s failed, retrying in %ss:\n%s", job, backoff, error)
+        _held(job).update(status=Job.PENDING, run_after=timezone.now() + timedelta(seconds=backoff), last_error=error)
+    return False
+
+
+def work(worker=None, burst=False, poll_interval=1.0, should_stop=lambda: False):
+    """Claim and run jobs until `should_stop()`, or until none is due with `burst`.
+
+    Old finished jobs are purged on start and then every
+    `API_JOBS_PURGE_INTERVAL` seconds. Returns the number of jobs run.
+    """
+    worker = worker or worker_name()
+    processed = 0
+    next_purge = 0.0
+    while not should_stop():
+        close_old_connections()
+        if time.monotonic() >= next_purge:
+            deleted = purge(getattr(settings, 'API_JOBS_KEEP_DAYS', 7))
+            if deleted:
+                logger.info("Purged %d finished jobs", deleted)
+            next_purge = time.monotonic() + getattr(settings, 'API_JOBS_PURGE_INTERVAL', 3600)
+        job = claim(worker)
+        if job is None:
+            if burst:
+                break
+            time.sleep(poll_interval)
+            continue
+        run(job)
+        processed += 1
+    return processed
+
+
+def purge(days):
+    """Delete jobs that finished successfully more than `days` days ago."""
+    deleted, _ = Job.objects.filter(status=Job.DONE, finished_at__lt=timezone.now() - timedelta(days=days)).delete()
+    return deleted
+
+
+def job_stats():
+    """{status: count} over the queue."""
+    counts = dict(Job.objects.values_list('status').annotate(count=Count('id')).order_by())
+    return {status: counts.get(status, 0) for status, _ in Job.STATUS_CHOICES}
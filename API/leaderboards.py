@@ -0,0 +1,164 @@
+"""Precomputed "top rated" and "trending" meal rankings.
+
+Each meal has one LeaderboardEntry per window it has reviews in. The score is
+a Bayesian average, (C * m + rating_sum) / (C + review_count), where m is the
+site-wide mean rating and C is LEADERBOARD_PRIOR_WEIGHT: a meal needs about C
+reviews before its own ratings outweigh the site mean. Review signals
+refresh the entries of the affected meal. The `rebuild_leaderboards` command
+recomputes everything, and it should run periodically. It is what moves the
+windows forward, ages out old reviews and picks up drift in the global mean.
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+
+from .models import Meal, Review, MealRatingBucket, LeaderboardEntry, increment_counters
+
+ALL_TIME = 'all'
+WINDOWS = {
+    ALL_TIME: None,
+    '24h': timedelta(hours=24),
+    '7d': timedelta(days=7),
+    '30d': timedelta(days=30),
+}
+LONGEST_WINDOW = max(window for window in WINDOWS.values() if window)
+MEAN_CACHE_KEY = 'api:leaderboard:mean'
+MEAN_CACHE_TIMEOUT = 60 * 60
+
+
+def prior_weight():
+    return getattr(settings, 'LEADERBOARD_PRIOR_WEIGHT', 10)
+
+
+def global_mean(refresh=False):
+    """Mean rating over every review, cached between full rebuilds."""
+    mean = None if refresh else cache.get(MEAN_CACHE_KEY)
+    if mean is None:
+        totals = Meal.objects.aggregate(count=Sum('review_count'), total=Sum('rating_sum'))
+        mean = float(totals['total']) / totals['count'] if totals['count'] else 0.0
+        cache.set(MEAN_CACHE_KEY, mean, MEAN_CACHE_TIMEOUT)
+    return mean
+
+
+def bayesian_score(rating_sum, review_count, mean, weight):
+    return (weight * mean + float(rating_sum)) / (weight + review_count)
+
+
+def hour_of(moment):
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+# ===============================
+# ⏱ HOURLY BUCKETS
+# ===============================
+def apply_bucket_delta(meal_id, created_at, count_delta, rating_delta):
+    """Shift one meal's totals for the hour a review was created in."""
+    hour = hour_of(created_at)
+    if timezone.now() - hour > LONGEST_WINDOW:
+        return  # older than every window, only the all-time totals care
+    increment_counters(
+        MealRatingBucket, {'meal_id': meal_id, 'hour': hour},
+        review_count=count_delta, rating_sum=rating_delta,
+    )
+
+
+def rebuild_buckets(meal_ids=None):
+    """Recreate the hourly buckets of the longest window from the Review table."""
+    since = hour_of(timezone.now() - LONGEST_WINDOW)
+    buckets = MealRatingBucket.objects.all()
+    reviews = Review.objects.filter(created_at__gte=since)
+    if meal_ids is not None:
+        buckets = buckets.filter(meal_id__in=meal_ids)
+        reviews = reviews.filter(meal_id__in=meal_ids)
+    buckets.delete()
+    rows = (
+        reviews.annotate(hour=TruncHour('created_at'))
+        .values('meal_id', 'hour')
+        .annotate(count=Count('id'), total=Sum('rating'))
+    )
+    MealRatingBucket.objects.bulk_create(
+        [
+            MealRatingBucket(meal_id=row['meal_id'], hour=row['hour'], review_count=row['count'], rating_sum=row['total'])
+            for row in rows.iterator()
+        ],
+        batch_size=5000,
+    )
+
+
+# ===============================
+# 🏆 ENTRIES
+# ===============================
+def _window_totals(meal_ids=None):
+    """{window: {meal_id: (rating_sum, review_count)}} for meals with reviews."""
+    now = timezone.now()
+    meals = Meal.objects.filter(review_count__gt=0)
+    buckets = MealRatingBucket.objects.all()
+    if meal_ids is not None:
+        meals = meals.filter(pk__in=meal_ids)
+        buckets = buckets.filter(meal_id__in=meal_ids)
+    totals = {ALL_TIME: {pk: (total, count) for pk, total, count in meals.values_list('pk', 'rating_sum', 'review_count')}}
+    for window, span in WINDOWS.items():
+        if span is None:
+            continue
+        rows = (
+            buckets.filter(hour__gte=hour_of(now - span))
+            .values('meal_id')
+            .annotate(count=Sum('review_count'), total=Sum('rating_sum'))
+            .filter(count__gt=0)
+        )
+        totals[window] = {row['meal_id']: (row['total'], row['count']) for row in rows}
+    return totals
+
+
+def refresh_entries(meal_ids=None, refresh_mean=False):
+    """Recompute the leaderboard entries of the given meals (default: all)."""
+    mean, weight = global_mean(refresh=refresh_mean), prior_weight()
+    categories = Meal.objects.all() if meal_ids is None else Meal.objects.filter(pk__in=meal_ids)
+    categories = dict(categories.values_list('pk', 'category_id'))
+    entries = []
+    for window, totals in _window_totals(meal_ids).items():
+        for meal_id, (rating_sum, review_count) in totals.items():
+            entries.append(LeaderboardEntry(
+                window=window,
+                meal_id=meal_id,
+                category_id=categories.get(meal_id),
+                score=bayesian_score(rating_sum, review_count, mean, weight),
+                review_count=review_count,
+            ))
+    with transaction.atomic():
+        stale = LeaderboardEntry.objects.all()
+        if meal_ids is not None:
+            stale = stale.filter(meal_id__in=meal_ids)
+        stale.delete()
+        LeaderboardEntry.objects.bulk_create(entries, batch_size=5000)
+
+
+def rebuild_all():
+    rebuild_buckets()
+    refresh_entries(refresh_mean=True)
+
+
+def apply_review_changes(changes):
+    """Incremental path used by the Review signals.
+
+    `changes` is [(meal_id, created_at, count_delta, rating_delta)]; the
+    entries of all the meals involved are refreshed once.
+    """
+    for meal_id, created_at, count_delta, rating_delta in changes:
+        apply_bucket_delta(meal_id, created_at, count_delta, Decimal(rating_delta))
+    if changes:
+        refresh_entries(list({meal_id for meal_id, *_ in changes}))
+
+
+def top_meals(window=ALL_TIME, category_id=None, limit=10):
+    """The best `limit` entries of a window, optionally within one category."""
+    entries = LeaderboardEntry.objects.filter(window=window)
+    if category_id is not None:
+        entries = entries.filter(category_id=category_id)
+    return list(entries.select_related('meal__category').order_by('-score')[:limit])
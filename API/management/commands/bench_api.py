@@ -0,0 +1,67 @@
+import json
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from API.benchmark import (
+    ENDPOINTS, compare_results, run_in_process, run_metadata, run_over_http, suite_fixtures,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark every API route against the seed_bench dataset, in-process through the "
+        "Django test client or over HTTP against a running server, and store the results as JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', help="Base URL of a running server (runserver, gunicorn, uvicorn); "
+                                          "without it the suite runs in-process.")
+        parser.add_argument('--repeat', type=int, default=50, help="Sequential requests per endpoint in-process.")
+        parser.add_argument('--requests', type=int, default=1000, help="Requests per endpoint over HTTP.")
+        parser.add_argument('--concurrency', type=int, default=50, help="Connections per endpoint over HTTP.")
+        parser.add_argument('--only', nargs='+', metavar='NAME', help="Run these endpoints only.")
+        parser.add_argument('--output', default='bench-results/latest.json', help="Where to write the JSON results.")
+        parser.add_argument('--compare', metavar='PATH', help="Earlier results to compare with.")
+        parser.add_argument('--threshold', type=float, default=0.1, help="Regression tolerance (fraction).")
+
+    def handle(self, *args, **options):
+        endpoints = [endpoint for endpoint in ENDPOINTS if not options['only'] or endpoint.name in options['only']]
+        if not endpoints:
+            raise CommandError(f"No such endpoint; choose from {', '.join(endpoint.name for endpoint in ENDPOINTS)}.")
+        try:
+            fixtures = suite_fixtures()
+        except LookupError as exc:
+            raise CommandError(str(exc))
+
+        if options['url']:
+            meta = run_metadata('http', options['url'])
+            results = run_over_http(endpoints, fixtures, options['url'], options['requests'], options['concurrency'])
+        else:
+            meta = run_metadata('in-process')
+            with override_settings(ALLOWED_HOSTS=['localhost']):
+                results = run_in_process(endpoints, fixtures, options['repeat'])
+
+        for name, stats in results.items():
+            queries = stats['queries_per_request']
+            self.stdout.write(
+                f"{name:<20} {stats['rps']:>9.1f} req/s  p50={stats['p50']:.2f}ms p95={stats['p95']:.2f}ms "
+                f"p99={stats['p99']:.2f}ms  queries/req={'?' if queries is None else f'{queries:.1f}'}"
+            )
+            if stats['errors']:
+                self.stdout.write(self.style.WARNING(f"    errors: {stats['errors']}"))
+
+        run = {'meta': meta, 'endpoints': results}
+        os.makedirs(os.path.dirname(options['output']) or '.', exist_ok=True)
+        with open(options['output'], 'w') as f:
+            json.dump(run, f, indent=2, default=str)
+        self.stdout.write(f"Results written to {options['output']}")
+
+        if options['compare']:
+            with open(options['compare']) as f:
+                previous = json.load(f)
+            self.stdout.write(self.style.MIGRATE_HEADING(f"\nCompared with {options['compare']}"))
+            for name, old_rps, new_rps, old_p99, new_p99, regressed in compare_results(previous, run, options['threshold']):
+                line = f"{name:<20} {old_rps:>9.1f} -> {new_rps:>9.1f} req/s  p99 {old_p99:.2f} -> {new_p99:.2f}ms"
+                self.stdout.write(self.style.ERROR(line + "  REGRESSION") if regressed else line)
@@ -0,0 +1,79 @@
+import os
+import socket
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.authtoken.models import Token
+
+from API.benchmark import BENCH_PREFIX, load_test
+from API.models import Meal
+
+# label -> environment overrides read by project/settings.py
+CONFIGS = {
+    'per-request connections': {'DB_CONN_MAX_AGE': '0', 'DB_POOL': '0'},
+    'persistent connections': {'DB_CONN_MAX_AGE': '600', 'DB_POOL': '0'},
+    'psycopg pool': {'DB_CONN_MAX_AGE': '0', 'DB_POOL': '1'},
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Start a server once per connection setting (per-request, persistent, pooled) "
+        "and compare req/s, p50 and p99 of the same endpoint."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default='/api/meals/')
+        parser.add_argument('--requests', type=int, default=5000)
+        parser.add_argument('--concurrency', type=int, default=50)
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument(
+            '--server', default=f'{sys.executable} manage.py runserver --noreload {{bind}}',
+            help="Server command; {bind} is replaced, e.g. 'gunicorn project.wsgi:application -w 4 -b {bind}'.",
+        )
+
+    def handle(self, *args, **options):
+        if not Meal.objects.filter(slug__startswith=f'{BENCH_PREFIX}-').exists():
+            raise CommandError("No benchmark data; run `seed_bench` first.")
+        user = get_user_model().objects.filter(username__startswith=f'{BENCH_PREFIX}_').first()
+        token, _ = Token.objects.get_or_create(user=user)
+        pooled = settings.DATABASES['default']['ENGINE'].endswith('postgresql')
+
+        bind = f"127.0.0.1:{options['port']}"
+        for label, overrides in CONFIGS.items():
+            if overrides['DB_POOL'] == '1' and not pooled:
+                self.stdout.write(f"{label}: skipped, pooling needs PostgreSQL")
+                continue
+            server = subprocess.Popen(
+                options['server'].format(bind=bind).split(),
+                env={**os.environ, **overrides},
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            )
+            try:
+                self._wait_for(options['port'])
+                stats = load_test(
+                    f"http://{bind}{options['path']}", options['requests'], options['concurrency'], token.key,
+                )
+            finally:
+                server.terminate()
+                server.wait()
+            self.stdout.write(
+                f"{label}: {stats['rps']:.1f} req/s, p50={stats['p50']:.2f}ms p99={stats['p99']:.2f}ms"
+            )
+            if stats['errors']:
+                self.stdout.write(self.style.WARNING(f"    errors: {stats['errors']}"))
+
+    @staticmethod
+    def _wait_for(port, timeout=30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=1).close()
+                return
+            except OSError:
+                time.sleep(0.2)
+        raise CommandError(f"Server did not start on port {port}.")
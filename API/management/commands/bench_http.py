@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from API.benchmark import load_test
+
+
+class Command(BaseCommand):
+    help = (
+        "Drive concurrent keep-alive GETs at running servers and report req/s, p50 and p99. "
+        "Compare e.g. /api/meals/ under gunicorn (WSGI) with /api/async/meals/ under uvicorn (ASGI)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('urls', nargs='+', help="Full URLs, e.g. http://127.0.0.1:8000/api/async/meals/")
+        parser.add_argument('--token', help="API token sent as 'Authorization: Token <token>'.")
+        parser.add_argument('--requests', type=int, default=20000)
+        parser.add_argument('--concurrency', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        for url in options['urls']:
+            stats = load_test(url, options['requests'], options['concurrency'], options['token'])
+            self.stdout.write(
+                f"{url}: {stats['requests']} requests, {stats['rps']:.1f} req/s, "
+                f"p50={stats['p50']:.2f}ms p99={stats['p99']:.2f}ms"
+            )
+            if stats['errors']:
+                self.stdout.write(self.style.WARNING(f"    errors: {stats['errors']}"))
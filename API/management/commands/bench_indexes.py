@@ -0,0 +1,78 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count, Sum
+
+from API.benchmark import BENCH_PREFIX, clear_dataset, seed_dataset, time_call
+from API.models import Meal, Review
+
+# Indexes added for the hot lookup paths (migrations 0003 and 0004)
+BENCH_INDEXES = [
+    (Meal, 'meal_created_id_idx'),
+    (Review, 'review_meal_created_id_idx'),
+    (Review, 'review_meal_rating_idx'),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a review dataset and compare query plans and latencies of the hot "
+        "lookup paths with and without the composite indexes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reviews', type=int, default=1_000_000)
+        parser.add_argument('--repeat', type=int, default=50)
+        parser.add_argument('--keep', action='store_true', help="Keep the seeded rows afterwards.")
+        parser.add_argument('--yes', action='store_true', help="Confirm writing to the configured database.")
+
+    def handle(self, *args, **options):
+        if not options['yes']:
+            raise CommandError(f"This inserts '{BENCH_PREFIX}' rows into the configured database; pass --yes.")
+
+        if not Meal.objects.filter(slug__startswith=f'{BENCH_PREFIX}-').exists():
+            self.stdout.write(f"Seeding {options['reviews']} reviews...")
+            seed_dataset(options['reviews'], stdout=self.stdout)
+
+        meal = Meal.objects.filter(slug__startswith=f'{BENCH_PREFIX}-').order_by('-review_count').first()
+        user_id = Review.objects.filter(meal=meal).values_list('user_id', flat=True).first()
+        queries = {
+            'reviews of a meal (newest 10)': lambda: Review.objects.filter(meal__slug=meal.slug).order_by('-created_at', '-id')[:10],
+            'review by meal slug and user': lambda: Review.objects.filter(meal__slug=meal.slug, user_id=user_id),
+            'meals by created_at (newest 10)': lambda: Meal.objects.order_by('-created_at', '-id')[:10],
+            'rating aggregate of a meal': lambda: Review.objects.filter(meal=meal).values('meal').annotate(n=Count('id'), total=Sum('rating')),
+        }
+
+        try:
+            self._drop_indexes()
+            self.stdout.write(self.style.MIGRATE_HEADING("\nWithout indexes"))
+            self._report(queries, options['repeat'])
+        finally:
+            self._create_indexes()
+        self.stdout.write(self.style.MIGRATE_HEADING("\nWith indexes"))
+        self._report(queries, options['repeat'])
+
+        if not options['keep']:
+            clear_dataset()
+
+    def _report(self, queries, repeat):
+        for label, build in queries.items():
+            stats = time_call(lambda: list(build()), repeat=repeat)
+            self.stdout.write(
+                f"{label}: p50={stats['p50']:.2f}ms p95={stats['p95']:.2f}ms max={stats['max']:.2f}ms"
+            )
+            for line in build().explain().splitlines():
+                self.stdout.write(f"    {line}")
+
+    def _drop_indexes(self):
+        with connection.schema_editor() as editor:
+            for model, name in BENCH_INDEXES:
+                editor.remove_index(model, self._index(model, name))
+
+    def _create_indexes(self):
+        with connection.schema_editor() as editor:
+            for model, name in BENCH_INDEXES:
+                editor.add_index(model, self._index(model, name))
+
+    @staticmethod
+    def _index(model, name):
+        return next(index for index in model._meta.indexes if index.name == name)
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from API.benchmark import serialization_cpu
+from API.models import Review
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the CPU time per list page of the serializers + JSONRenderer with the "
+        "row-spec fast path + FastJSONRenderer (API.fastpath), and check both emit the same bytes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page-size', type=int, default=10, help="Rows per page (the API default is 10).")
+        parser.add_argument('--repeat', type=int, default=200, help="Pages rendered per path.")
+
+    def handle(self, *args, **options):
+        if not Review.objects.exists():
+            raise CommandError("No reviews; run `seed_bench` first.")
+        with override_settings(ALLOWED_HOSTS=['testserver']):
+            results = serialization_cpu(options['page_size'], options['repeat'])
+        for name, stats in results.items():
+            self.stdout.write(
+                f"{name:<8} serializer={stats['serializer_ms']:.2f}ms/page  fast={stats['fast_ms']:.2f}ms/page  "
+                f"{stats['speedup']:.1f}x less CPU"
+            )
+            if not stats['identical']:
+                self.stdout.write(self.style.ERROR(f"    {name}: payloads differ"))
@@ -0,0 +1,46 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from API.images import build_renditions
+from API.models import Meal
+
+
+def _build(meal_id):
+    try:
+        renditions = build_renditions(meal_id)
+        return meal_id, None if renditions is not None else 'missing'
+    except Exception as exc:  # report and keep the pool going
+        return meal_id, str(exc)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = "Backfill image renditions for existing meals in parallel across CPU cores."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count())
+        parser.add_argument('--force', action='store_true', help="Rebuild meals that already have renditions.")
+
+    def handle(self, *args, **options):
+        meals = Meal.objects.exclude(image='').exclude(image__isnull=True)
+        if not options['force']:
+            meals = meals.filter(image_renditions={})
+        meal_ids = list(meals.values_list('pk', flat=True))
+        if not meal_ids:
+            self.stdout.write("Nothing to do.")
+            return
+
+        # Forked workers must not share the parent's database connection
+        connections.close_all()
+        failed = 0
+        with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+            for future in as_completed([pool.submit(_build, meal_id) for meal_id in meal_ids]):
+                meal_id, error = future.result()
+                if error:
+                    failed += 1
+                    self.stderr.write(f"meal {meal_id}: {error}")
+        self.stdout.write(self.style.SUCCESS(f"Rendered {len(meal_ids) - failed} of {len(meal_ids)} meal image(s)."))
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_datetime
+
+from API.exports import CHUNK_SIZE, EXPORTS, EXPORT_FORMATS, export_queryset, stream_export
+
+
+class Command(BaseCommand):
+    help = "Stream meals or reviews as NDJSON or CSV to a file or stdout."
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset', choices=sorted(EXPORTS))
+        parser.add_argument('--format', choices=EXPORT_FORMATS, default='ndjson')
+        parser.add_argument('--since', help="Only rows created at or after this ISO 8601 datetime.")
+        parser.add_argument('--output', default='-', help="Target file (default: stdout).")
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            since = parse_datetime(options['since'])
+            if since is None:
+                raise CommandError("--since must be an ISO 8601 datetime")
+
+        spec = EXPORTS[options['dataset']]
+        lines = stream_export(spec, export_queryset(spec, since), options['format'], options['chunk_size'])
+        if options['output'] == '-':
+            for line in lines:
+                self.stdout.write(line, ending='')
+        else:
+            with open(options['output'], 'w', encoding='utf-8', newline='') as handle:
+                handle.writelines(lines)
@@ -0,0 +1,35 @@
+import json
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from API.importers import CONFLICT_MODES, SKIP, import_reviews
+
+
+class Command(BaseCommand):
+    help = "Import reviews from a JSON array or NDJSON file (use '-' for stdin)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=['ndjson', 'json'], default='ndjson')
+        parser.add_argument('--on-conflict', choices=CONFLICT_MODES, default=SKIP)
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        stream = sys.stdin if options['path'] == '-' else open(options['path'], encoding='utf-8')
+        with stream:
+            try:
+                if options['format'] == 'json':
+                    rows = json.load(stream)
+                else:
+                    rows = (json.loads(line) for line in stream if line.strip())
+                result = import_reviews(rows, on_conflict=options['on_conflict'], batch_size=options['batch_size'])
+            except ValueError as exc:
+                raise CommandError(f"Could not parse {options['path']}: {exc}")
+
+        for error in result['errors'][:20]:
+            self.stderr.write(f"row {error['row']}: {error['errors']}")
+        self.stdout.write(self.style.SUCCESS(
+            f"created={result['created']} updated={result['updated']} "
+            f"skipped={result['skipped']} errors={len(result['errors'])}"
+        ))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from API import histograms
+
+
+class Command(BaseCommand):
+    help = "Recompute every meal's rating histogram from the Review table in one grouped pass."
+
+    def handle(self, *args, **options):
+        bins = histograms.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {bins} histogram bin(s)."))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from API import leaderboards
+from API.models import LeaderboardEntry
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the hourly rating buckets and every leaderboard entry. Run it "
+        "periodically (e.g. hourly from cron) so the trending windows move forward."
+    )
+
+    def handle(self, *args, **options):
+        leaderboards.rebuild_all()
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt {LeaderboardEntry.objects.count()} leaderboard entries "
+            f"(global mean {leaderboards.global_mean():.3f})."
+        ))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from API.models import Meal
+
+
+class Command(BaseCommand):
+    help = "Recompute the stored review_count / rating_sum of meals from their reviews."
+
+    def add_arguments(self, parser):
+        parser.add_argument('slugs', nargs='*', help="Only rebuild these meals (default: all).")
+
+    def handle(self, *args, **options):
+        meal_ids = None
+        if options['slugs']:
+            meal_ids = list(Meal.objects.filter(slug__in=options['slugs']).values_list('pk', flat=True))
+        updated = Meal.rebuild_rating_totals(meal_ids)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt rating totals for {updated} meal(s)."))
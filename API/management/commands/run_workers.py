@@ -0,0 +1,50 @@
+import signal
+import subprocess
+import sys
+
+from django.core.management.base import BaseCommand
+
+from API import jobs
+
+
+class Command(BaseCommand):
+    help = (
+        "Run background jobs (API.jobs) in a pool of worker processes until stopped "
+        "with SIGINT/SIGTERM, or until the queue is empty with --burst."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2, help="Worker processes.")
+        parser.add_argument('--burst', action='store_true', help="Exit once no job is due.")
+        parser.add_argument('--poll', type=float, default=1.0, help="Seconds between polls of an idle queue.")
+
+    def handle(self, *args, **options):
+        if options['workers'] <= 1:
+            self._work(options)
+            return
+
+        # One child process per worker, each running this command with --workers 1
+        command = [sys.executable, sys.argv[0], 'run_workers', '--workers', '1', '--poll', str(options['poll'])]
+        if options['burst']:
+            command.append('--burst')
+        children = [subprocess.Popen(command) for _ in range(options['workers'])]
+
+        def stop(signum, frame):
+            for child in children:
+                child.send_signal(signal.SIGTERM)
+        signal.signal(signal.SIGINT, stop)
+        signal.signal(signal.SIGTERM, stop)
+        self.stdout.write(f"Started {len(children)} workers.")
+        for child in children:
+            child.wait()
+
+    def _work(self, options):
+        stopping = []
+
+        def stop(signum, frame):
+            stopping.append(signum)  # finish the current job, then exit
+        signal.signal(signal.SIGINT, stop)
+        signal.signal(signal.SIGTERM, stop)
+        worker = jobs.worker_name()
+        processed = jobs.work(worker, burst=options['burst'], poll_interval=options['poll'], should_stop=lambda: stopping)
+        self.stdout.write(f"{worker}: ran {processed} jobs.")
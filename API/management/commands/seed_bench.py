@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from API.benchmark import BENCH_PREFIX, SCALES, clear_dataset, seed_dataset
+from API.models import Meal
+
+
+class Command(BaseCommand):
+    help = (
+        "Bulk insert a benchmark dataset of users, categories, meals and reviews "
+        "(10k, 100k or 1m reviews) for bench_api and bench_indexes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', choices=SCALES, default='10k')
+        parser.add_argument('--seed', type=int, default=0, help="Random seed; the same seed gives the same dataset.")
+        parser.add_argument('--replace', action='store_true', help="Drop an existing benchmark dataset first.")
+        parser.add_argument('--clear', action='store_true', help="Only drop the benchmark dataset.")
+        parser.add_argument('--yes', action='store_true', help="Confirm writing to the configured database.")
+
+    def handle(self, *args, **options):
+        if not options['yes']:
+            raise CommandError(f"This writes '{BENCH_PREFIX}' rows into the configured database; pass --yes.")
+        exists = Meal.objects.filter(slug__startswith=f'{BENCH_PREFIX}-').exists()
+        if options['clear'] or (exists and options['replace']):
+            clear_dataset()
+            self.stdout.write("Dropped the benchmark dataset.")
+            if options['clear']:
+                return
+        elif exists:
+            raise CommandError("A benchmark dataset already exists; pass --replace to rebuild it.")
+
+        reviews = SCALES[options['scale']]
+        self.stdout.write(f"Seeding {reviews} reviews...")
+        counts = seed_dataset(reviews, seed=options['seed'], stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {counts['users']} users, {counts['categories']} categories, "
+            f"{counts['meals']} meals and {counts['reviews']} reviews."
+        ))
@@ -0,0 +1,212 @@
+"""In-process request metrics, rendered in the Prometheus text format.
+
+`MetricsMiddleware` (API.middleware) opens a `RequestRecord` for every
+request. A query wrapper that signals.py installs on each new database
+connection adds every query's count and time to the active record, on any
+thread the request's context reaches. Serializers that use
+`TimedSerializerMixin` add their `to_representation` time. When a request is
+done, the record is folded into the registry under its URL name:
+
+- a latency histogram
+- DB query count and time
+- serializer time (row formatting for `API.fastpath` lists)
+- response bytes
+- N+1 warnings: one query template repeated `API_N_PLUS_ONE_THRESHOLD`
+  times or more in a single request
+
+Values are per process. Scrape every worker, or aggregate them upstream.
+"""
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+from .jobs import job_stats
+from .response_cache import response_cache_stats
+from .throttling import throttle_stats
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_current = ContextVar('request_record', default=None)
+
+
+class RequestRecord:
+    __slots__ = ('queries', 'query_time', 'serializer_time', 'serializing', 'statements')
+
+    def __init__(self):
+        self.queries = 0
+        self.query_time = 0.0
+        self.serializer_time = 0.0
+        self.serializing = False
+        self.statements = Counter()
+
+
+def start_request():
+    """Begin recording the current request; returns (record, reset token)."""
+    record = RequestRecord()
+    return record, _current.set(record)
+
+
+def end_request(token):
+    _current.reset(token)
+
+
+def record_query(execute, sql, params, many, context):
+    """`connection.execute_wrapper` hook; a no-op outside recorded requests."""
+    record = _current.get()
+    if record is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        record.query_time += time.perf_counter() - start
+        record.queries += 1
+        record.statements[sql] += 1  # params are separate, so repeats share the template
+
+
+def install_query_recorder(connection):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+@contextmanager
+def serializing():
+    """Add the block's time to the request's serializer time.
+
+    Only the outermost block is timed, so nested serializers are not counted twice.
+    """
+    record = _current.get()
+    if record is None or record.serializing:
+        yield
+        return
+    record.serializing = True
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record.serializer_time += time.perf_counter() - start
+        record.serializing = False
+
+
+class TimedSerializerMixin:
+    """Adds a serializer's `to_representation` time to the request record."""
+
+    def to_representation(self, instance):
+        with serializing():
+            return super().to_representation(instance)
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.latency = defaultdict(lambda: [0] * (len(LATENCY_BUCKETS) + 1))  # + the +Inf bucket
+            self.latency_sum = Counter()
+            self.requests = Counter()  # (view, method, status)
+            self.queries = Counter()
+            self.query_time = Counter()
+            self.serializer_time = Counter()
+            self.response_bytes = Counter()
+            self.n_plus_one = Counter()
+
+    def observe(self, view, method, status, duration, record, response_bytes):
+        repeated = [
+            (sql, count) for sql, count in record.statements.items()
+            if count >= getattr(settings, 'API_N_PLUS_ONE_THRESHOLD', 10)
+        ]
+        key = (view, method)
+        with self._lock:
+            buckets = self.latency[key]
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if duration <= bound:
+                    buckets[i] += 1
+                    break
+            else:
+                buckets[-1] += 1
+            self.latency_sum[key] += duration
+            self.requests[(view, method, status)] += 1
+            self.queries[key] += record.queries
+            self.query_time[key] += record.query_time
+            self.serializer_time[key] += record.serializer_time
+            self.response_bytes[key] += response_bytes
+            if repeated:
+                self.n_plus_one[key] += 1
+        for sql, count in repeated:
+            logger.warning("Possible N+1 in %s %s: %d x %s", method, view, count, sql)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'latency': {key: list(buckets) for key, buckets in self.latency.items()},
+                'latency_sum': dict(self.latency_sum),
+                'requests': dict(self.requests),
+                'queries': dict(self.queries),
+                'query_time': dict(self.query_time),
+                'serializer_time': dict(self.serializer_time),
+                'response_bytes': dict(self.response_bytes),
+                'n_plus_one': dict(self.n_plus_one),
+            }
+
+
+registry = Registry()
+
+
+def _labels(**labels):
+    return '{' + ','.join(f'{name}="{value}"' for name, value in labels.items()) + '}'
+
+
+def _family(lines, name, kind, help_text, samples):
+    lines.append(f'# HELP {name} {help_text}')
+    lines.append(f'# TYPE {name} {kind}')
+    lines.extend(samples)
+
+
+def render_prometheus():
+    """Every metric in the Prometheus text exposition format (version 0.0.4)."""
+    data = registry.snapshot()
+    lines = []
+    histogram = []
+    for (view, method), buckets in sorted(data['latency'].items()):
+        running = 0
+        for bound, count in zip((*LATENCY_BUCKETS, '+Inf'), buckets):
+            running += count
+            histogram.append(f'api_request_duration_seconds_bucket{_labels(view=view, method=method, le=bound)} {running}')
+        histogram.append(f'api_request_duration_seconds_sum{_labels(view=view, method=method)} {data["latency_sum"][(view, method)]}')
+        histogram.append(f'api_request_duration_seconds_count{_labels(view=view, method=method)} {running}')
+    _family(lines, 'api_request_duration_seconds', 'histogram', 'Request latency by view.', histogram)
+    _family(lines, 'api_requests_total', 'counter', 'Requests by view, method and status.', [
+        f'api_requests_total{_labels(view=view, method=method, status=status)} {count}'
+        for (view, method, status), count in sorted(data['requests'].items())
+    ])
+    for name, key, help_text in (
+        ('api_db_queries_total', 'queries', 'Database queries run by requests.'),
+        ('api_db_query_seconds_total', 'query_time', 'Time spent in database queries.'),
+        ('api_serializer_seconds_total', 'serializer_time', 'Time spent in serializer to_representation.'),
+        ('api_response_bytes_total', 'response_bytes', 'Response body bytes (streamed bodies excluded).'),
+        ('api_n_plus_one_requests_total', 'n_plus_one', 'Requests that repeated one query template too often.'),
+    ):
+        _family(lines, name, 'counter', help_text, [
+            f'{name}{_labels(view=view, method=method)} {value}' for (view, method), value in sorted(data[key].items())
+        ])
+    _family(lines, 'api_throttled_requests_total', 'counter', 'Requests rejected by rate limits.', [
+        f'api_throttled_requests_total{_labels(scope=scope)} {count}' for scope, count in throttle_stats().items()
+    ])
+    cache_stats = response_cache_stats()
+    _family(lines, 'api_response_cache_requests_total', 'counter', 'Response cache lookups.', [
+        f'api_response_cache_requests_total{_labels(result=result)} {cache_stats[key]}'
+        for result, key in (('hit', 'hits'), ('miss', 'misses'))
+    ])
+    _family(lines, 'api_jobs', 'gauge', 'Background jobs by status.', [
+        f'api_jobs{_labels(status=status)} {count}' for status, count in job_stats().items()
+    ])
+    return '\n'.join(lines) + '\n'
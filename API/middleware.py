@@ -0,0 +1,129 @@
+import cProfile
+import hashlib
+import os
+import random
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+
+from . import metrics
+from .db_router import allow_replica_reads, reset_replica_reads
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class ReplicaRoutingMiddleware:
+    """Allow replica reads for safe requests of clients that have not just written.
+
+    Clients are told apart by their Authorization header, then their session
+    cookie, then their address. A successful unsafe request pins the client
+    to the primary for `REPLICA_STICKY_SECONDS`, in the shared default cache
+    so the pin holds on every worker.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    @staticmethod
+    def _pin_key(request):
+        client = (
+            request.headers.get('Authorization')
+            or request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+            or request.META.get('REMOTE_ADDR', '')
+        )
+        return 'api:primary-pin:' + hashlib.sha256(client.encode()).hexdigest()
+
+    def _replica_safe(self, request):
+        return request.method in SAFE_METHODS and not cache.get(self._pin_key(request))
+
+    def _after(self, request, response):
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            cache.set(self._pin_key(request), True, getattr(settings, 'REPLICA_STICKY_SECONDS', 5))
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = allow_replica_reads(self._replica_safe(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            reset_replica_reads(token)
+        self._after(request, response)
+        return response
+
+    async def __acall__(self, request):
+        token = allow_replica_reads(self._replica_safe(request))
+        try:
+            response = await self.get_response(request)
+        finally:
+            reset_replica_reads(token)
+        self._after(request, response)
+        return response
+
+
+class MetricsMiddleware:
+    """Record latency, queries, serializer time and response size per view.
+
+    With `API_PROFILE_SAMPLE_RATE` > 0, that share of synchronous requests
+    runs under cProfile. Those slower than `API_PROFILE_SLOW_MS` are dumped
+    to `API_PROFILE_DIR` as `<view>-<unix ms>.prof`, for `python -m pstats`
+    or snakeviz.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    @staticmethod
+    def _view_name(request):
+        match = getattr(request, 'resolver_match', None)
+        return (match.view_name if match else None) or 'unmatched'
+
+    def _observe(self, request, response, record, start):
+        duration = time.perf_counter() - start
+        size = 0 if response.streaming else len(response.content)
+        metrics.registry.observe(
+            self._view_name(request), request.method, response.status_code, duration, record, size,
+        )
+        return duration
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        record, token = metrics.start_request()
+        profiler = None
+        if random.random() < getattr(settings, 'API_PROFILE_SAMPLE_RATE', 0.0):
+            profiler = cProfile.Profile()
+            profiler.enable()
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            metrics.end_request(token)
+        duration = self._observe(request, response, record, start)
+        if profiler is not None and duration * 1000 >= getattr(settings, 'API_PROFILE_SLOW_MS', 500):
+            directory = getattr(settings, 'API_PROFILE_DIR', settings.BASE_DIR / 'profiles')
+            os.makedirs(directory, exist_ok=True)
+            profiler.dump_stats(os.path.join(directory, f'{self._view_name(request)}-{int(time.time() * 1000)}.prof'))
+        return response
+
+    async def __acall__(self, request):
+        record, token = metrics.start_request()
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.end_request(token)
+        self._observe(request, response, record, start)
+        return response
@@ -0,0 +1,31 @@
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def populate_rating_totals(apps, schema_editor):
+    Meal = apps.get_model('API', 'Meal')
+    Review = apps.get_model('API', 'Review')
+    totals = Review.objects.values('meal').annotate(count=Count('id'), total=Sum('rating'))
+    for row in totals.iterator():
+        Meal.objects.filter(pk=row['meal']).update(review_count=row['count'], rating_sum=row['total'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('API', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='meal',
+            name='review_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='meal',
+            name='rating_sum',
+            field=models.DecimalField(decimal_places=1, default=0, editable=False, max_digits=12),
+        ),
+        migrations.RunPython(populate_rating_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('API', '0002_meal_rating_totals'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='meal',
+            index=models.Index(fields=['created_at', 'id'], name='meal_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['meal', 'created_at', 'id'], name='review_meal_created_id_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('API', '0003_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='review',
+            constraint=models.UniqueConstraint(fields=('user', 'meal'), name='review_unique_user_meal'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='review',
+            unique_together=set(),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['meal', 'rating'], name='review_meal_rating_idx'),
+        ),
+    ]
@@ -0,0 +1,49 @@
+from django.db import migrations, models
+
+PG_INDEXES = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS meal_search_tsv_idx ON \"API_meal\" "
+    "USING gin (to_tsvector('simple'::regconfig, COALESCE(search_text, '')))",
+    "CREATE INDEX IF NOT EXISTS meal_search_trgm_idx ON \"API_meal\" USING gin (search_text gin_trgm_ops)",
+]
+
+
+def populate_search_text(apps, schema_editor):
+    Meal = apps.get_model('API', 'Meal')
+    meals = list(Meal.objects.select_related('category'))
+    for meal in meals:
+        meal.search_text = ' '.join(
+            part for part in (meal.name, meal.category.name if meal.category else None, meal.description) if part
+        ).lower()
+    Meal.objects.bulk_update(meals, ['search_text'], batch_size=1000)
+
+
+def create_search_indexes(apps, schema_editor):
+    # Full-text and trigram GIN indexes only exist on PostgreSQL; other
+    # databases use the in-memory index in API.search
+    if schema_editor.connection.vendor == 'postgresql':
+        for statement in PG_INDEXES:
+            schema_editor.execute(statement)
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute("DROP INDEX IF EXISTS meal_search_tsv_idx")
+        schema_editor.execute("DROP INDEX IF EXISTS meal_search_trgm_idx")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('API', '0005_meal_image_renditions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='meal',
+            name='search_text',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.RunPython(populate_search_text, migrations.RunPython.noop),
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
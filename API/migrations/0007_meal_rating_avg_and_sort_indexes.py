@@ -0,0 +1,54 @@
+from django.db import migrations, models
+from django.db.models import F, FloatField
+from django.db.models.functions import Cast
+
+
+def populate_rating_avg(apps, schema_editor):
+    Meal = apps.get_model('API', 'Meal')
+    Meal.objects.filter(review_count__gt=0).update(
+        rating_avg=Cast(F('rating_sum'), FloatField()) / F('review_count'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('API', '0006_meal_search_text'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='meal',
+            name='rating_avg',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.RunPython(populate_rating_avg, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='meal',
+            index=models.Index(fields=['rating_avg', 'id'], name='meal_rating_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='meal',
+            index=models.Index(fields=['price', 'id'], name='meal_price_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='meal',
+            index=models.Index(fields=['review_count', 'id'], name='meal_reviews_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='meal',
+            index=models.Index(fields=['category', 'rating_avg', 'id'], name='meal_cat_rating_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='meal',
+            index=models.Index(fields=['category', 'price', 'id'], name='meal_cat_price_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='meal',
+            index=models.Index(fields=['category', 'created_at', 'id'], name='meal_cat_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='meal',
+            index=models.Index(fields=['category', 'review_count', 'id'], name='meal_cat_reviews_id_idx'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:06
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('API', '0007_meal_rating_avg_and_sort_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeaderboardEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('window', models.CharField(max_length=8)),
+                ('score', models.FloatField()),
+                ('review_count', models.IntegerField()),
+                ('category', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='API.category')),
+                ('meal', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='leaderboard_entries', to='API.meal')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['window', '-score'], name='leaderboard_window_score_idx'), models.Index(fields=['window', 'category', '-score'], name='leaderboard_cat_score_idx')],
+                'constraints': [models.UniqueConstraint(fields=('window', 'meal'), name='leaderboard_unique_window_meal')],
+            },
+        ),
+        migrations.CreateModel(
+            name='MealRatingBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.DateTimeField()),
+                ('review_count', models.IntegerField(default=0)),
+                ('rating_sum', models.DecimalField(decimal_places=1, default=0, max_digits=12)),
+                ('meal', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rating_buckets', to='API.meal')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('meal', 'hour'), name='bucket_unique_meal_hour')],
+            },
+        ),
+    ]
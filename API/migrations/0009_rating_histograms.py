@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:08
+
+from decimal import Decimal, ROUND_HALF_UP
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def populate_histograms(apps, schema_editor):
+    Review = apps.get_model('API', 'Review')
+    RatingHistogramBin = apps.get_model('API', 'RatingHistogramBin')
+    counts = {}
+    for meal_id, rating, count in Review.objects.values_list('meal_id', 'rating').annotate(n=Count('id')).iterator():
+        key = (meal_id, int((Decimal(rating) * 2).to_integral_value(rounding=ROUND_HALF_UP)))
+        counts[key] = counts.get(key, 0) + count
+    RatingHistogramBin.objects.bulk_create(
+        [RatingHistogramBin(meal_id=meal_id, bucket=bucket, count=count) for (meal_id, bucket), count in counts.items()],
+        batch_size=5000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('API', '0008_leaderboards'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RatingHistogramBin',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.PositiveSmallIntegerField()),
+                ('count', models.IntegerField(default=0)),
+                ('meal', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='histogram_bins', to='API.meal')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('meal', 'bucket'), name='histogram_unique_meal_bucket')],
+            },
+        ),
+        migrations.RunPython(populate_histograms, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+import API.models
+from django.db import migrations, models
+
+# API.models.RESERVED_MEAL_SLUGS when this migration was written
+RESERVED = ('bulk', 'search', 'top', 'histograms', 'batch')
+
+
+def reslug_reserved_meals(apps, schema_editor):
+    # Meals created before these routes existed are unreachable at their URLs
+    Meal = apps.get_model('API', 'Meal')
+    for meal in Meal.objects.filter(slug__in=RESERVED):
+        slug, n = f'{meal.slug}-meal', 1
+        while Meal.objects.filter(slug=slug).exists():
+            n += 1
+            slug = f'{meal.slug}-meal-{n}'
+        meal.slug = slug
+        meal.save(update_fields=['slug'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('API', '0010_jobs'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='meal',
+            name='slug',
+            field=models.SlugField(blank=True, unique=True, validators=[API.models.validate_meal_slug]),
+        ),
+        migrations.RunPython(reslug_reserved_meals, migrations.RunPython.noop),
+    ]
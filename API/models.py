@@ -1,7 +1,11 @@
 from rest_framework.authtoken.models import Token
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import Case, Count, ExpressionWrapper, F, FloatField, Q, Sum, Value, When
+from django.db.models.functions import Cast
 from django.contrib.auth.models import User
+from django.utils import timezone
 from django.utils.text import slugify
+from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.contrib.auth.models import AbstractUser
 from django.core.validators import MinLengthValidator ,MaxLengthValidator
@@ -24,7 +28,15 @@ class User(AbstractUser):
         ('F', 'Female'),
     ]
     gender = models.CharField(max_length=1, choices=GENDER_CHOICES, null=True, blank=True)
-    
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored username; review payloads show it
+        if 'username' in instance.__dict__:
+            instance._loaded_username = instance.username
+        return instance
+
     def __str__(self):
         return self.username
 
@@ -42,34 +54,130 @@ class Category(models.Model):
     def __str__(self):
         return self.name
 
+# Fixed routes next to /meals/<slug>/ and /reviews/<meal slug>/; a meal with
+# one of these slugs could not be reached at its own URLs
+RESERVED_MEAL_SLUGS = frozenset({'bulk', 'search', 'top', 'histograms', 'batch'})
+
+
+def validate_meal_slug(value):
+    if value in RESERVED_MEAL_SLUGS:
+        raise ValidationError(f"'{value}' is reserved, its URL would clash with an API route.", code='reserved')
+
+
 class Meal(models.Model):
     name = models.CharField(max_length=255, unique=True)
-    slug = models.SlugField(unique=True, blank=True)
+    slug = models.SlugField(unique=True, blank=True, validators=[validate_meal_slug])
     description = models.TextField()
     price = models.DecimalField(max_digits=6, decimal_places=2)
     category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, related_name="meals")
     image = models.ImageField(upload_to='meals/', blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Denormalized review totals, kept in sync by the Review signals
+    review_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_sum = models.DecimalField(max_digits=12, decimal_places=1, default=0, editable=False)
+    rating_avg = models.FloatField(default=0, editable=False)  # rating_sum / review_count, for sorting
+    # Stored paths of the resized image variants, filled in by API.images
+    image_renditions = models.JSONField(default=dict, blank=True, editable=False)
+    # Lower-cased name, description and category name, indexed by API.search
+    search_text = models.TextField(blank=True, default='', editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='meal_created_id_idx'),  # keyset pagination
+            # One index per sortable column, alone and behind the category filter (see API.filters)
+            models.Index(fields=['rating_avg', 'id'], name='meal_rating_id_idx'),
+            models.Index(fields=['price', 'id'], name='meal_price_id_idx'),
+            models.Index(fields=['review_count', 'id'], name='meal_reviews_id_idx'),
+            models.Index(fields=['category', 'rating_avg', 'id'], name='meal_cat_rating_id_idx'),
+            models.Index(fields=['category', 'price', 'id'], name='meal_cat_price_id_idx'),
+            models.Index(fields=['category', 'created_at', 'id'], name='meal_cat_created_id_idx'),
+            models.Index(fields=['category', 'review_count', 'id'], name='meal_cat_reviews_id_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored image so signals only re-render when it changes
+        if 'image' in instance.__dict__:
+            instance._loaded_image = instance.image.name
+        if 'slug' in instance.__dict__:
+            instance._loaded_slug = instance.slug
+        return instance
+
+    @staticmethod
+    def build_search_text(name, description, category_name=None):
+        return ' '.join(part for part in (name, category_name, description) if part).lower()
+
+    def clean(self):
+        # A blank slug is generated from the name on save
+        if not self.slug and slugify(self.name) in RESERVED_MEAL_SLUGS:
+            raise ValidationError({'name': f"'{self.name}' is reserved, its URL would clash with an API route."})
 
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = slugify(self.name)
+        if self.slug != getattr(self, '_loaded_slug', None):
+            validate_meal_slug(self.slug)  # rows saved before a slug was reserved keep working
+        self.search_text = self.build_search_text(
+            self.name, self.description, self.category.name if self.category_id else None,
+        )
         super().save(*args, **kwargs)
+        self._loaded_slug = self.slug
     def __str__(self):
         return self.name
     def no_of_reviews(self):
         """ Return the number of reviews for this meal """
-        review_list = Review.objects.filter(meal=self)
-        return review_list.count()
+        return self.review_count
 
     def average_rating(self):
-        """ Calculate and return the average rating for this meal """
-        review_list = Review.objects.filter(meal=self)
-        if review_list.exists():
-            total_rating = sum(review.rating for review in review_list)
-            return total_rating / review_list.count()
+        """ Return the average rating for this meal from the stored totals """
+        if self.review_count:
+            return self.rating_sum / self.review_count
         return 0
 
+    @staticmethod
+    def apply_review_delta(meal_id, count_delta, rating_delta):
+        """ Atomically shift the stored review totals of a meal """
+        new_count = F('review_count') + count_delta
+        new_sum = F('rating_sum') + rating_delta
+        # The right-hand sides all see the row's values from before the update
+        Meal.objects.filter(pk=meal_id).update(
+            review_count=new_count,
+            rating_sum=new_sum,
+            rating_avg=Case(
+                When(
+                    Q(review_count__gt=-count_delta),
+                    then=ExpressionWrapper(Cast(new_sum, FloatField()) / new_count, output_field=FloatField()),
+                ),
+                default=Value(0.0),
+            ),
+        )
+
+    @classmethod
+    def rebuild_rating_totals(cls, meal_ids=None):
+        """ Recompute the stored review totals from the Review table """
+        meals = cls.objects.all()
+        if meal_ids is not None:
+            meals = meals.filter(pk__in=meal_ids)
+        totals = {
+            row['meal']: row
+            for row in Review.objects.filter(meal__in=meals)
+            .values('meal')
+            .annotate(count=Count('id'), total=Sum('rating'))
+        }
+        updated = []
+        for meal in meals.only('pk', 'slug', 'review_count', 'rating_sum', 'rating_avg'):
+            row = totals.get(meal.pk)
+            meal.review_count = row['count'] if row else 0
+            meal.rating_sum = row['total'] if row else 0
+            meal.rating_avg = float(meal.rating_sum) / meal.review_count if meal.review_count else 0
+            updated.append(meal)
+        cls.objects.bulk_update(updated, ['review_count', 'rating_sum', 'rating_avg'], batch_size=1000)
+        # bulk_update sends no signals; API.cache imports this module, hence the late import
+        from .cache import bump_version, meal_namespace
+        bump_version('meals', *(meal_namespace(meal.slug) for meal in updated))
+        return len(updated)
+
 
 class Review(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
@@ -84,7 +192,23 @@ class Review(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
-        unique_together = ('user', 'meal')  # Prevent duplicate reviews by the same user
+        constraints = [
+            # Prevent duplicate reviews by the same user; also serves ReviewDetailView's (meal, user) lookup
+            models.UniqueConstraint(fields=['user', 'meal'], name='review_unique_user_meal'),
+        ]
+        indexes = [
+            models.Index(fields=['meal', 'created_at', 'id'], name='review_meal_created_id_idx'),  # keyset pagination
+            models.Index(fields=['meal', 'rating'], name='review_meal_rating_idx'),  # index-only rating aggregates
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored values so signals can apply only the difference
+        if 'meal_id' in instance.__dict__ and 'rating' in instance.__dict__:
+            instance._loaded_meal_id = instance.meal_id
+            instance._loaded_rating = instance.rating
+        return instance
 
     def save(self, *args, **kwargs):
         if self.rating > 5.0:
@@ -93,3 +217,87 @@ class Review(models.Model):
 
     def __str__(self):
         return f"{self.user.username} - {self.meal.name} ({self.rating}★)"
+
+
+def increment_counters(model, lookup, **deltas):
+    """Add `deltas` to the row matching `lookup` with F(), creating it if missing."""
+    rows = model.objects.filter(**lookup)
+    updates = {field: F(field) + delta for field, delta in deltas.items()}
+    if rows.update(**updates):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**lookup, **deltas)
+    except IntegrityError:
+        # another writer created the row first
+        rows.update(**updates)
+
+
+class MealRatingBucket(models.Model):
+    """Review totals of one meal for one hour, summed up for the trending windows."""
+    meal = models.ForeignKey(Meal, on_delete=models.CASCADE, related_name="rating_buckets")
+    hour = models.DateTimeField()
+    review_count = models.IntegerField(default=0)
+    rating_sum = models.DecimalField(max_digits=12, decimal_places=1, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['meal', 'hour'], name='bucket_unique_meal_hour'),
+        ]
+
+
+class LeaderboardEntry(models.Model):
+    """A meal's Bayesian-weighted score in one time window, see API.leaderboards."""
+    window = models.CharField(max_length=8)
+    meal = models.ForeignKey(Meal, on_delete=models.CASCADE, related_name="leaderboard_entries")
+    category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, related_name="+")
+    score = models.FloatField()
+    review_count = models.IntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['window', 'meal'], name='leaderboard_unique_window_meal'),
+        ]
+        indexes = [
+            models.Index(fields=['window', '-score'], name='leaderboard_window_score_idx'),
+            models.Index(fields=['window', 'category', '-score'], name='leaderboard_cat_score_idx'),
+        ]
+
+
+class RatingHistogramBin(models.Model):
+    """Number of a meal's reviews in one half-star bucket (0 = 0★ ... 10 = 5★)."""
+    meal = models.ForeignKey(Meal, on_delete=models.CASCADE, related_name="histogram_bins")
+    bucket = models.PositiveSmallIntegerField()
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['meal', 'bucket'], name='histogram_unique_meal_bucket'),
+        ]
+
+
+class Job(models.Model):
+    """A queued side effect of a write, run by `manage.py run_workers` (see API.jobs)."""
+    PENDING, RUNNING, DONE, FAILED = 'pending', 'running', 'done', 'failed'
+    STATUS_CHOICES = [(PENDING, 'Pending'), (RUNNING, 'Running'), (DONE, 'Done'), (FAILED, 'Failed')]
+
+    task = models.CharField(max_length=100)
+    args = models.JSONField(default=list)
+    key = models.CharField(max_length=255, unique=True, null=True, blank=True)  # idempotency key
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_after', 'id'], name='job_status_run_after_idx'),  # claiming
+        ]
+
+    def __str__(self):
+        return f"{self.task} #{self.pk} ({self.status})"
@@ -1,7 +1,86 @@
 # API/pagination.py
-from rest_framework.pagination import PageNumberPagination
+import json
+
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import QuerySet
+from django.utils.functional import cached_property
+from rest_framework.pagination import BasePagination, CursorPagination, PageNumberPagination
+
+
+class ApproximateCountPaginator(Paginator):
+    """Paginator that takes the row count from the query planner's estimate.
+
+    Only PostgreSQL exposes a usable estimate; other backends fall back to an
+    exact COUNT(*), and lists (e.g. cached indexes) to their length.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if isinstance(queryset, QuerySet) and connections[queryset.db].vendor == 'postgresql':
+            plan = json.loads(queryset.explain(format='json'))
+            return int(plan[0]['Plan']['Plan Rows'])
+        return super().count
+
 
 class StandardResultsSetPagination(PageNumberPagination):
     page_size = 10
     page_size_query_param = 'page_size'
     max_page_size = 100
+    count_query_param = 'count'  # ?count=approx uses the planner estimate
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if request.query_params.get(self.count_query_param) == 'approx':
+            self.django_paginator_class = ApproximateCountPaginator
+        return super().paginate_queryset(queryset, request, view)
+
+
+class KeysetPagination(CursorPagination):
+    """Cursor pagination over `(created_at, id)`, no COUNT and no OFFSET scan."""
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = ('-created_at', '-id')
+
+    def get_ordering(self, request, queryset, view):
+        return tuple(getattr(view, 'keyset_ordering', self.ordering))
+
+
+class SelectablePagination(BasePagination):
+    """Page numbers by default, keyset pagination for `?pagination=cursor`.
+
+    Requests that already carry a `cursor` parameter stay in keyset mode, so
+    the `next`/`previous` links work unchanged.
+    """
+    mode_query_param = 'pagination'
+    page_number_class = StandardResultsSetPagination
+    keyset_class = KeysetPagination
+
+    def __init__(self):
+        self.paginator = self.page_number_class()
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if (request.query_params.get(self.mode_query_param) == 'cursor'
+                or self.keyset_class.cursor_query_param in request.query_params):
+            self.paginator = self.keyset_class()
+        return self.paginator.paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        return self.paginator.get_paginated_response(data)
+
+    def get_paginated_response_schema(self, schema):
+        return self.paginator.get_paginated_response_schema(schema)
+
+    def get_schema_operation_parameters(self, view):
+        return self.paginator.get_schema_operation_parameters(view)
+
+    def to_html(self):
+        return self.paginator.to_html()
+
+    def get_results(self, data):
+        return self.paginator.get_results(data)
+
+    @property
+    def display_page_controls(self):
+        return getattr(self.paginator, 'display_page_controls', False)
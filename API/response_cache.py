@@ -0,0 +1,82 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.response import Response
+
+from .cache import get_last_modified, get_version
+from .db_router import allow_replica_reads, reset_replica_reads
+
+HIT_KEY = 'api:response-cache:hits'
+MISS_KEY = 'api:response-cache:misses'
+
+
+def response_cache():
+    return caches[getattr(settings, 'API_RESPONSE_CACHE_ALIAS', 'default')]
+
+
+def _incr(key):
+    cache = response_cache()
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, None)
+        cache.incr(key)
+
+
+def response_cache_stats():
+    cache = response_cache()
+    return {'hits': cache.get(HIT_KEY, 0), 'misses': cache.get(MISS_KEY, 0)}
+
+
+class CachedResponseMixin:
+    """Serve GET payloads from the response cache.
+
+    Entries are keyed by path, the normalized pagination params and the
+    versions of the view's cache namespaces (see `ConditionalGetMixin`), so a
+    write bumps the namespace and every stale entry simply stops being read.
+    Requests with any other query parameter bypass the cache.
+    """
+    cached_query_params = ('page', 'page_size', 'pagination', 'cursor', 'count', 'fields', 'exclude')
+
+    def get_response_cache_key(self, request):
+        params = dict(request.query_params.items())
+        if params.get('page') == '1':
+            params.pop('page')
+        fingerprint = repr((
+            request.get_host(),  # pagination links are absolute URLs
+            request.path,
+            sorted(params.items()),
+            request.accepted_renderer.media_type,
+            [(namespace, get_version(namespace)) for namespace in self.get_cache_namespaces()],
+        ))
+        return 'api:response:' + hashlib.sha1(fingerprint.encode()).hexdigest()
+
+    def changed_within_replica_lag(self):
+        """True when a namespace changed within `REPLICA_STICKY_SECONDS` and replicas are in use."""
+        if not getattr(settings, 'REPLICA_WEIGHTS', None):
+            return False
+        changed = max(get_last_modified(namespace) for namespace in self.get_cache_namespaces())
+        return time.time() - changed <= getattr(settings, 'REPLICA_STICKY_SECONDS', 5) + 1  # whole seconds
+
+    def get(self, request, *args, **kwargs):
+        if not set(request.query_params) <= set(self.cached_query_params):
+            return super().get(request, *args, **kwargs)
+        key = self.get_response_cache_key(request)
+        data = response_cache().get(key)
+        if data is not None:
+            _incr(HIT_KEY)
+            return Response(data)
+        _incr(MISS_KEY)
+        # Data changed within the replication lag may still be old on a replica,
+        # and would be cached under the new version; fill such entries from the primary
+        token = allow_replica_reads(False) if self.changed_within_replica_lag() else None
+        try:
+            response = super().get(request, *args, **kwargs)
+        finally:
+            if token is not None:
+                reset_replica_reads(token)
+        if response.status_code == 200:
+            response_cache().set(key, response.data, getattr(settings, 'API_RESPONSE_CACHE_TIMEOUT', 300))
+        return response
@@ -0,0 +1,142 @@
+"""Meal search over `Meal.search_text`.
+
+PostgreSQL uses the full-text and trigram GIN indexes from migration 0006.
+Other databases fall back to an in-memory inverted index that is rebuilt when
+the `meal-search` cache namespace changes. Both paths support prefix and
+one-typo matching and blend text relevance with the meal's average rating.
+"""
+import heapq
+import re
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+
+from django.db import connections, router
+from django.db.models import BooleanField, FloatField
+from django.db.models.expressions import RawSQL
+
+from .cache import get_version
+from .models import Meal
+
+TOKEN_RE = re.compile(r'\w+')
+DEFAULT_RATING_WEIGHT = 0.2
+MAX_LIMIT = 50
+CANDIDATES_PER_RESULT = 10  # text matches re-ranked with ratings per result slot
+MAX_EXPANSIONS = 100  # per term, for both prefix and typo matches
+
+EXACT, PREFIX, TYPO = 1.0, 0.7, 0.5
+NAME_WEIGHT, TEXT_WEIGHT = 2.0, 1.0
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower())
+
+
+def _deletions(term):
+    return {term[:i] + term[i + 1:] for i in range(len(term))}
+
+
+class InvertedIndex:
+    """token -> {meal_id: weight}, with a deletion map for typo lookups."""
+
+    def __init__(self, rows):
+        self.postings = defaultdict(dict)
+        for meal_id, name, search_text in rows:
+            for token in tokenize(search_text):
+                self.postings[token].setdefault(meal_id, TEXT_WEIGHT)
+            for token in tokenize(name):
+                self.postings[token][meal_id] = NAME_WEIGHT
+        self.tokens = sorted(self.postings)
+        self.deletes = defaultdict(set)
+        for token in self.tokens:
+            if len(token) >= 4:
+                for variant in _deletions(token):
+                    self.deletes[variant].add(token)
+
+    def expand(self, term):
+        """Return {token: factor} for exact, prefix and one-edit matches."""
+        matches = {}
+        start = bisect_left(self.tokens, term)
+        for token in self.tokens[start:start + MAX_EXPANSIONS]:
+            if not token.startswith(term):
+                break
+            matches[token] = EXACT if token == term else PREFIX
+        if len(term) >= 4:
+            typos = set(self.deletes.get(term, ()))
+            for variant in _deletions(term):
+                if variant in self.postings:
+                    typos.add(variant)
+                typos.update(self.deletes.get(variant, ()))
+            for token in sorted(typos)[:MAX_EXPANSIONS]:
+                matches.setdefault(token, TYPO)
+        return matches
+
+    def search(self, terms, limit):
+        """Return the best `limit` (meal_id, text_score) pairs."""
+        scores = defaultdict(float)
+        for term in terms:
+            best = {}
+            for token, factor in self.expand(term).items():
+                for meal_id, weight in self.postings[token].items():
+                    if weight * factor > best.get(meal_id, 0):
+                        best[meal_id] = weight * factor
+            for meal_id, score in best.items():
+                scores[meal_id] += score
+        return heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+
+
+_memory_index = (None, None)
+_memory_index_lock = threading.Lock()
+
+
+def memory_index():
+    global _memory_index
+    version = get_version('meal-search')
+    if _memory_index[0] != version:
+        with _memory_index_lock:
+            if _memory_index[0] != version:
+                rows = Meal.objects.values_list('id', 'name', 'search_text').iterator(chunk_size=5000)
+                _memory_index = (version, InvertedIndex(rows))
+    return _memory_index[1]
+
+
+def _postgres_candidates(query, terms, limit):
+    tsquery = ' & '.join(f'{term}:*' for term in terms)  # terms are \w+ only
+    vector = "to_tsvector('simple'::regconfig, COALESCE(search_text, ''))"
+    matches = RawSQL(
+        f"({vector} @@ to_tsquery('simple', %s) OR %s <%% search_text)", (tsquery, query),
+        output_field=BooleanField(),
+    )
+    score = RawSQL(
+        f"ts_rank({vector}, to_tsquery('simple', %s)) + word_similarity(%s, search_text)", (tsquery, query),
+        output_field=FloatField(),
+    )
+    return list(
+        Meal.objects.filter(matches).annotate(text_score=score)
+        .order_by('-text_score').values_list('id', 'text_score')[:limit]
+    )
+
+
+def search_meals(query, rating_weight=DEFAULT_RATING_WEIGHT, limit=20):
+    """Return [(meal_id, score)] best first; score blends text and rating."""
+    terms = tokenize(query)
+    if not terms:
+        return []
+    candidate_limit = limit * CANDIDATES_PER_RESULT
+    if connections[router.db_for_read(Meal)].vendor == 'postgresql':
+        candidates = _postgres_candidates(' '.join(terms), terms, candidate_limit)
+    else:
+        candidates = memory_index().search(terms, candidate_limit)
+    if not candidates:
+        return []
+
+    # Ratings change with every review, so they are read fresh for the candidates only
+    ratings = dict(
+        Meal.objects.filter(pk__in=[meal_id for meal_id, _ in candidates]).values_list('id', 'rating_avg')
+    )
+    top = max(score for _, score in candidates) or 1
+    ranked = []
+    for meal_id, text_score in candidates:
+        if meal_id in ratings:
+            ranked.append((meal_id, (1 - rating_weight) * text_score / top + rating_weight * ratings[meal_id] / 5))
+    return heapq.nlargest(limit, ranked, key=lambda item: item[1])
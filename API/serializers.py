@@ -1,13 +1,52 @@
 
 from rest_framework import serializers
-from .models import Meal, Category, Review
+from django.utils.text import slugify
+from .models import RESERVED_MEAL_SLUGS, Meal, Category, Review
+from .cache import category_from_index
+from .images import rendition_urls
+from . import histograms
+from .metrics import TimedSerializerMixin
 from django.contrib.auth.models import User
 from django.contrib.auth import get_user_model
 
 
+def sparse_fieldset(serializer_class, request):
+    """Fields picked by `?fields=` and `?exclude=` on a GET, in declaration order.
+
+    None means every field. Writes always use the full serializer.
+    """
+    if request is None or request.method != 'GET':
+        return None
+    params = getattr(request, 'query_params', request.GET)
+    fields, exclude = (
+        [name for name in params.get(param, '').split(',') if name] for param in ('fields', 'exclude')
+    )
+    if not fields and not exclude:
+        return None
+    available = list(serializer_class.Meta.fields)
+    unknown = sorted(set(fields + exclude) - set(available))
+    if unknown:
+        raise serializers.ValidationError({'fields': [f"Unknown fields: {', '.join(unknown)}"]})
+    return [name for name in available if (not fields or name in fields) and name not in exclude]
+
+
+class SparseFieldsMixin:
+    """Serializer limited to a subset of its fields.
+
+    The subset is `fields=[...]` when given, else the request's sparse fieldset.
+    """
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is None:
+            fields = sparse_fieldset(type(self), self.context.get('request'))
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
 
 #user serializers
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = get_user_model()
         fields = ('username', 'email', 'password', 'phone_number', 'date_of_birth')
@@ -15,7 +54,7 @@ class UserSerializer(serializers.ModelSerializer):
 
 
 # ✅ CATEGORY SERIALIZER
-class CategorySerializer(serializers.ModelSerializer):
+class CategorySerializer(SparseFieldsMixin, TimedSerializerMixin, serializers.ModelSerializer):
     total_meals = serializers.SerializerMethodField()
 
 
@@ -25,26 +64,65 @@ class CategorySerializer(serializers.ModelSerializer):
         read_only_fields = ['slug']
     def get_total_meals(self, obj):
         """هذه الدالة تُعيد عدد الوجبات المرتبطة بكل تصنيف"""
+        if hasattr(obj, 'total_meals'):
+            return obj.total_meals  # annotated by the view or the category index
         return obj.meals.count()  # 👈 `meals` هو related_name في `Meal.category`
+
+
+class CachedCategorySlugField(serializers.SlugRelatedField):
+    """SlugRelatedField that resolves categories from the cached category index."""
+
+    def to_internal_value(self, data):
+        category = category_from_index(str(data))
+        if category is None:
+            self.fail('does_not_exist', slug_name=self.slug_field, value=str(data))
+        return category
+
 # ✅ MEAL SERIALIZER
-class MealSerializer(serializers.ModelSerializer):
+class MealSerializer(SparseFieldsMixin, TimedSerializerMixin, serializers.ModelSerializer):
     category = serializers.StringRelatedField(read_only=True)  # عرض اسم الفئة
-    category_slug = serializers.SlugRelatedField(
+    category_slug = CachedCategorySlugField(
         queryset=Category.objects.all(), slug_field='slug', source='category'
     )  # حفظ التصنيف باستخدام `slug` بدلًا من `id`
-    
+    no_of_reviews = serializers.IntegerField(source='review_count', read_only=True)
+    average_rating = serializers.ReadOnlyField()  # computed from the stored totals, no query
+    image_renditions = serializers.SerializerMethodField()
 
     class Meta:
         model = Meal
         fields = [
-            'slug', 'name', 'description', 'price', 'image', 'category_slug','no_of_reviews', 'average_rating',
+            'slug', 'name', 'description', 'price', 'image', 'image_renditions', 'category_slug','no_of_reviews', 'average_rating',
             'category', 'created_at',
         ]
         read_only_fields = ['slug',  'created_at']
 
+    def validate_name(self, value):
+        if self.instance is None and slugify(value) in RESERVED_MEAL_SLUGS:
+            raise serializers.ValidationError(f"'{value}' is reserved, its URL would clash with an API route.")
+        return value
+
+    def get_image_renditions(self, obj):
+        """Resized JPEG/WebP variants per rendition, like an HTML srcset."""
+        request = self.context.get('request')
+        return rendition_urls(obj.image_renditions, request.build_absolute_uri if request else None)
+
+
+class MealDetailSerializer(MealSerializer):
+    """MealSerializer plus the rating histogram, median and percentiles."""
+    rating_distribution = serializers.SerializerMethodField()
+
+    class Meta(MealSerializer.Meta):
+        fields = MealSerializer.Meta.fields + ['rating_distribution']
+
+    def get_rating_distribution(self, obj):
+        histogram = getattr(obj, 'rating_histogram', None)
+        if histogram is None:
+            histogram = histograms.histograms_for([obj.pk])[obj.pk]
+        return histograms.summarize(histogram)
+
 
 # ✅ REVIEW SERIALIZER
-class ReviewSerializer(serializers.ModelSerializer):
+class ReviewSerializer(SparseFieldsMixin, TimedSerializerMixin, serializers.ModelSerializer):
     user = serializers.ReadOnlyField(source='user.username')  # عرض اسم المستخدم فقط
     meal_slug = serializers.SlugRelatedField(
         queryset=Meal.objects.all(),
@@ -1,10 +1,232 @@
+from decimal import Decimal
+
 from django.conf import settings
+from django.contrib.auth import get_user_model
 from django.contrib.auth.models import User
 from rest_framework.authtoken.models import Token
-from django.db.models.signals import post_save
+from django.db.backends.signals import connection_created
+from django.db.models import QuerySet
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
+from django.utils.dateparse import parse_datetime
+
+from .authentication import token_cache
+from .cache import bump_version, meal_namespace
+from .images import schedule_renditions
+from . import histograms, jobs, leaderboards, metrics
+from .models import Meal, Category, Review, LeaderboardEntry
+
+@receiver(connection_created)
+def record_request_queries(sender, connection, **kwargs):
+    metrics.install_query_recorder(connection)
+
+
+@jobs.task('create-auth-token')
+def create_token(user_id):
+    # get_or_create: registration and token requests may have made it already
+    if get_user_model().objects.filter(pk=user_id).exists():
+        Token.objects.get_or_create(user_id=user_id)
+
 
 @receiver(post_save, sender=settings.AUTH_USER_MODEL)
 def create_auth_token(sender, instance=None, created=False, **kwargs):
     if created:
-        Token.objects.create(user=instance)
+        jobs.enqueue('create-auth-token', instance.pk, key=f'create-auth-token:{instance.pk}')
+
+
+@receiver([post_save, post_delete], sender=settings.AUTH_USER_MODEL)
+def invalidate_cached_user_tokens(sender, instance=None, **kwargs):
+    token_cache.delete_user(instance.pk)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def invalidate_reviews_of_renamed_user(sender, instance=None, created=False, raw=False, update_fields=None, **kwargs):
+    # Review lists and details show the reviewer's username
+    if created or raw or (update_fields is not None and 'username' not in update_fields):
+        return
+    if getattr(instance, '_loaded_username', None) != instance.username:
+        slugs = Meal.objects.filter(reviews__user=instance).values_list('slug', flat=True)
+        bump_version(*(meal_namespace(slug) for slug in slugs))
+    instance._loaded_username = instance.username
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_cached_token(sender, instance=None, **kwargs):
+    token_cache.delete_user(instance.user_id)
+
+
+def _remember_review_state(review):
+    review._loaded_meal_id = review.meal_id
+    review._loaded_rating = Decimal(str(review.rating))
+
+
+def _review_changes(instance, created):
+    """Return [(meal_id, rating, +1 | -1)] for a saved review, or None if unknown.
+
+    An edit is described as removing the old review and adding the new one.
+    """
+    rating = Decimal(str(instance.rating))
+    if created:
+        return [(instance.meal_id, rating, 1)]
+    if not hasattr(instance, '_loaded_rating'):
+        return None
+    if instance._loaded_meal_id != instance.meal_id or instance._loaded_rating != rating:
+        return [(instance._loaded_meal_id, instance._loaded_rating, -1), (instance.meal_id, rating, 1)]
+    return []
+
+
+def apply_review_changes(changes):
+    """Shift the Meal totals now; queue the histogram and leaderboard updates.
+
+    `changes` is [(meal_id, rating, +1 | -1, review created_at)]; each meal's
+    totals are updated once and a single job covers them all. Bulk writes
+    that skip the Review signals call this directly.
+    """
+    if not changes:
+        return
+    per_meal = {}
+    for meal_id, rating, sign, _ in changes:
+        count, total = per_meal.get(meal_id, (0, Decimal(0)))
+        per_meal[meal_id] = (count + sign, total + sign * rating)
+    for meal_id, (count_delta, rating_delta) in per_meal.items():
+        Meal.apply_review_delta(meal_id, count_delta, rating_delta)
+    jobs.enqueue('review-aggregates', [
+        [meal_id, str(rating), sign, created_at.isoformat()] for meal_id, rating, sign, created_at in changes
+    ])
+
+
+@jobs.task('review-aggregates')
+def update_review_aggregates(changes, created_at=None):
+    """Apply review changes to the histograms and leaderboards of meals that still exist.
+
+    A change is [meal_id, rating, sign], or [meal_id, rating, sign, created_at]
+    when the reviews of one job were created at different times.
+    """
+    meals = dict(Meal.objects.filter(pk__in={change[0] for change in changes}).values_list('pk', 'slug'))
+    per_bucket = {}
+    for meal_id, rating, sign, *when in changes:
+        if meal_id not in meals:
+            continue
+        histograms.apply_delta(meal_id, Decimal(rating), sign)
+        key = (meal_id, when[0] if when else created_at)
+        count, total = per_bucket.get(key, (0, Decimal(0)))
+        per_bucket[key] = (count + sign, total + sign * Decimal(rating))
+    # reads the Meal totals, which were updated with the write
+    leaderboards.apply_review_changes([
+        (meal_id, parse_datetime(when), count_delta, rating_delta)
+        for (meal_id, when), (count_delta, rating_delta) in per_bucket.items()
+    ])
+    bump_version(*(meal_namespace(slug) for slug in meals.values()))  # the detail shows the histogram
+
+
+@jobs.task('review-rebuild')
+def rebuild_review_aggregates(meal_id):
+    histograms.rebuild([meal_id])  # bumps the meal's namespace
+    leaderboards.rebuild_buckets([meal_id])
+    leaderboards.refresh_entries([meal_id])
+
+
+@receiver(post_save, sender=Review)
+def apply_review_to_meal_totals(sender, instance=None, created=False, raw=False, **kwargs):
+    """Keep the stored Meal totals in step with review writes; histograms and leaderboards follow via jobs."""
+    if raw:
+        return
+    changes = _review_changes(instance, created)
+    if changes is None:
+        # The previous values are unknown, recount this meal from scratch
+        Meal.rebuild_rating_totals([instance.meal_id])
+        jobs.enqueue('review-rebuild', instance.meal_id)
+    else:
+        apply_review_changes([(*change, instance.created_at) for change in changes])
+    _remember_review_state(instance)
+
+
+def _deleted_along_with(origin, model):
+    """True when a delete started from a `model` instance or queryset."""
+    return isinstance(origin, model) or (isinstance(origin, QuerySet) and issubclass(origin.model, model))
+
+
+@receiver(post_delete, sender=Review)
+def remove_review_from_meal_totals(sender, instance=None, origin=None, **kwargs):
+    if _deleted_along_with(origin, Meal):
+        return  # the meal goes too, with its histogram, buckets and entries
+    meal_id = getattr(instance, '_loaded_meal_id', instance.meal_id)
+    rating = getattr(instance, '_loaded_rating', None)
+    if rating is None:
+        rating = instance.rating
+    change = (meal_id, Decimal(str(rating)), -1, instance.created_at)
+    if _deleted_along_with(origin, get_user_model()):
+        # Collected on the delete's origin and applied per meal once the users are gone
+        origin.__dict__.setdefault('_deleted_reviews', []).append(change)
+        return
+    apply_review_changes([change])
+
+
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def remove_deleted_users_reviews(sender, instance=None, origin=None, **kwargs):
+    """One total update per meal and one job for the reviews deleted with users.
+
+    The reviews are deleted, and their signals sent, before their users.
+    """
+    changes = origin.__dict__.pop('_deleted_reviews', None) if origin is not None else None
+    if not changes:
+        return
+    apply_review_changes(changes)
+    slugs = Meal.objects.filter(pk__in={meal_id for meal_id, *_ in changes}).values_list('slug', flat=True)
+    bump_version('meals', *(meal_namespace(slug) for slug in slugs))
+
+
+@receiver([post_save, post_delete], sender=Category)
+def invalidate_category_index(sender, **kwargs):
+    # Category rows and per-category meal counts live in the cached index
+    bump_version('categories')
+
+
+@receiver(post_save, sender=Category)
+def refresh_category_search_text(sender, instance=None, created=False, raw=False, **kwargs):
+    # Meal.search_text embeds the category name
+    if created or raw:
+        return
+    meals = list(instance.meals.only('name', 'description'))
+    for meal in meals:
+        meal.search_text = Meal.build_search_text(meal.name, meal.description, instance.name)
+    Meal.objects.bulk_update(meals, ['search_text'], batch_size=1000)
+    bump_version('meal-search')
+
+
+@receiver(post_save, sender=Meal)
+def move_leaderboard_entries(sender, instance=None, created=False, raw=False, **kwargs):
+    # Entries carry the meal's category for the per-category rankings
+    if not created and not raw:
+        LeaderboardEntry.objects.filter(meal=instance).exclude(category_id=instance.category_id).update(
+            category_id=instance.category_id,
+        )
+
+
+@receiver([post_save, post_delete], sender=Meal)
+def invalidate_meal_caches(sender, instance=None, **kwargs):
+    # Meal counts are part of the category index as well
+    bump_version('meals', meal_namespace(instance.slug), 'categories', 'meal-search')
+
+
+@receiver([post_save, post_delete], sender=Review)
+def invalidate_review_caches(sender, instance=None, raw=False, origin=None, **kwargs):
+    # Review writes change the stored totals shown on meal lists and details
+    if raw or _deleted_along_with(origin, Meal) or _deleted_along_with(origin, get_user_model()):
+        return  # the meal's and the users' own delete handlers cover these
+    if Review.meal.is_cached(instance):
+        slug = instance.meal.slug
+    else:
+        slug = Meal.objects.filter(pk=instance.meal_id).values_list('slug', flat=True).first()
+    bump_version('meals', meal_namespace(slug))
+
+
+@receiver(post_save, sender=Meal)
+def render_meal_image(sender, instance=None, created=False, raw=False, **kwargs):
+    if raw:
+        return
+    image = instance.image.name or None
+    previous = None if created else getattr(instance, '_loaded_image', image)
+    if image != (previous or None):
+        schedule_renditions(instance.pk, image)
+    instance._loaded_image = image
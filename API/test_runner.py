@@ -0,0 +1,15 @@
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class InlineJobsTestRunner(DiscoverRunner):
+    """Runs queued jobs inline (`API_JOBS_SYNC`), so tests see side effects at once."""
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._inline_jobs = override_settings(API_JOBS_SYNC=True)
+        self._inline_jobs.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._inline_jobs.disable()
+        super().teardown_test_environment(**kwargs)
@@ -1,3 +1,1275 @@
-from django.test import TestCase
+import csv
+import importlib
+import json
+import os
+import re
+import tempfile
+import time
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from itertools import count
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.apps import apps as django_apps
+from django.contrib.auth import get_user_model
+from django.core.cache import cache, caches
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import DatabaseError, connections
+from django.forms import modelform_factory
+from django.conf import settings
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from rest_framework import generics
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory, force_authenticate
+
+from .models import (
+    RESERVED_MEAL_SLUGS, Meal, Category, Review, Job, LeaderboardEntry, MealRatingBucket, RatingHistogramBin,
+)
+from . import benchmark, histograms, jobs, leaderboards, metrics
+from .filters import ORDERINGS
+from .images import build_renditions
+from .importers import UPSERT, import_reviews
+from .db_router import ReplicaRouter, allow_replica_reads, reset_replica_reads
+from .authentication import TokenUserCache, token_cache
+from .cache import category_index, meal_namespace
+from .response_cache import response_cache_stats
+from .serializers import MealSerializer, ReviewSerializer
+from .views import MealListCreateView, ReviewListCreateView
+from .throttling import MemoryCounterStore, SlidingWindowThrottle, counter_store, throttle_stats
+
+
+_phone_numbers = count(10000000000)
+
+
+def make_user(username):
+    return get_user_model().objects.create_user(
+        username=username,
+        email=f'{username}@example.com',
+        password=None,
+        phone_number=f'0{next(_phone_numbers)}',
+    )
+
+
+class MealRatingTotalsTests(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name='Pasta')
+        self.meal = Meal.objects.create(name='Lasagna', description='Baked', price='9.50', category=self.category)
+        self.other = Meal.objects.create(name='Penne', description='Boiled', price='7.00', category=self.category)
+        self.alice = make_user('alice')
+        self.bob = make_user('bob')
+
+    def test_totals_follow_create_update_delete(self):
+        review = Review.objects.create(user=self.alice, meal=self.meal, rating=4)
+        Review.objects.create(user=self.bob, meal=self.meal, rating=3)
+        self.meal.refresh_from_db()
+        self.assertEqual(self.meal.no_of_reviews(), 2)
+        self.assertEqual(self.meal.average_rating(), Decimal('3.5'))
+
+        review.rating = Decimal('5.0')
+        review.save()
+        self.meal.refresh_from_db()
+        self.assertEqual(self.meal.rating_sum, Decimal('8.0'))
+
+        review = Review.objects.get(pk=review.pk)
+        review.meal = self.other
+        review.save()
+        self.meal.refresh_from_db()
+        self.other.refresh_from_db()
+        self.assertEqual((self.meal.review_count, self.meal.rating_sum), (1, Decimal('3.0')))
+        self.assertEqual((self.other.review_count, self.other.rating_sum), (1, Decimal('5.0')))
+
+        Review.objects.filter(meal=self.other).delete()
+        self.other.refresh_from_db()
+        self.assertEqual(self.other.average_rating(), 0)
+
+    def test_rebuild_command_recounts_from_reviews(self):
+        Review.objects.create(user=self.alice, meal=self.meal, rating=2)
+        Meal.objects.update(review_count=0, rating_sum=0)
+        call_command('rebuild_meal_ratings', stdout=StringIO())
+        self.meal.refresh_from_db()
+        self.assertEqual((self.meal.review_count, self.meal.rating_sum), (1, Decimal('2.0')))
+
+
+class MealListQueryCountTests(TestCase):
+    def setUp(self):
+        caches['responses'].clear()
+        self.client = APIClient()
+        self.client.force_authenticate(make_user('reader'))
+        category = Category.objects.create(name='Soups')
+        reviewer = make_user('critic')
+        for i in range(100):
+            meal = Meal.objects.create(name=f'Soup {i}', description='Hot', price='3.00', category=category)
+            Review.objects.create(user=reviewer, meal=meal, rating=i % 6)
+
+    def test_meal_page_uses_constant_queries(self):
+        # one COUNT for the paginator and one SELECT for the page
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/meals/', {'page_size': 100})
+        self.assertEqual(len(response.data['results']), 100)
+        first = response.data['results'][0]
+        self.assertEqual(first['no_of_reviews'], 1)
+
+    def test_meal_detail_uses_constant_queries(self):
+        # the meal row and its rating histogram
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/meals/soup-5/')
+        self.assertEqual(response.data['average_rating'], Decimal('5.0'))
+
+
+class CategoryIndexCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(make_user('reader'))
+        self.category = Category.objects.create(name='Desserts')
+        Meal.objects.create(name='Kunafa', description='Sweet', price='4.00', category=self.category)
+
+    def test_listing_is_served_from_cache_after_first_hit(self):
+        self.client.get('/api/categories/')
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/categories/')
+        self.assertEqual(response.data['results'], [{'name': 'Desserts', 'slug': 'desserts', 'total_meals': 1}])
+
+    def test_meal_writes_invalidate_counts(self):
+        self.client.get('/api/categories/')
+        Meal.objects.create(name='Basbousa', description='Sweet', price='3.00', category=self.category)
+        response = self.client.get('/api/categories/desserts/')
+        self.assertEqual(response.data['total_meals'], 2)
+
+    def test_detail_update_refreshes_index(self):
+        response = self.client.patch('/api/categories/desserts/', {'name': 'Sweets'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Category.objects.get(pk=self.category.pk).name, 'Sweets')
+        self.assertEqual(category_index()['desserts']['name'], 'Sweets')
+
+    def test_meal_category_slug_resolves_from_cache(self):
+        self.client.get('/api/categories/')
+        with self.assertNumQueries(0):
+            category = MealSerializer().fields['category_slug'].to_internal_value('desserts')
+        self.assertEqual(category.pk, self.category.pk)
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(make_user('reader'))
+        self.meal = Meal.objects.create(name='Falafel', description='Fried', price='1.50')
+        for i in range(25):
+            Review.objects.create(user=make_user(f'user{i}'), meal=self.meal, rating=i % 6)
+
+    def test_cursor_mode_walks_every_review_once_without_count(self):
+        seen = []
+        url = '/api/meals/falafel/reviews/?pagination=cursor&page_size=10'
+        while url:
+            with self.assertNumQueries(1):
+                response = self.client.get(url)
+            self.assertNotIn('count', response.data)
+            seen.extend(review['id'] for review in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(len(seen), 25)
+        self.assertEqual(seen, sorted(seen, reverse=True))
+
+    def test_page_number_mode_is_still_the_default(self):
+        response = self.client.get('/api/meals/falafel/reviews/', {'count': 'approx'})
+        self.assertEqual(response.data['count'], 25)
+        self.assertEqual(len(response.data['results']), 10)
+
+    def test_approximate_count_of_a_list_is_its_length(self):
+        for i in range(3):
+            Category.objects.create(name=f'Category {i}')
+        response = self.client.get('/api/categories/', {'count': 'approx'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 3)
+
+
+class CachedTokenAuthenticationTests(TestCase):
+    def setUp(self):
+        token_cache.clear()
+        self.user = make_user('member')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.user.auth_token.key}')
+
+    def test_warm_cache_costs_no_auth_queries(self):
+        self.client.get('/api/users/')
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/users/')
+        self.assertEqual(response.data['username'], 'member')
+
+    def test_deleted_token_is_rejected(self):
+        self.client.get('/api/users/')
+        self.user.auth_token.delete()
+        self.assertEqual(self.client.get('/api/users/').status_code, 401)
+
+    def test_user_update_refreshes_cached_user(self):
+        self.client.get('/api/users/')
+        response = self.client.put('/api/users/me/', {
+            'username': 'member', 'email': 'new@example.com',
+            'password': 'x', 'phone_number': self.user.phone_number,
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get('/api/users/').data['email'], 'new@example.com')
+
+    def test_invalidation_reaches_other_processes(self):
+        other_process = TokenUserCache()  # its own LRU, the same shared cache
+        key = self.user.auth_token.key
+        other_process.set(key, self.user, self.user.auth_token)
+        self.assertIsNotNone(other_process.get(key))
+        self.user.auth_token.delete()
+        self.assertIsNone(other_process.get(key))
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(make_user('reader'))
+        self.meal = Meal.objects.create(name='Koshari', description='Mixed', price='2.00')
+
+    def test_unchanged_meal_list_answers_304_without_queries(self):
+        response = self.client.get('/api/meals/')
+        etag = response['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/meals/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        last_modified = self.client.get('/api/meals/')['Last-Modified']
+        response = self.client.get('/api/meals/', HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+    def test_new_review_changes_review_list_etag(self):
+        url = '/api/meals/koshari/reviews/'
+        etag = self.client.get(url)['ETag']
+        Review.objects.create(user=make_user('critic'), meal=self.meal, rating=5)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_username_change_changes_review_list_etag(self):
+        critic = make_user('critic')
+        Review.objects.create(user=critic, meal=self.meal, rating=5)
+        url = '/api/meals/koshari/reviews/'
+        etag = self.client.get(url)['ETag']
+        self.client.force_authenticate(critic)
+        response = self.client.put('/api/users/me/', {
+            'username': 'renamed', 'email': critic.email, 'password': 'x', 'phone_number': critic.phone_number,
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][0]['user'], 'renamed')
+
+        etag = response['ETag']
+        critic.refresh_from_db()
+        critic.last_name = 'Other'
+        critic.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_query_params_are_part_of_the_etag(self):
+        etag = self.client.get('/api/meals/')['ETag']
+        response = self.client.get('/api/meals/', {'page_size': 5}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+
+class ResponseCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        caches['responses'].clear()
+        self.client = APIClient()
+        self.client.force_authenticate(make_user('reader'))
+        self.meal = Meal.objects.create(name='Molokhia', description='Green', price='2.50')
+
+    def test_repeated_reads_hit_the_cache(self):
+        first = self.client.get('/api/meals/', {'page': 1})
+        with self.assertNumQueries(0):
+            second = self.client.get('/api/meals/')
+        self.assertEqual(first.data, second.data)
+        self.assertEqual(response_cache_stats(), {'hits': 1, 'misses': 1})
+
+    def test_review_write_invalidates_meal_detail(self):
+        self.assertEqual(self.client.get('/api/meals/molokhia/').data['no_of_reviews'], 0)
+        Review.objects.create(user=make_user('critic'), meal=self.meal, rating=4)
+        self.assertEqual(self.client.get('/api/meals/molokhia/').data['no_of_reviews'], 1)
+
+    def test_rating_rebuild_invalidates_meal_detail(self):
+        Review.objects.create(user=make_user('critic'), meal=self.meal, rating=4)
+        Meal.objects.filter(pk=self.meal.pk).update(rating_sum=1, rating_avg=1.0)  # drifted
+        response = self.client.get('/api/meals/molokhia/')
+        self.assertEqual(response.data['average_rating'], Decimal('1.0'))
+        call_command('rebuild_meal_ratings', stdout=StringIO())
+        response = self.client.get('/api/meals/molokhia/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['average_rating'], Decimal('4.0'))
+
+    def test_unknown_params_bypass_the_cache(self):
+        self.client.get('/api/meals/', {'other': 1})
+        self.assertEqual(response_cache_stats(), {'hits': 0, 'misses': 0})
+
+
+class BulkReviewImportTests(TestCase):
+    def setUp(self):
+        self.admin = make_user('admin')
+        self.admin.is_staff = True
+        self.admin.save()
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+        self.meal = Meal.objects.create(name='Shawarma', description='Wrap', price='3.00')
+        self.users = [make_user(f'partner{i}') for i in range(3)]
+
+    def rows(self, rating):
+        return [{'user': user.username, 'meal_slug': 'shawarma', 'rating': rating} for user in self.users]
+
+    def test_json_import_skips_existing_and_reports_errors(self):
+        Review.objects.create(user=self.users[0], meal=self.meal, rating=1)
+        rows = self.rows(4) + [{'user': 'ghost', 'meal_slug': 'shawarma', 'rating': 9}]
+        response = self.client.post('/api/reviews/bulk/', rows, format='json')
+        self.assertEqual(response.data['created'], 2)
+        self.assertEqual(response.data['skipped'], 1)
+        self.assertEqual([error['row'] for error in response.data['errors']], [3])
+        self.meal.refresh_from_db()
+        self.assertEqual((self.meal.review_count, self.meal.rating_sum), (3, Decimal('9.0')))
+
+    def test_ndjson_upsert_updates_existing_reviews(self):
+        Review.objects.create(user=self.users[0], meal=self.meal, rating=1)
+        body = '\n'.join(json.dumps(row) for row in self.rows('2.5'))
+        response = self.client.post(
+            '/api/reviews/bulk/?on_conflict=upsert', body, content_type='application/x-ndjson',
+        )
+        self.assertEqual((response.data['created'], response.data['updated']), (2, 1))
+        self.meal.refresh_from_db()
+        self.assertEqual(self.meal.average_rating(), Decimal('2.5'))
+
+    def test_import_applies_deltas_instead_of_rebuilding(self):
+        Meal.objects.create(name='Koshari', description='Rice', price='2.00')
+        Review.objects.create(user=self.users[0], meal=self.meal, rating=1)
+        Review.objects.create(user=self.users[1], meal=self.meal, rating=Decimal('2.5'))
+        rows = self.rows('2.5') + [{'user': user.username, 'meal_slug': 'koshari', 'rating': '4.0'} for user in self.users[:2]]
+        with mock.patch('API.histograms.rebuild') as rebuild, mock.patch('API.leaderboards.rebuild_buckets') as rebuild_buckets:
+            result = import_reviews(rows, on_conflict=UPSERT, batch_size=2)
+        self.assertEqual((result['created'], result['updated']), (3, 2))
+        self.assertFalse(rebuild.called or rebuild_buckets.called)
+
+        def state():
+            meals = Meal.objects.order_by('pk')
+            return (
+                list(meals.values_list('review_count', 'rating_sum', 'rating_avg')),
+                histograms.histograms_for(list(meals.values_list('pk', flat=True))),
+                sorted(MealRatingBucket.objects.values_list('meal_id', 'hour', 'review_count', 'rating_sum')),
+            )
+        imported = state()
+        Meal.rebuild_rating_totals()
+        histograms.rebuild()
+        leaderboards.rebuild_buckets()
+        self.assertEqual(imported, state())
+
+    def test_import_requires_staff(self):
+        self.client.force_authenticate(self.users[0])
+        response = self.client.post('/api/reviews/bulk/', self.rows(4), format='json')
+        self.assertEqual(response.status_code, 403)
+
+    def test_command_imports_ndjson_file(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.ndjson', delete=False) as handle:
+            handle.write('\n'.join(json.dumps(row) for row in self.rows(5)))
+        call_command('import_reviews', handle.name, stdout=StringIO())
+        os.unlink(handle.name)
+        self.assertEqual(Review.objects.filter(meal=self.meal).count(), 3)
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.admin = make_user('analyst')
+        self.admin.is_staff = True
+        self.admin.save()
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+        category = Category.objects.create(name='Grill')
+        self.meal = Meal.objects.create(name='Kofta', description='Grilled', price='6.5', category=category)
+        Review.objects.create(user=self.admin, meal=self.meal, rating=Decimal('4.5'), comment='جميل')
+
+    def test_ndjson_rows_match_serializers(self):
+        reviews = self.client.get('/api/export/reviews/')
+        lines = b''.join(reviews.streaming_content).decode().splitlines()
+        review = Review.objects.get()
+        self.assertEqual([json.loads(line) for line in lines], [json.loads(json.dumps(ReviewSerializer(review).data))])
+
+        meals = self.client.get('/api/export/meals/')
+        row = json.loads(b''.join(meals.streaming_content))
+        self.meal.refresh_from_db()
+        self.assertEqual(row, json.loads(json.dumps(MealSerializer(self.meal).data, default=float)))
+
+    def test_csv_and_since_filter(self):
+        response = self.client.get('/api/export/reviews/', {'output': 'csv', 'since': '2999-01-01T00:00:00Z'})
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertEqual(b''.join(response.streaming_content).decode().splitlines(),
+                         [','.join(ReviewSerializer.Meta.fields)])
+
+    def test_csv_encodes_nested_values_as_json(self):
+        renditions = {'card': {'width': 480, 'jpeg': 'meals/renditions/kofta/card.jpg'}}
+        Meal.objects.filter(pk=self.meal.pk).update(image_renditions=renditions)
+        response = self.client.get('/api/export/meals/', {'output': 'csv'})
+        [row] = csv.DictReader(b''.join(response.streaming_content).decode().splitlines())
+        card = json.loads(row['image_renditions'])['card']
+        self.assertEqual(card['width'], 480)
+        self.assertTrue(card['jpeg'].endswith('meals/renditions/kofta/card.jpg'), card['jpeg'])
+
+    def test_command_writes_ndjson(self):
+        out = StringIO()
+        call_command('export_data', 'meals', stdout=out)
+        self.assertEqual(json.loads(out.getvalue())['slug'], 'kofta')
+
+
+def make_jpeg(width, height):
+    buffer = BytesIO()
+    image = Image.new('RGB', (width, height), 'orange')
+    exif = Image.Exif()
+    exif[0x0112] = 6  # orientation: rotate 90°
+    image.save(buffer, 'JPEG', exif=exif)
+    return SimpleUploadedFile('photo.jpg', buffer.getvalue(), content_type='image/jpeg')
+
+
+class MealImageRenditionTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        override = override_settings(MEDIA_ROOT=self.media.name)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def test_upload_renders_downscaled_variants_without_exif(self):
+        meal = Meal.objects.create(name='Fatta', description='Rice', price='5.00', image=make_jpeg(2400, 1200))
+        meal.refresh_from_db()
+        self.assertEqual(set(meal.image_renditions), {'thumbnail', 'card', 'full'})
+        card = meal.image_renditions['card']
+        # the EXIF rotation is applied, so the 2400x1200 upload becomes portrait
+        self.assertEqual(card['width'], 480)
+        with Image.open(os.path.join(self.media.name, card['jpeg'])) as rendered:
+            self.assertEqual(rendered.size, (480, 960))
+            self.assertFalse(rendered.getexif())
+        with Image.open(os.path.join(self.media.name, meal.image_renditions['thumbnail']['webp'])) as rendered:
+            self.assertEqual((rendered.format, rendered.width), ('WEBP', 160))
+
+        data = MealSerializer(meal).data
+        self.assertTrue(data['image_renditions']['card']['webp'].endswith('card.webp'))
+
+    @override_settings(API_JOBS_SYNC=False)
+    def test_unchanged_image_is_not_rendered_again(self):
+        meal = Meal.objects.create(name='Fatta', description='Rice', price='5.00', image=make_jpeg(100, 100))
+        meal = Meal.objects.get(pk=meal.pk)
+        meal.price = '6.00'
+        meal.save()
+        self.assertEqual(Job.objects.filter(task='meal-renditions').count(), 1)
+        jobs.work(burst=True)
+        meal.refresh_from_db()
+        self.assertEqual(set(meal.image_renditions), {'thumbnail', 'card', 'full'})
+
+    def test_old_renditions_are_replaced_only_after_a_successful_render(self):
+        meal = Meal.objects.create(name='Fatta', description='Rice', price='5.00', image=make_jpeg(100, 100))
+        meal.refresh_from_db()
+        old = meal.image_renditions
+        old_card = os.path.join(self.media.name, old['card']['jpeg'])
+
+        with mock.patch('API.images.render_image', side_effect=OSError('corrupt')):
+            with self.assertRaises(OSError):
+                build_renditions(meal.pk)
+        meal.refresh_from_db()
+        self.assertEqual(meal.image_renditions, old)
+        self.assertTrue(os.path.exists(old_card))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            new = build_renditions(meal.pk)
+        meal.refresh_from_db()
+        self.assertEqual(meal.image_renditions, new)
+        self.assertTrue(os.path.exists(os.path.join(self.media.name, new['card']['jpeg'])))
+        self.assertFalse(os.path.exists(old_card))
+
+
+class MealSearchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(make_user('reader'))
+        grill = Category.objects.create(name='Grill')
+        self.kebab = Meal.objects.create(name='Chicken Kebab', description='Skewers', price='7.00', category=grill)
+        self.shish = Meal.objects.create(name='Shish Tawook', description='Chicken breast', price='6.00', category=grill)
+        Meal.objects.create(name='Lentil Soup', description='Warm', price='2.00')
+
+    def search(self, q, **params):
+        response = self.client.get('/api/meals/search/', {'q': q, **params})
+        return [result['slug'] for result in response.data['results']]
+
+    def test_name_matches_rank_above_description_matches(self):
+        self.assertEqual(self.search('chicken', rating_weight=0), ['chicken-kebab', 'shish-tawook'])
+
+    def test_prefix_typo_and_category_matching(self):
+        self.assertEqual(self.search('keb'), ['chicken-kebab'])
+        self.assertEqual(self.search('soupz'), ['lentil-soup'])
+        self.assertEqual(sorted(self.search('chikcen')), ['chicken-kebab', 'shish-tawook'])  # transposition
+        self.assertEqual(self.search('chiken', rating_weight=0), ['chicken-kebab', 'shish-tawook'])
+        self.assertEqual(sorted(self.search('grill')), ['chicken-kebab', 'shish-tawook'])
+
+    def test_rating_weight_reorders_results(self):
+        Review.objects.create(user=make_user('critic'), meal=self.shish, rating=5)
+        self.assertEqual(self.search('chicken', rating_weight=0.9), ['shish-tawook', 'chicken-kebab'])
+
+    def test_index_follows_meal_and_category_writes(self):
+        self.search('chicken')
+        Meal.objects.create(name='Chicken Fatta', description='Rice', price='5.00')
+        self.assertIn('chicken-fatta', self.search('chicken'))
+        grill = Category.objects.get(name='Grill')
+        grill.name = 'Charcoal'
+        grill.save()
+        self.assertEqual(sorted(self.search('charcoal')), ['chicken-kebab', 'shish-tawook'])
+
+    def test_results_are_the_serializer_output_plus_score(self):
+        Review.objects.create(user=make_user('critic'), meal=self.shish, rating=Decimal('4.5'))
+        response = self.client.get('/api/meals/search/', {'q': 'chicken'})
+        expected = []
+        for result in response.data['results']:
+            meal = Meal.objects.get(slug=result['slug'])
+            expected.append({**MealSerializer(meal, context={'request': response.wsgi_request}).data, 'score': result['score']})
+        self.assertEqual(len(expected), 2)
+        self.assertEqual(response.content, JSONRenderer().render({'query': 'chicken', 'results': expected}))
+
+    def test_invalid_parameters_are_rejected(self):
+        response = self.client.get('/api/meals/search/', {'q': 'soup', 'rating_weight': 2})
+        self.assertEqual(response.status_code, 400)
+
+
+class MealFilterTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        caches['responses'].clear()
+        self.client = APIClient()
+        self.client.force_authenticate(make_user('reader'))
+        grill = Category.objects.create(name='Grill')
+        soups = Category.objects.create(name='Soups')
+        critic = make_user('critic')
+        for name, price, category, rating in [
+            ('Kofta', '8.00', grill, 5), ('Kebab', '12.00', grill, 3), ('Liver', '4.00', grill, 4),
+            ('Lentil', '2.00', soups, 5),
+        ]:
+            meal = Meal.objects.create(name=name, description='-', price=price, category=category)
+            Review.objects.create(user=critic, meal=meal, rating=rating)
+
+    def slugs(self, **params):
+        response = self.client.get('/api/meals/', params)
+        self.assertEqual(response.status_code, 200, response.data)
+        return [meal['slug'] for meal in response.data['results']]
+
+    def test_top_rated_in_category(self):
+        self.assertEqual(self.slugs(category='grill', ordering='rating'), ['kofta', 'liver', 'kebab'])
+        self.assertEqual(self.slugs(category='grill', min_rating=4), ['kofta', 'liver'])
+
+    def test_price_range_sorted_by_price(self):
+        self.assertEqual(self.slugs(category='grill', max_price='10'), ['liver', 'kofta'])
+        self.assertEqual(self.slugs(min_price='3', max_price='10', ordering='-price'), ['kofta', 'liver'])
+
+    def test_rating_average_follows_review_edits(self):
+        review = Review.objects.get(meal__slug='kebab')
+        review.rating = Decimal('5.0')
+        review.save()
+        self.assertEqual(self.slugs(category='grill', ordering='rating')[-1], 'liver')
+
+    def test_cursor_pagination_follows_the_ordering(self):
+        response = self.client.get('/api/meals/', {'ordering': 'price', 'pagination': 'cursor', 'page_size': 2})
+        second = self.client.get(response.data['next'])
+        slugs = [meal['slug'] for meal in response.data['results'] + second.data['results']]
+        self.assertEqual(slugs, ['lentil', 'liver', 'kofta', 'kebab'])
+
+    def test_unindexed_combinations_are_rejected(self):
+        for params in (
+            {'max_price': '10', 'ordering': 'rating'},
+            {'min_price': '1', 'min_rating': '3'},
+            {'ordering': 'name'},
+            {'category': 'missing'},
+            {'min_price': 'cheap'},
+        ):
+            self.assertEqual(self.client.get('/api/meals/', params).status_code, 400, params)
+
+    def test_non_finite_range_values_are_rejected(self):
+        for param in ('min_price', 'max_price', 'min_rating'):
+            for value in ('NaN', 'nan', 'sNaN', 'Infinity', '-inf', '1e999'):
+                response = self.client.get('/api/meals/', {param: value})
+                self.assertEqual(response.status_code, 400, (param, value))
+                self.assertEqual(response.data[param], ['A number is required.'])
+
+
+class LeaderboardTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(make_user('reader'))
+        self.grill = Category.objects.create(name='Grill')
+        self.kofta = Meal.objects.create(name='Kofta', description='-', price='8.00', category=self.grill)
+        self.kebab = Meal.objects.create(name='Kebab', description='-', price='9.00', category=self.grill)
+        self.soup = Meal.objects.create(name='Soup', description='-', price='2.00')
+        self.users = [make_user(f'critic{i}') for i in range(6)]
+
+    def top(self, url='/api/meals/top/', **params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200, response.data)
+        return [meal['slug'] for meal in response.data['results']]
+
+    def test_few_perfect_reviews_do_not_beat_many_good_ones(self):
+        Review.objects.create(user=self.users[0], meal=self.soup, rating=5)
+        for user in self.users:
+            Review.objects.create(user=user, meal=self.kofta, rating=Decimal('4.5'))
+            Review.objects.create(user=user, meal=self.kebab, rating=1)
+        call_command('rebuild_leaderboards', stdout=StringIO())  # settles the global mean
+        self.assertEqual(self.top(), ['kofta', 'soup', 'kebab'])
+
+    def test_category_board_and_incremental_updates(self):
+        Review.objects.create(user=self.users[0], meal=self.kofta, rating=2)
+        review = Review.objects.create(user=self.users[1], meal=self.kebab, rating=4)
+        self.assertEqual(self.top('/api/categories/grill/top/'), ['kebab', 'kofta'])
+        review.delete()
+        self.assertEqual(self.top('/api/categories/grill/top/', window='7d'), ['kofta'])
+
+    def test_trending_window_and_rebuild(self):
+        old = Review.objects.create(user=self.users[0], meal=self.kebab, rating=5)
+        Review.objects.filter(pk=old.pk).update(created_at=timezone.now() - timedelta(days=10))
+        Review.objects.create(user=self.users[1], meal=self.kofta, rating=3)
+        call_command('rebuild_leaderboards', stdout=StringIO())
+        self.assertEqual(self.top(window='7d'), ['kofta'])
+        self.assertEqual(self.top(window='30d', limit=1), ['kebab'])
+        self.assertFalse(MealRatingBucket.objects.filter(review_count=0).exists())
+
+    def test_moving_a_meal_moves_its_entries(self):
+        Review.objects.create(user=self.users[0], meal=self.kofta, rating=4)
+        self.kofta.category = None
+        self.kofta.save()
+        self.assertFalse(LeaderboardEntry.objects.filter(category=self.grill).exists())
+
+    def test_invalid_window(self):
+        self.assertEqual(self.client.get('/api/meals/top/', {'window': '1y'}).status_code, 400)
+
+
+class RatingHistogramTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        caches['responses'].clear()
+        self.client = APIClient()
+        self.client.force_authenticate(make_user('reader'))
+        self.meal = Meal.objects.create(name='Hawawshi', description='-', price='4.00')
+        Meal.objects.create(name='Feteer', description='-', price='5.00')
+        for i, rating in enumerate(['5.0', '4.5', '4.5', '3.0', '1.0']):
+            Review.objects.create(user=make_user(f'critic{i}'), meal=self.meal, rating=Decimal(rating))
+
+    def test_detail_includes_distribution(self):
+        distribution = self.client.get('/api/meals/hawawshi/').data['rating_distribution']
+        self.assertEqual(distribution['histogram'], [0, 0, 1, 0, 0, 0, 1, 0, 0, 2, 1])
+        self.assertEqual(distribution['median'], 4.5)
+        self.assertEqual(distribution['percentiles']['p25'], 3.0)
+        self.assertEqual(distribution['count'], 5)
+
+    def test_histogram_follows_edits_and_matches_rebuild(self):
+        review = Review.objects.get(user__username='critic0')
+        review.rating = Decimal('2.3')  # rounds to the 2.5★ bucket
+        review.save()
+        Review.objects.get(user__username='critic4').delete()
+        live = histograms.histograms_for([self.meal.pk])[self.meal.pk]
+        self.assertEqual(live, [0, 0, 0, 0, 0, 1, 1, 0, 0, 2, 0])
+        call_command('rebuild_histograms', stdout=StringIO())
+        self.assertEqual(histograms.histograms_for([self.meal.pk])[self.meal.pk], live)
+
+    def test_rebuild_invalidates_meal_detail(self):
+        RatingHistogramBin.objects.filter(meal=self.meal).update(count=7)  # drifted
+        response = self.client.get('/api/meals/hawawshi/')
+        self.assertEqual(response.data['rating_distribution']['count'], 28)
+        call_command('rebuild_histograms', stdout=StringIO())
+        response = self.client.get('/api/meals/hawawshi/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['rating_distribution']['count'], 5)
+
+    def test_batched_endpoint(self):
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/meals/histograms/', {'slugs': 'hawawshi,feteer,missing'})
+        self.assertEqual(response.data['results']['feteer']['median'], None)
+        self.assertEqual(response.data['results']['hawawshi']['count'], 5)
+        self.assertEqual(response.data['missing'], ['missing'])
+
+
+class MealBatchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        caches['responses'].clear()
+        self.client = APIClient()
+        self.client.force_authenticate(make_user('reader'))
+        self.meal = Meal.objects.create(name='Hawawshi', description='-', price='4.00')
+        Meal.objects.create(name='Feteer', description='-', price='5.00')
+        Review.objects.create(user=make_user('critic'), meal=self.meal, rating=Decimal('4.5'))
+
+    def test_details_in_request_order_with_missing(self):
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/meals/batch/', {'slugs': 'feteer,missing,hawawshi,feteer'})
+        self.assertEqual([meal['slug'] for meal in response.data['results']], ['feteer', 'hawawshi'])
+        self.assertEqual(response.data['missing'], ['missing'])
+        self.assertEqual(response.data['results'][1], self.client.get('/api/meals/hawawshi/').data)
+
+    def test_ids_and_field_selection(self):
+        with self.assertNumQueries(1):  # no histogram query without rating_distribution
+            response = self.client.get('/api/meals/batch/', {'ids': f'{self.meal.pk},0', 'fields': 'name,price,average_rating'})
+        self.assertEqual(response.data['results'], [{'name': 'Hawawshi', 'price': '4.00', 'average_rating': Decimal('4.5')}])
+        self.assertEqual(response.data['missing'], [0])
+
+    def test_invalid_requests(self):
+        for params in ({}, {'slugs': 'a', 'ids': '1'}, {'ids': 'x'}, {'slugs': 'a', 'fields': 'name,secret'},
+                       {'slugs': ','.join(f'meal-{i}' for i in range(101))},
+                       {'ids': '99999999999999999999'}, {'ids': f'{self.meal.pk},-99999999999999999999'}):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get('/api/meals/batch/', params).status_code, 400)
+
+
+class SparseFieldsetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        caches['responses'].clear()
+        self.user = make_user('reader')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        mains = Category.objects.create(name='Mains')
+        meal = Meal.objects.create(name='Kofta', description='Grilled ' * 50, price='7.00', category=mains)
+        Review.objects.create(user=self.user, meal=meal, rating=Decimal('4.0'), comment='Juicy')
+
+    def get(self, path, params):
+        with CaptureQueriesContext(connections['default']) as queries:
+            response = self.client.get(path, params)
+        self.assertEqual(response.status_code, 200)
+        return response.data, ' '.join(query['sql'] for query in queries)
+
+    def test_meal_list_and_detail_select_only_the_requested_columns(self):
+        data, sql = self.get('/api/meals/', {'fields': 'name,price'})
+        self.assertEqual(data['results'], [{'name': 'Kofta', 'price': '7.00'}])
+        self.assertNotIn('"description"', sql)
+        self.assertNotIn('API_category', sql)
+        data, sql = self.get('/api/meals/kofta/', {'fields': 'name,category'})
+        self.assertEqual(data, {'name': 'Kofta', 'category': 'Mains'})
+        self.assertNotIn('"description"', sql)
+        self.assertNotIn('histogram', sql.lower())  # rating_distribution not requested
+
+    def test_exclude_on_reviews_and_categories(self):
+        data, sql = self.get('/api/meals/kofta/reviews/', {'exclude': 'comment,meal_slug'})
+        self.assertEqual(list(data['results'][0]), ['id', 'user', 'rating', 'created_at'])
+        self.assertNotIn('"comment"', sql)
+        data, _ = self.get('/api/reviews/kofta/', {'fields': 'rating'})
+        self.assertEqual(data, {'rating': '4.0'})
+        data, _ = self.get('/api/categories/', {'exclude': 'total_meals'})
+        self.assertEqual(data['results'], [{'name': 'Mains', 'slug': 'mains'}])
+
+    def test_unknown_fields_and_writes(self):
+        self.assertEqual(self.client.get('/api/meals/', {'fields': 'name,secret'}).status_code, 400)
+        response = self.client.post('/api/meals/?fields=name', {
+            'name': 'Mahshi', 'description': '-', 'price': '3.00', 'category_slug': 'mains',
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertIn('description', response.data)  # writes ignore the fieldset
+
+
+class AsyncReadEndpointTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        caches['responses'].clear()
+        token_cache.clear()
+        token = Token.objects.get(user=make_user('reader'))
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        self.auth = {'Authorization': f'Token {token.key}'}
+        soups = Category.objects.create(name='Soups')
+        Category.objects.create(name='Salads')
+        for i in range(12):
+            Meal.objects.create(name=f'Soup {i}', description='Hot', price=f'{i + 1}.50', category=soups)
+        meal = Meal.objects.get(slug='soup-3')
+        for i, rating in enumerate(['4.5', '3.0', '5.0']):
+            Review.objects.create(user=make_user(f'taster{i}'), meal=meal, rating=Decimal(rating), comment='ok')
+
+    async def assertSamePayload(self, sync_path, async_path, params=None):
+        expected = await sync_to_async(self.client.get)(sync_path, params or {})
+        response = await self.async_client.get(async_path, params or {}, headers=self.auth)
+        self.assertEqual(response.status_code, expected.status_code)
+        # Only the next/previous links differ, by the /async prefix
+        self.assertEqual(json.loads(response.content.replace(b'/api/async/', b'/api/')), json.loads(expected.content))
+
+    async def test_payloads_match_drf_views(self):
+        await self.assertSamePayload('/api/categories/', '/api/async/categories/')
+        await self.assertSamePayload('/api/meals/', '/api/async/meals/', {'page': 2})
+        await self.assertSamePayload('/api/meals/', '/api/async/meals/', {'category': 'soups', 'max_price': '5', 'page_size': 2})
+        await self.assertSamePayload('/api/meals/soup-3/', '/api/async/meals/soup-3/')
+        await self.assertSamePayload('/api/meals/soup-3/reviews/', '/api/async/meals/soup-3/reviews/')
+
+    async def test_sparse_fieldsets_match_drf_views(self):
+        await self.assertSamePayload('/api/categories/', '/api/async/categories/', {'fields': 'slug'})
+        await self.assertSamePayload('/api/meals/', '/api/async/meals/', {'fields': 'slug,price', 'page': 2})
+        await self.assertSamePayload('/api/meals/', '/api/async/meals/', {'exclude': 'description,image_renditions'})
+        await self.assertSamePayload('/api/meals/soup-3/', '/api/async/meals/soup-3/', {'fields': 'name'})
+        await self.assertSamePayload('/api/meals/soup-3/', '/api/async/meals/soup-3/', {'fields': 'rating_distribution'})
+        await self.assertSamePayload('/api/meals/soup-3/reviews/', '/api/async/meals/soup-3/reviews/', {'exclude': 'comment'})
+        await self.assertSamePayload('/api/meals/', '/api/async/meals/', {'fields': 'slug,calories'})
+        response = await self.async_client.get('/api/async/meals/soup-3/', {'fields': 'name'}, headers=self.auth)
+        self.assertEqual(json.loads(response.content), {'name': 'Soup 3'})
+
+    async def test_errors(self):
+        await self.assertSamePayload('/api/meals/', '/api/async/meals/', {'ordering': 'name'})
+        await self.assertSamePayload('/api/meals/', '/api/async/meals/', {'page': 9})
+        await self.assertSamePayload('/api/meals/missing/', '/api/async/meals/missing/')
+        response = await self.async_client.get('/api/async/meals/')
+        self.assertEqual(response.status_code, 401)
+        response = await self.async_client.post('/api/async/meals/', headers=self.auth)
+        self.assertEqual(response.status_code, 405)
+
+
+class RecordingRouter(ReplicaRouter):
+    reads = []
+
+    def db_for_read(self, model, **hints):
+        alias = super().db_for_read(model, **hints)
+        self.reads.append(alias)
+        return alias
+
+
+@override_settings(
+    DATABASE_ROUTERS=['API.tests.RecordingRouter'],
+    REPLICA_WEIGHTS={'replica1': 3, 'replica2': 1},
+    REPLICA_STICKY_SECONDS=60,
+)
+class ReplicaRoutingTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # Stand-ins sharing the test connection, and so its transaction
+        super().setUpClass()
+        for alias in ('replica1', 'replica2'):
+            connections.settings[alias] = dict(connections['default'].settings_dict)
+            connections[alias] = connections['default']
+
+    @classmethod
+    def tearDownClass(cls):
+        for alias in ('replica1', 'replica2'):
+            del connections[alias]
+            del connections.settings[alias]
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        caches['responses'].clear()
+        token_cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(make_user('reader'))
+        self.meal = Meal.objects.create(name='Kofta', description='-', price='6.00')
+        for namespace in ('meals', 'categories', meal_namespace(self.meal.slug)):
+            cache.set(f'api:changed:{namespace}', int(time.time()) - 3600, None)  # replicated long ago
+        RecordingRouter.reads = []  # fixtures read from the primary, outside any request
+
+    def test_weighted_round_robin(self):
+        router = ReplicaRouter()
+        with mock.patch.object(router, '_usable', return_value=True):
+            token = allow_replica_reads()
+            try:
+                picks = [router.db_for_read(Meal) for _ in range(8)]
+            finally:
+                reset_replica_reads(token)
+        self.assertEqual(picks, ['replica1', 'replica1', 'replica2', 'replica1'] * 2)
+        self.assertEqual(router.db_for_read(Meal), 'default')  # outside a replica-safe request
+        self.assertEqual(router.db_for_write(Meal), 'default')
+
+    def test_unhealthy_replica_is_skipped_then_primary(self):
+        router = ReplicaRouter()
+        replicas = {'replica1': mock.Mock(), 'replica2': mock.Mock()}
+        replicas['replica2'].ensure_connection.side_effect = DatabaseError
+        token = allow_replica_reads()
+        try:
+            with mock.patch('API.db_router.connections', replicas):
+                self.assertEqual({router.db_for_read(Meal) for _ in range(8)}, {'replica1'})
+                self.assertEqual(replicas['replica2'].ensure_connection.call_count, 1)  # then backed off
+                replicas['replica1'].ensure_connection.side_effect = DatabaseError
+                self.assertEqual(router.db_for_read(Meal), 'default')
+        finally:
+            reset_replica_reads(token)
+
+    def test_client_reads_its_own_writes_from_the_primary(self):
+        self.client.get('/api/meals/')
+        self.assertIn('replica1', RecordingRouter.reads)
+        self.assertNotIn('default', RecordingRouter.reads)
+
+        response = self.client.post(
+            f'/api/meals/{self.meal.slug}/reviews/', {'meal_slug': self.meal.slug, 'rating': '4.0', 'comment': 'ok'},
+        )
+        self.assertEqual(response.status_code, 201)
+        RecordingRouter.reads = []
+        response = self.client.get(f'/api/meals/{self.meal.slug}/reviews/')
+        self.assertEqual(response.data['count'], 1)
+        self.assertEqual(set(RecordingRouter.reads), {'default'})
+
+        other = APIClient(REMOTE_ADDR='10.0.0.2')
+        other.force_authenticate(make_user('other'))
+        RecordingRouter.reads = []
+        other.get('/api/meals/', {'other': 1})  # bypasses the response cache
+        self.assertNotIn('default', RecordingRouter.reads)
+
+    def test_cache_entries_of_recent_changes_are_filled_from_the_primary(self):
+        Review.objects.create(user=make_user('critic'), meal=self.meal, rating=4)  # bumps the namespaces
+        RecordingRouter.reads = []
+        response = self.client.get(f'/api/meals/{self.meal.slug}/')
+        self.assertEqual(response.data['no_of_reviews'], 1)
+        self.assertEqual(set(RecordingRouter.reads), {'default'})
+
+        other = APIClient(REMOTE_ADDR='10.0.0.2')
+        other.force_authenticate(make_user('other'))
+        cache.set(f'api:changed:{meal_namespace(self.meal.slug)}', int(time.time()) - 3600, None)
+        caches['responses'].clear()
+        RecordingRouter.reads = []
+        other.get(f'/api/meals/{self.meal.slug}/')
+        self.assertNotIn('default', RecordingRouter.reads)
+
+
+THROTTLE_RATES = {'register': '2/hour', 'token': '3/min', 'review-create': '2/min'}
+
+
+@override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': THROTTLE_RATES})
+class ThrottlingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        caches['responses'].clear()
+        self.meal = Meal.objects.create(name='Bamia', description='-', price='7.00')
+
+    def test_review_creation_is_limited_per_client(self):
+        client = APIClient()
+        client.force_authenticate(make_user('eater'))
+        url = f'/api/meals/{self.meal.slug}/reviews/'
+        review = {'meal_slug': self.meal.slug, 'rating': '3.0', 'comment': 'ok'}
+        statuses = [client.post(url, {**review, 'rating': rating}).status_code for rating in ('3.0', '9.0', '3.0')]
+        self.assertEqual(statuses, [201, 400, 429])  # invalid requests count too
+        response = client.post(url, review)
+        self.assertGreaterEqual(int(response['Retry-After']), 1)
+        self.assertEqual(client.get(url).status_code, 200)  # reads are not limited
+        self.assertEqual(throttle_stats()['review-create'], 2)
+
+        client.force_authenticate(make_user('neighbour'))  # same address, own budget
+        self.assertEqual(client.post(url, review).status_code, 201)
+
+    def test_token_requests_and_registration_are_limited_by_address(self):
+        for _ in range(3):
+            self.assertEqual(self.client.post('/tokenrequest/', {'username': 'x', 'password': 'y'}).status_code, 400)
+        self.assertEqual(self.client.post('/tokenrequest/', {'username': 'x', 'password': 'y'}).status_code, 429)
+        for _ in range(2):
+            self.client.post('/api/users/', {})
+        self.assertEqual(self.client.post('/api/users/', {}).status_code, 429)
+        self.assertEqual(self.client.post('/tokenrequest/', {}, REMOTE_ADDR='10.0.0.9').status_code, 400)
+
+    def test_rotating_the_authorization_header_does_not_reset_the_limit(self):
+        statuses = [
+            self.client.post('/tokenrequest/', {'username': 'x', 'password': 'y'},
+                             HTTP_AUTHORIZATION=f'Bearer junk{i}').status_code
+            for i in range(5)
+        ]
+        self.assertIn(429, statuses)
+        self.assertNotIn(429, statuses[:3])
+
+    @override_settings(API_THROTTLE_STORE='API.throttling.MemoryCounterStore')
+    def test_sliding_window_estimate(self):
+        view = type('View', (), {'throttle_scope': 'token'})()
+        request = Request(APIRequestFactory().get('/'))
+
+        def attempt(at):
+            throttle = SlidingWindowThrottle()
+            with mock.patch('API.throttling.time.time', return_value=at):
+                return throttle.allow_request(request, view), throttle
+
+        self.assertEqual([attempt(6000 + 50)[0] for _ in range(4)], [True, True, True, False])
+        # 15s into the next window the previous one still weighs 3 * 45/60
+        allowed, throttle = attempt(6060 + 15)
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(throttle.wait(), 5.0)
+        self.assertTrue(attempt(6060 + 21)[0])
+        self.assertIsInstance(counter_store(), MemoryCounterStore)
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        caches['responses'].clear()
+        metrics.registry.reset()
+        self.client = APIClient()
+        self.client.force_authenticate(make_user('reader'))
+        for i in range(3):
+            Meal.objects.create(name=f'Tagine {i}', description='-', price='9.00')
+
+    def test_requests_are_exposed_per_view(self):
+        self.client.get('/api/meals/')
+        self.client.get('/api/meals/', {'ordering': 'bogus'})
+        body = self.client.get('/metrics').content.decode()
+        self.assertIn('api_request_duration_seconds_count{view="meal-list",method="GET"} 2', body)
+        self.assertIn('api_requests_total{view="meal-list",method="GET",status="400"} 1', body)
+        self.assertIn('api_throttled_requests_total{scope="review-create"} 0', body)
+        snapshot = metrics.registry.snapshot()
+        self.assertGreater(snapshot['queries'][('meal-list', 'GET')], 0)
+        self.assertGreater(snapshot['serializer_time'][('meal-list', 'GET')], 0)
+        self.assertGreater(snapshot['response_bytes'][('meal-list', 'GET')], 0)
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='10.1.2.3').status_code, 404)
+
+    @override_settings(API_N_PLUS_ONE_THRESHOLD=3)
+    def test_repeated_query_templates_are_flagged(self):
+        record, token = metrics.start_request()
+        try:
+            for meal in Meal.objects.all():
+                Review.objects.filter(meal=meal).count()  # one query per row
+        finally:
+            metrics.end_request(token)
+        with self.assertLogs('API.metrics', 'WARNING') as logs:
+            metrics.registry.observe('meal-list', 'GET', 200, 0.01, record, 0)
+        self.assertIn('3 x SELECT COUNT(*)', logs.output[0])
+        self.assertEqual(metrics.registry.snapshot()['n_plus_one'], {('meal-list', 'GET'): 1})
+
+
+class FastPathListTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        caches['responses'].clear()
+        self.user = make_user('reader')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        mains = Category.objects.create(name='Mains')
+        for i, name in enumerate(['Koshari', 'Fül medames', 'Ta’ameya']):
+            Meal.objects.create(name=name, description='حار جدا', price=f'{i + 3}.25', category=mains)
+        meal = Meal.objects.get(slug='koshari')
+        for i, rating in enumerate(['4.5', '3.0', '5.0']):
+            Review.objects.create(user=make_user(f'taster{i}'), meal=meal, rating=Decimal(rating), comment='لذيذ')
+
+    def serializer_bytes(self, view_class, path, params, **kwargs):
+        """The same request through the serializer and DRF's JSONRenderer."""
+        class SerializerView(view_class):
+            renderer_classes = (JSONRenderer,)
+            list = generics.ListAPIView.list
+
+        caches['responses'].clear()
+        request = APIRequestFactory().get(path, params)
+        force_authenticate(request, self.user)
+        response = SerializerView.as_view()(request, **kwargs)
+        caches['responses'].clear()
+        return response.render().content
+
+    def test_pages_are_byte_identical_to_the_serializers(self):
+        for params in ({}, {'page': 2, 'page_size': 2}, {'pagination': 'cursor', 'page_size': 2}, {'ordering': 'rating'}):
+            with self.subTest(params=params):
+                expected = self.serializer_bytes(MealListCreateView, '/api/meals/', params)
+                self.assertEqual(self.client.get('/api/meals/', params).content, expected)
+                expected = self.serializer_bytes(
+                    ReviewListCreateView, '/api/meals/koshari/reviews/', params, meal_slug='koshari',
+                )
+                self.assertEqual(self.client.get('/api/meals/koshari/reviews/', params).content, expected)
+
+    def test_cursor_pages_for_every_ordering_and_fieldset(self):
+        for ordering in ORDERINGS:
+            for extra in ({}, {'fields': 'name'}):
+                params = {'pagination': 'cursor', 'page_size': 2, 'ordering': ordering, **extra}
+                with self.subTest(params=params):
+                    response = self.client.get('/api/meals/', params)
+                    self.assertEqual(response.status_code, 200)
+                    self.assertEqual(response.content, self.serializer_bytes(MealListCreateView, '/api/meals/', params))
+                    next_url = json.loads(response.content)['next']
+                    self.assertEqual(
+                        self.client.get(next_url).content,
+                        self.serializer_bytes(MealListCreateView, next_url, {}),
+                    )
+
+    def test_benchmark_pages_are_identical(self):
+        for name, stats in benchmark.serialization_cpu(page_size=3, repeat=1, warmup=0).items():
+            self.assertTrue(stats['identical'], name)
+
+
+_flaky_calls = []
+
+
+@jobs.task('test-flaky', max_attempts=2)
+def flaky_task(failures):
+    _flaky_calls.append(failures)
+    if _flaky_calls.count(failures) <= failures:  # fails its first `failures` runs
+        raise RuntimeError('boom')
+
+
+@jobs.task('test-create-category', max_attempts=1)
+def create_category_task(name):
+    Category.objects.create(name=name)
+
+
+@override_settings(API_JOBS_SYNC=False, API_JOBS_RETRY_DELAY=0)
+class JobQueueTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        caches['responses'].clear()
+        _flaky_calls.clear()
+
+    def test_registration_token_is_created_by_a_worker(self):
+        user = make_user('newcomer')
+        self.assertFalse(Token.objects.filter(user=user).exists())
+        self.assertEqual(jobs.work(burst=True), 1)
+        self.assertTrue(Token.objects.filter(user=user).exists())
+        self.assertEqual(Job.objects.get().status, Job.DONE)
+
+    def test_review_aggregates_follow_once_the_job_runs(self):
+        meal = Meal.objects.create(name='Kofta', description='-', price='6.00')
+        Review.objects.create(user=make_user('critic'), meal=meal, rating=Decimal('4.5'))
+        meal.refresh_from_db()
+        self.assertEqual(meal.review_count, 1)  # the totals are still updated in the request
+        self.assertEqual(sum(histograms.histograms_for([meal.pk])[meal.pk]), 0)
+        jobs.work(burst=True)
+        self.assertEqual(sum(histograms.histograms_for([meal.pk])[meal.pk]), 1)
+        self.assertEqual(LeaderboardEntry.objects.filter(meal=meal).count(), len(leaderboards.WINDOWS))
+
+    def test_idempotency_key(self):
+        first = jobs.enqueue('test-flaky', 0, key='once')
+        self.assertEqual(jobs.enqueue('test-flaky', 0, key='once'), first)
+        jobs.work(burst=True)
+        self.assertEqual(_flaky_calls, [0])
+
+    def test_failed_keyed_job_is_queued_again(self):
+        job = jobs.enqueue('test-flaky', 2, key='renditions')
+        with self.assertLogs('API.jobs', 'WARNING'):
+            jobs.work(burst=True)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+        again = jobs.enqueue('test-flaky', 2, key='renditions')
+        self.assertEqual((again.pk, again.status, again.attempts, again.last_error), (job.pk, Job.PENDING, 0, ''))
+        self.assertEqual(jobs.work(burst=True), 1)
+        again.refresh_from_db()
+        self.assertEqual((again.status, _flaky_calls), (Job.DONE, [2, 2, 2]))
+
+    def test_retries_then_failure(self):
+        retried = jobs.enqueue('test-flaky', 1)
+        failed = jobs.enqueue('test-flaky', 5)
+        with self.assertLogs('API.jobs', 'WARNING') as logs:
+            call_command('run_workers', '--workers', '1', '--burst', stdout=StringIO())
+        self.assertEqual(sum('retrying' in line for line in logs.output), 2)
+        retried.refresh_from_db()
+        failed.refresh_from_db()
+        self.assertEqual((retried.status, retried.attempts), (Job.DONE, 2))
+        self.assertEqual((failed.status, failed.attempts), (Job.FAILED, 2))
+        self.assertIn('RuntimeError: boom', failed.last_error)
+
+    def test_abandoned_running_job_is_claimed_again(self):
+        job = jobs.enqueue('test-flaky', 0)
+        self.assertEqual(jobs.claim('dead-worker').pk, job.pk)
+        self.assertIsNone(jobs.claim('other'))
+        Job.objects.filter(pk=job.pk).update(locked_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(jobs.claim('other').locked_by, 'other')
+
+    def test_run_is_rolled_back_when_another_worker_took_the_job(self):
+        job = jobs.enqueue('test-create-category', 'Soups')
+        claimed = jobs.claim('slow-worker')
+        Job.objects.filter(pk=job.pk).update(locked_by='other', locked_at=timezone.now())  # lease expired, reclaimed
+        with self.assertLogs('API.jobs', 'WARNING'):
+            self.assertFalse(jobs.run(claimed))
+        self.assertFalse(Category.objects.filter(name='Soups').exists())
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.locked_by), (Job.RUNNING, 'other'))
+
+    def test_workers_purge_old_finished_jobs(self):
+        old = jobs.enqueue('test-flaky', 0)
+        recent = jobs.enqueue('test-flaky', 0)
+        jobs.work(burst=True)
+        Job.objects.filter(pk=old.pk).update(finished_at=timezone.now() - timedelta(days=settings.API_JOBS_KEEP_DAYS + 1))
+        jobs.work(burst=True)
+        self.assertEqual(list(Job.objects.values_list('pk', flat=True)), [recent.pk])
+
+    def test_deleting_a_user_updates_each_meal_once_in_one_job(self):
+        critic, other = make_user('critic'), make_user('other')
+        meals = [Meal.objects.create(name=f'Meal {i}', description='-', price='5.00') for i in range(20)]
+        for meal in meals:
+            Review.objects.create(user=critic, meal=meal, rating=4)
+        Review.objects.create(user=other, meal=meals[0], rating=2)
+        jobs.work(burst=True)
+        with CaptureQueriesContext(connections['default']) as queries:
+            critic.delete()
+        self.assertLess(len(queries), 2 * len(meals))  # one total update per meal, plus a constant
+        self.assertEqual(Job.objects.filter(task='review-aggregates', status=Job.PENDING).count(), 1)
+        jobs.work(burst=True)
+
+        meals[0].refresh_from_db()
+        self.assertEqual((meals[0].review_count, meals[0].rating_sum), (1, Decimal('2.0')))
+        self.assertEqual(sum(Meal.objects.values_list('review_count', flat=True)), 1)
+        self.assertEqual(sum(map(sum, histograms.histograms_for([meal.pk for meal in meals]).values())), 1)
+        self.assertEqual(sum(MealRatingBucket.objects.values_list('review_count', flat=True)), 1)
+        self.assertEqual(set(LeaderboardEntry.objects.values_list('meal_id', flat=True)), {meals[0].pk})
+
+    def test_deleting_a_meal_skips_the_per_review_updates(self):
+        meal = Meal.objects.create(name='Kofta', description='-', price='6.00')
+        for i in range(20):
+            Review.objects.create(user=make_user(f'critic{i}'), meal=meal, rating=4)
+        jobs.work(burst=True)
+        with CaptureQueriesContext(connections['default']) as queries:
+            meal.delete()
+        self.assertLess(len(queries), 20)
+        self.assertFalse(Job.objects.filter(status=Job.PENDING).exists())
+
+
+class ReservedMealSlugTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(make_user('chef'))
+        Category.objects.create(name='Mains')
+
+    def test_reserved_slugs_cannot_be_created(self):
+        for slug in RESERVED_MEAL_SLUGS:
+            with self.subTest(slug=slug):
+                response = self.client.post('/api/meals/', {
+                    'name': slug.title(), 'description': '-', 'price': '1.00', 'category_slug': 'mains',
+                }, format='json')
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('name', response.data)
+                with self.assertRaises(ValidationError):
+                    Meal.objects.create(name=slug.title(), description='-', price='1.00')
+
+    def test_forms_report_reserved_slugs_as_field_errors(self):
+        MealForm = modelform_factory(Meal, fields=['name', 'slug', 'description', 'price'])
+        form = MealForm({'name': 'Top pick', 'slug': 'top', 'description': '-', 'price': '1.00'})
+        self.assertEqual(list(form.errors), ['slug'])
+        form = MealForm({'name': 'Top', 'slug': '', 'description': '-', 'price': '1.00'})
+        self.assertEqual(list(form.errors), ['name'])
+
+    def test_existing_reserved_slugs_still_save_and_are_migrated(self):
+        Meal.objects.create(name='Search meal', description='-', price='1.00')
+        Meal.objects.create(name='Search', slug='search-x', description='-', price='1.00')
+        Meal.objects.filter(slug='search-x').update(slug='search')  # saved before 'search' was reserved
+        meal = Meal.objects.get(slug='search')
+        meal.price = '2.00'
+        meal.save()
+        migration = importlib.import_module('API.migrations.0011_reserved_meal_slugs')
+        migration.reslug_reserved_meals(django_apps, None)
+        self.assertEqual(Meal.objects.get(name='Search').slug, 'search-meal-2')
+
+    def test_every_fixed_route_beside_a_slug_route_is_reserved(self):
+        from . import urls
+        fixed = {
+            str(pattern.pattern).split('/')[1] for pattern in urls.urlpatterns
+            if re.fullmatch(r'(meals|reviews)/[\w-]+/', str(pattern.pattern))
+        }
+        self.assertTrue(fixed)
+        self.assertEqual(fixed - RESERVED_MEAL_SLUGS, set())
+
+
+class BenchmarkSuiteTests(TestCase):
+    def test_every_route_has_an_endpoint(self):
+        from django.urls import get_resolver, resolve
+        benchmarked = {resolve(endpoint.path.split('?')[0].format(meal='m', category='c')).view_name for endpoint in benchmark.ENDPOINTS}
+        skipped = {'user-me', 'user-detail', 'api-root'}  # would change the fixtures / browsable root
+        routes = {name for name in get_resolver('API.urls').reverse_dict if isinstance(name, str)}
+        self.assertEqual(routes - benchmarked - skipped, set())
+
+    @override_settings(ALLOWED_HOSTS=['localhost'])
+    def test_in_process_run_on_a_small_dataset(self):
+        benchmark.seed_dataset(300, meals=60, categories=3)  # page 5 needs 41+ meals
+        fixtures = benchmark.suite_fixtures()
+        results = benchmark.run_in_process(benchmark.ENDPOINTS, fixtures, repeat=1, warmup=0)
+        self.assertEqual({name: stats['errors'] for name, stats in results.items() if stats['errors']}, {})
+        self.assertGreater(results['review-detail']['queries_per_request'], 0)
+        self.assertGreater(results['meals']['queries_per_request'], results['meals:cached']['queries_per_request'])
+        self.assertNotIn('reviews-bulk:cached', results)
+        run = {'endpoints': results}
+        slower = {'endpoints': {name: {**stats, 'rps': stats['rps'] / 2} for name, stats in results.items()}}
+        self.assertTrue(all(row[-1] for row in benchmark.compare_results(run, slower)))
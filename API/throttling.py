@@ -0,0 +1,151 @@
+"""Sliding-window rate limits on a pluggable counter store.
+
+Each client gets two fixed-window counters per scope: the current window and
+the previous one. The request rate is estimated as
+previous * (share of the previous window still inside the sliding window) +
+current, so a check costs two counter operations however high the rate is.
+
+Rates use DRF's `DEFAULT_THROTTLE_RATES` ('5/min', '100/hour', ...). Views
+opt in with `throttle_scope` and optionally limit it to `throttle_methods`.
+Clients are identified by their authenticated token, then their user,
+then their IP address. `API_THROTTLE_STORE` selects the counter store:
+`CacheCounterStore` (shared by every worker, the default) or
+`MemoryCounterStore` (one process).
+"""
+import hashlib
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+from rest_framework.throttling import BaseThrottle
+
+REJECTED_PREFIX = 'api:throttle:rejected:'
+
+
+class MemoryCounterStore:
+    """Process-local counters with expiry; fine for a single worker."""
+
+    def __init__(self):
+        self._counters = {}
+        self._lock = threading.Lock()
+        self._next_purge = 0.0
+
+    def _purge(self, now):
+        if now >= self._next_purge:
+            self._counters = {key: entry for key, entry in self._counters.items() if entry[1] > now}
+            self._next_purge = now + 60
+
+    def incr(self, key, delta=1, timeout=None):
+        now = time.monotonic()
+        with self._lock:
+            self._purge(now)
+            value, expires = self._counters.get(key, (0, 0.0))
+            if expires <= now:  # missing or expired: start a new counter
+                value, expires = 0, math.inf if timeout is None else now + timeout
+            self._counters[key] = (value + delta, expires)
+            return value + delta
+
+    def get(self, key):
+        with self._lock:
+            value, expires = self._counters.get(key, (0, math.inf))
+            return value if expires > time.monotonic() else 0
+
+
+class CacheCounterStore:
+    """Counters in a Django cache; atomic `incr` makes them safe across workers."""
+
+    def __init__(self):
+        self.cache = caches[getattr(settings, 'API_THROTTLE_CACHE_ALIAS', 'default')]
+
+    def incr(self, key, delta=1, timeout=None):
+        self.cache.add(key, 0, timeout)
+        try:
+            return self.cache.incr(key, delta)
+        except ValueError:  # expired between add and incr
+            self.cache.set(key, delta, timeout)
+            return delta
+
+    def get(self, key):
+        return self.cache.get(key, 0)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def counter_store():
+    global _store
+    path = getattr(settings, 'API_THROTTLE_STORE', 'API.throttling.CacheCounterStore')
+    if _store is None or f'{type(_store).__module__}.{type(_store).__name__}' != path:
+        with _store_lock:
+            _store = import_string(path)()
+    return _store
+
+
+def throttle_stats():
+    """Rejected requests per configured scope, across workers with a shared store."""
+    rates = settings.REST_FRAMEWORK.get('DEFAULT_THROTTLE_RATES', {})
+    return {scope: counter_store().get(REJECTED_PREFIX + scope) for scope in rates}
+
+
+class SlidingWindowThrottle(BaseThrottle):
+    """Scope-based throttle using the sliding window counter estimate."""
+
+    def __init__(self):
+        self.rates = settings.REST_FRAMEWORK.get('DEFAULT_THROTTLE_RATES', {})
+
+    @staticmethod
+    def parse_rate(rate):
+        count, period = rate.split('/')
+        return int(count), {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}[period[0]]
+
+    def get_ident(self, request):
+        # Only credentials that authenticated count: a made-up Authorization
+        # header must not buy a fresh budget, so anything else is keyed by IP
+        key = getattr(request.auth, 'key', None)
+        if key:
+            return 'token:' + hashlib.sha256(key.encode()).hexdigest()
+        if request.user and request.user.is_authenticated:
+            return f'user:{request.user.pk}'
+        return 'ip:' + super().get_ident(request)
+
+    def allow_request(self, request, view):
+        methods = getattr(view, 'throttle_methods', None)
+        scope = getattr(view, 'throttle_scope', None)
+        if scope not in self.rates or (methods is not None and request.method not in methods):
+            return True
+        self.scope = scope
+        self.limit, self.window = self.parse_rate(self.rates[scope])
+
+        store = counter_store()
+        now = time.time()
+        self.window_start = now // self.window * self.window
+        prefix = f'api:throttle:{scope}:{self.get_ident(request)}:'
+        current_key = prefix + str(int(self.window_start))
+        self.current = store.incr(current_key, timeout=2 * self.window)
+        self.previous = store.get(prefix + str(int(self.window_start - self.window)))
+        self.now = now
+        if self._estimate(now) <= self.limit:
+            return True
+        store.incr(current_key, -1, timeout=2 * self.window)  # rejected requests do not count
+        self.current -= 1
+        store.incr(REJECTED_PREFIX + scope)
+        return False
+
+    def _estimate(self, now):
+        overlap = 1 - (now - self.window_start) / self.window
+        return self.previous * overlap + self.current
+
+    def wait(self):
+        """Seconds until one more request fits in the window."""
+        room = self.limit - 1
+        if self.current > room:
+            # Must wait for this window to become the previous one and decay
+            next_start = self.window_start + self.window
+            return max(0.0, next_start + self.window * (1 - room / self.current) - self.now)
+        # The previous window has to decay until previous * overlap <= room - current
+        overlap = (room - self.current) / self.previous
+        return max(0.0, self.window_start + self.window * (1 - overlap) - self.now)
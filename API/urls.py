@@ -2,8 +2,11 @@ from django.urls import include, path
 from .views import (
     CategoryListCreateView, CategoryDetailView,
     MealListCreateView, MealDetailView,
-    ReviewListCreateView, ReviewDetailView ,UserView
+    ReviewListCreateView, ReviewDetailView ,UserView,
+    ReviewBulkImportView, ExportView, MealSearchView,
+    TopMealsView, MealHistogramsView, MealBatchView,
 )
+from . import async_views
 #import router
 from rest_framework import routers
 
@@ -14,16 +17,31 @@ router.register('users', UserView)
 urlpatterns = [
     # 📌 Categories
     path('categories/', CategoryListCreateView.as_view(), name='category-list'),
+    path('categories/<str:slug>/top/', TopMealsView.as_view(), name='category-top-meals'),
     path('categories/<str:slug>/', CategoryDetailView.as_view(), name='category-detail'),
 
     # 📌 Meals
     path('meals/', MealListCreateView.as_view(), name='meal-list'),
+    path('meals/top/', TopMealsView.as_view(), name='top-meals'),
+    path('meals/histograms/', MealHistogramsView.as_view(), name='meal-histograms'),
+    path('meals/batch/', MealBatchView.as_view(), name='meal-batch'),
+    path('meals/search/', MealSearchView.as_view(), name='meal-search'),
     path('meals/<str:slug>/', MealDetailView.as_view(), name='meal-detail'),
 
     # 📌 Reviews
     path('meals/<str:meal_slug>/reviews/', ReviewListCreateView.as_view(), name='review-list'),
+    path('reviews/bulk/', ReviewBulkImportView.as_view(), name='review-bulk-import'),
     path('reviews/<str:slug>/', ReviewDetailView.as_view(), name='review-detail'),
 
+    # 📌 Exports
+    path('export/<str:dataset>/', ExportView.as_view(), name='export'),
+
+    # 📌 ASGI-native reads (same payloads as the DRF views above)
+    path('async/categories/', async_views.category_list, name='async-category-list'),
+    path('async/meals/', async_views.meal_list, name='async-meal-list'),
+    path('async/meals/<str:slug>/', async_views.meal_detail, name='async-meal-detail'),
+    path('async/meals/<str:meal_slug>/reviews/', async_views.review_list, name='async-review-list'),
+
     # 📌 Users
     path('users/me/', UserView.as_view({'put': 'update', 'delete': 'destroy'}), name='user-me'),
 
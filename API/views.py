@@ -1,17 +1,36 @@
+from django.db import connection
+from django.db.models import Count
 from django.dispatch import receiver
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.utils.dateparse import parse_datetime
 from django.shortcuts import get_object_or_404
 from rest_framework import generics, permissions , viewsets ,status ,request
 from rest_framework.response import Response
+from rest_framework.parsers import JSONParser
+from rest_framework.views import APIView
 
-from project import settings
-from .pagination import StandardResultsSetPagination
+from django.conf import settings
+from .pagination import SelectablePagination
 from rest_framework.exceptions import PermissionDenied
 from .models import Meal, Category, Review
-from .serializers import MealSerializer, CategorySerializer, ReviewSerializer ,UserSerializer
-from rest_framework.authentication import TokenAuthentication
+from .cache import category_index, category_from_index, meal_namespace
+from .conditional import ConditionalGetMixin
+from .filters import MealQuery, QUERY_PARAMS as MEAL_QUERY_PARAMS
+from .exports import EXPORTS, EXPORT_FORMATS, MEAL_ROWS, REVIEW_ROWS, absolute_media, export_queryset, stream_export
+from .fastpath import RowListMixin
+from .importers import CONFLICT_MODES, SKIP, import_reviews
+from .parsers import NDJSONParser
+from .leaderboards import WINDOWS, ALL_TIME, top_meals
+from .search import DEFAULT_RATING_WEIGHT, MAX_LIMIT, search_meals
+from .response_cache import CachedResponseMixin
+from .serializers import MealSerializer, MealDetailSerializer, CategorySerializer, ReviewSerializer ,UserSerializer, sparse_fieldset
+from . import histograms, metrics
+from .authentication import CachedTokenAuthentication
 from django.contrib.auth.models import User
 #import token
 from rest_framework.authtoken.models import Token
+from rest_framework.authtoken.views import ObtainAuthToken
+from .throttling import SlidingWindowThrottle
 #import isauthenticatied
 from rest_framework.permissions import IsAuthenticated
 from django.contrib.auth import get_user_model
@@ -28,21 +47,14 @@ class UserView(viewsets.ModelViewSet):
     queryset = get_user_model().objects.all()
     serializer_class = UserSerializer
     permission_classes = [permissions.AllowAny]
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
+    throttle_scope = 'register'
+    throttle_methods = ('POST',)
 
     def get_queryset(self):
         """Return the data for the user associated with the provided token."""
-        auth_header = self.request.headers.get('Authorization')
-
-        if auth_header and auth_header.startswith('Token '):
-            token_key = auth_header.split(' ')[1]
-            
-            # Attempt to get the user associated with the token
-            try:
-                token = Token.objects.get(key=token_key)
-                return get_user_model().objects.filter(id=token.user.id)
-            except Token.DoesNotExist:
-                return get_user_model().objects.none()
+        if self.request.user.is_authenticated:
+            return get_user_model().objects.filter(id=self.request.user.id)
 
         # If no valid token is provided, return an empty queryset
         return get_user_model().objects.none()
@@ -67,63 +79,35 @@ class UserView(viewsets.ModelViewSet):
         }, status=status.HTTP_201_CREATED)
 
     def update(self, request, *args, **kwargs):
-        token_key = request.headers.get('Authorization', '').replace('Token ', '')
-
-        try:
-            # البحث عن التوكن في قاعدة البيانات
-            token = Token.objects.get(key=token_key)
-            instance = token.user  # المستخدم المرتبط بالتوكن
+        instance = request.user  # المستخدم المرتبط بالتوكن
 
-            # دعم التحديث الجزئي (PATCH)
-            partial = kwargs.pop('partial', False)
+        # دعم التحديث الجزئي (PATCH)
+        partial = kwargs.pop('partial', False)
 
-            # إنشاء Serializer مع البيانات الجديدة
-            serializer = self.get_serializer(instance, data=request.data, partial=partial)
-            serializer.is_valid(raise_exception=True)  # التحقق من صحة البيانات
+        # إنشاء Serializer مع البيانات الجديدة
+        serializer = self.get_serializer(instance, data=request.data, partial=partial)
+        serializer.is_valid(raise_exception=True)  # التحقق من صحة البيانات
 
-            # تنفيذ التحديث
-            self.perform_update(serializer)
+        # تنفيذ التحديث
+        self.perform_update(serializer)
 
-            # إرجاع استجابة ناجحة
-            return Response({
-                'message': 'Successfully updated',
-                'user': serializer.data
-            }, status=status.HTTP_200_OK)
+        # إرجاع استجابة ناجحة
+        return Response({
+            'message': 'Successfully updated',
+            'user': serializer.data
+        }, status=status.HTTP_200_OK)
 
-        except Token.DoesNotExist:
-            return Response({'error': 'Invalid or missing token'}, status=status.HTTP_401_UNAUTHORIZED)
     # Delete a user
     def destroy(self, request, *args, **kwargs):
-        token_key = request.headers.get('Authorization', '').replace('Token ', '')
-
-        try:
-            # البحث عن التوكن في قاعدة البيانات
-            token = Token.objects.get(key=token_key)
-            user = token.user  # المستخدم المرتبط بالتوكن
-
-            # حذف المستخدم
-            self.perform_destroy(user)
-            return Response({'message': 'User deleted successfully'}, status=status.HTTP_204_NO_CONTENT)
-
-        except Token.DoesNotExist:
-            return Response({'error': 'Invalid or missing token'}, status=status.HTTP_401_UNAUTHORIZED)
+        # حذف المستخدم المرتبط بالتوكن
+        self.perform_destroy(request.user)
+        return Response({'message': 'User deleted successfully'}, status=status.HTTP_204_NO_CONTENT)
 
     # List users (forbidden by default)
     def list(self, request, *args, **kwargs):
-
-        token_key = self.request.headers.get('Authorization', '').replace('Token ', '')
-
-        try:
-            # Get the user associated with the token
-            token = Token.objects.get(key=token_key)
-            user = token.user
-
-            # Serialize and return the user's data
-            serializer = self.get_serializer(user)
-            return Response(serializer.data, status=status.HTTP_200_OK)
-
-        except Token.DoesNotExist:
-            return Response({'error': 'Invalid or missing token'}, status=status.HTTP_401_UNAUTHORIZED)
+        # Serialize and return the authenticated user's data
+        serializer = self.get_serializer(request.user)
+        return Response(serializer.data, status=status.HTTP_200_OK)
 
     # Custom permissions based on the action
     def get_permissions(self):
@@ -134,57 +118,243 @@ class UserView(viewsets.ModelViewSet):
         return super().get_permissions()
 
 
+class TokenRequestView(ObtainAuthToken):
+    """obtain_auth_token with a rate limit; every attempt hashes a password."""
+    throttle_classes = [SlidingWindowThrottle]
+    throttle_scope = 'token'
+
+
 
 # ✅ إعداد Pagination عام
 
 # ===============================
 # 🌟 CATEGORY VIEWS
 # ===============================
-class CategoryListCreateView(BaseSlugView, generics.ListCreateAPIView):
-    queryset = Category.objects.all()
+class CategoryListCreateView(ConditionalGetMixin, BaseSlugView, generics.ListCreateAPIView):
+    cache_namespaces = ['categories']
+    queryset = Category.objects.annotate(total_meals=Count('meals')).order_by('name')
     serializer_class = CategorySerializer
     permission_classes = [permissions.IsAuthenticated]
     # pagination_class = StandardResultsSetPagination
     # authentication_classes = [TokenAuthentication]
 
+    def list(self, request, *args, **kwargs):
+        """Serve the listing from the cached category index."""
+        serializer_class = self.get_serializer_class()
+        fields = sparse_fieldset(serializer_class, request)
+        if fields is None:
+            fields = serializer_class.Meta.fields
+        rows = [{field: row[field] for field in fields} for row in category_index().values()]
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(page)
+        return Response(rows)
+
 class CategoryDetailView(BaseSlugView, generics.RetrieveUpdateDestroyAPIView):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
+
+    def get_object(self):
+        """Resolve the category from the cached index instead of the database."""
+        category = category_from_index(self.kwargs[self.lookup_field])
+        if category is None:
+            raise Http404
+        self.check_object_permissions(self.request, category)
+        return category
     # permission_classes = [permissions.IsAuthenticated]
     # authentication_classes = [TokenAuthentication]
 
 # ===============================
 # 🍽 MEAL VIEWS
 # ===============================
-class MealListCreateView(BaseSlugView, generics.ListCreateAPIView):
-    queryset = Meal.objects.select_related('category').prefetch_related('reviews')
+class MealListCreateView(ConditionalGetMixin, CachedResponseMixin, RowListMixin, BaseSlugView, generics.ListCreateAPIView):
+    """Meal list with index-backed filters: `category`, `min_price`/`max_price`,
+    `min_rating`, `min_reviews` and `ordering` (see API.filters). Pages are
+    built from `.values()` rows (see API.fastpath)."""
+    cache_namespaces = ['meals', 'categories']
+    cached_query_params = CachedResponseMixin.cached_query_params + MEAL_QUERY_PARAMS
+    # Review totals are stored on Meal, so no review rows are needed here
+    queryset = Meal.objects.select_related('category')
     serializer_class = MealSerializer
+    row_spec = MEAL_ROWS
     # permission_classes = [permissions.IsAuthenticated]  # Allow read access but restrict write
     # authentication_classes = [TokenAuthentication]
-    pagination_class = StandardResultsSetPagination
+    pagination_class = SelectablePagination
+    keyset_ordering = ('-created_at', '-id')
 
-class MealDetailView(BaseSlugView, generics.RetrieveUpdateDestroyAPIView):
-    queryset = Meal.objects.select_related('category').prefetch_related('reviews')
-    serializer_class = MealSerializer
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.request.method != 'GET':
+            return queryset
+        query = MealQuery(self.request.query_params)
+        self.keyset_ordering = query.ordering  # cursors follow the requested order
+        return query.apply(queryset)
+
+class MealDetailView(ConditionalGetMixin, CachedResponseMixin, BaseSlugView, generics.RetrieveUpdateDestroyAPIView):
+    queryset = Meal.objects.select_related('category')
+    serializer_class = MealDetailSerializer
+
+    def get_cache_namespaces(self):
+        return [meal_namespace(self.kwargs['slug']), 'categories']
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        fields = sparse_fieldset(self.get_serializer_class(), self.request)
+        return queryset if fields is None else MEAL_ROWS.only(queryset, fields)
     # authentication_classes = [TokenAuthentication]
     # permission_classes = [permissions.IsAuthenticated]
 
+class MealHistogramsView(APIView):
+    """Rating distributions for up to `max_slugs` meals: `?slugs=a,b,c`."""
+    max_slugs = 100
+
+    def get(self, request, *args, **kwargs):
+        slugs = [slug for slug in request.query_params.get('slugs', '').split(',') if slug]
+        if not 1 <= len(slugs) <= self.max_slugs:
+            return Response({'error': f'Pass between 1 and {self.max_slugs} comma-separated slugs'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        meal_ids = dict(Meal.objects.filter(slug__in=slugs).values_list('slug', 'pk'))
+        found = histograms.histograms_for(meal_ids.values())
+        return Response({
+            'results': {slug: histograms.summarize(found[meal_ids[slug]]) for slug in slugs if slug in meal_ids},
+            'missing': [slug for slug in slugs if slug not in meal_ids],
+        })
+
+
+class MealBatchView(APIView):
+    """Up to `max_keys` meal details in one response, in the requested order.
+
+    `?slugs=a,b,c` or `?ids=1,2,3`, plus an optional sparse fieldset
+    (`fields=name,price` / `exclude=`); unknown keys are listed under
+    `missing`. The review totals are stored on Meal, so one query fetches
+    the meals and one more their histograms (skipped when
+    `rating_distribution` is not selected).
+    """
+    max_keys = 100
+
+    def get(self, request, *args, **kwargs):
+        params = {name: [value for value in request.query_params.get(name, '').split(',') if value]
+                  for name in ('slugs', 'ids')}
+        if bool(params['slugs']) == bool(params['ids']):
+            return Response({'error': 'Pass either slugs or ids'}, status=status.HTTP_400_BAD_REQUEST)
+        keys = list(dict.fromkeys(params['slugs'] or params['ids']))  # drop repeats, keep the order
+        if len(keys) > self.max_keys:
+            return Response({'error': f'Pass at most {self.max_keys} slugs or ids'}, status=status.HTTP_400_BAD_REQUEST)
+        lookup = 'slug'
+        if params['ids']:
+            lookup = 'pk'
+            low, high = connection.ops.integer_field_range(Meal._meta.pk.get_internal_type())
+            try:
+                keys = list(dict.fromkeys(int(key) for key in keys))
+            except ValueError:
+                return Response({'error': 'ids must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+            if not all(low <= key <= high for key in keys):  # the database would raise OverflowError
+                return Response({'error': f'ids must be between {low} and {high}'}, status=status.HTTP_400_BAD_REQUEST)
+        fields = sparse_fieldset(MealDetailSerializer, request)
+        queryset = Meal.objects.select_related('category').filter(**{f'{lookup}__in': keys})
+        if fields is not None:
+            queryset = MEAL_ROWS.only(queryset, fields, keep=[lookup])
+        meals = {getattr(meal, lookup): meal for meal in queryset}
+        if fields is None or 'rating_distribution' in fields:
+            found = histograms.histograms_for([meal.pk for meal in meals.values()])
+            for meal in meals.values():
+                meal.rating_histogram = found[meal.pk]
+        serializer = MealDetailSerializer(
+            [meals[key] for key in keys if key in meals], many=True, context={'request': request},
+        )
+        return Response({
+            'results': serializer.data,
+            'missing': [key for key in keys if key not in meals],
+        })
+
+
+class MealSearchView(APIView):
+    """Ranked meal search: `?q=` with optional `rating_weight` (0-1) and `limit`."""
+    renderer_classes = RowListMixin.renderer_classes
+
+    def get(self, request, *args, **kwargs):
+        query = request.query_params.get('q', '').strip()
+        try:
+            rating_weight = float(request.query_params.get('rating_weight', DEFAULT_RATING_WEIGHT))
+            limit = int(request.query_params.get('limit', 20))
+        except ValueError:
+            return Response({'error': 'rating_weight and limit must be numbers'}, status=status.HTTP_400_BAD_REQUEST)
+        if not 0 <= rating_weight <= 1 or not 1 <= limit <= MAX_LIMIT:
+            return Response({'error': f'rating_weight must be within 0-1 and limit within 1-{MAX_LIMIT}'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        ranked = search_meals(query, rating_weight=rating_weight, limit=limit)
+        # MealSerializer's fields from `.values()` rows, as the list views build them
+        rows = Meal.objects.filter(pk__in=[meal_id for meal_id, _ in ranked]).values('id', *MEAL_ROWS.value_names)
+        rows = {values['id']: values for values in rows}
+        results = []
+        with metrics.serializing():
+            for meal_id, score in ranked:
+                if meal_id in rows:
+                    data = absolute_media(MEAL_ROWS.to_row(rows[meal_id]), request.build_absolute_uri)
+                    data['score'] = round(score, 4)
+                    results.append(data)
+        return Response({'query': query, 'results': results})
+
+class TopMealsView(APIView):
+    """Precomputed rankings: `?window=all|24h|7d|30d` and `?limit=` (max 100).
+
+    Mounted at /meals/top/ and, with a category slug, /categories/<slug>/top/.
+    """
+    max_limit = 100
+
+    def get(self, request, slug=None, *args, **kwargs):
+        window = request.query_params.get('window', ALL_TIME)
+        if window not in WINDOWS:
+            return Response({'error': f"window must be one of {', '.join(WINDOWS)}"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = int(request.query_params.get('limit', 10))
+        except ValueError:
+            limit = 0
+        if not 1 <= limit <= self.max_limit:
+            return Response({'error': f'limit must be within 1-{self.max_limit}'}, status=status.HTTP_400_BAD_REQUEST)
+
+        category_id = None
+        if slug is not None:
+            category = category_from_index(slug)
+            if category is None:
+                raise Http404
+            category_id = category.pk
+
+        results = []
+        for entry in top_meals(window, category_id, limit):
+            data = MealSerializer(entry.meal, context={'request': request}).data
+            data['score'] = round(entry.score, 4)
+            data['window_reviews'] = entry.review_count
+            results.append(data)
+        return Response({'window': window, 'results': results})
+
 # ===============================
 # ⭐ REVIEW VIEWS
 # ===============================
-class ReviewListCreateView(generics.ListCreateAPIView):
+class ReviewListCreateView(ConditionalGetMixin, CachedResponseMixin, RowListMixin, generics.ListCreateAPIView):
     serializer_class = ReviewSerializer
+    row_spec = REVIEW_ROWS
     # permission_classes = [permissions.IsAuthenticatedOrReadOnly]
     # authentication_classes = [TokenAuthentication]
-    pagination_class = StandardResultsSetPagination
+    pagination_class = SelectablePagination
+    keyset_ordering = ('-created_at', '-id')
+    throttle_scope = 'review-create'
+    throttle_methods = ('POST',)
+
+    def get_cache_namespaces(self):
+        return [meal_namespace(self.kwargs['meal_slug'])]
 
     def get_queryset(self):
         """Get reviews for a specific meal using `slug`."""
         meal_slug = self.kwargs['meal_slug']
-        return Review.objects.filter(meal__slug=meal_slug).select_related('user', 'meal')
+        return (
+            Review.objects.filter(meal__slug=meal_slug)
+            .select_related('user', 'meal')
+            .order_by(*self.keyset_ordering)
+        )
 
     def perform_create(self, serializer):
-        print(f"User: {self.request.user}, Is Authenticated: {self.request.user.is_authenticated}")
         if self.request.user.is_anonymous:
             raise PermissionDenied("You must be logged in to submit a review.")
         serializer.save(user=self.request.user)
@@ -195,6 +365,70 @@ class ReviewDetailView(generics.RetrieveUpdateDestroyAPIView):
     # authentication_classes = [TokenAuthentication]
     def get_object(self):
         """البحث عن مراجعة باستخدام meal__slug."""
-        review = get_object_or_404(Review, meal__slug=self.kwargs['slug'], user=self.request.user)
+        queryset = Review.objects.all()
+        fields = sparse_fieldset(self.get_serializer_class(), self.request)
+        if fields is not None:
+            queryset = REVIEW_ROWS.only(queryset, fields)
+        review = get_object_or_404(queryset, meal__slug=self.kwargs['slug'], user=self.request.user)
         return review
 
+
+class ReviewBulkImportView(APIView):
+    """Import a JSON array or NDJSON stream of reviews in batches (staff only)."""
+    permission_classes = [permissions.IsAdminUser]
+    parser_classes = [JSONParser, NDJSONParser]
+
+    def post(self, request, *args, **kwargs):
+        on_conflict = request.query_params.get('on_conflict', SKIP)
+        if on_conflict not in CONFLICT_MODES:
+            return Response({'error': f"on_conflict must be one of {', '.join(CONFLICT_MODES)}"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if not isinstance(request.data, list):
+            return Response({'error': 'Expected a list of reviews'}, status=status.HTTP_400_BAD_REQUEST)
+        result = import_reviews(request.data, on_conflict=on_conflict)
+        return Response(result, status=status.HTTP_200_OK)
+
+
+# ===============================
+# 📤 EXPORT VIEWS
+# ===============================
+class ExportView(APIView):
+    """Stream every meal or review as NDJSON or CSV (staff only).
+
+    `?output=csv` switches the format (`format` is DRF's renderer override) and
+    `?since=<ISO datetime>` limits the export to rows created from then on.
+    """
+    permission_classes = [permissions.IsAdminUser]
+    content_types = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+
+    def get(self, request, dataset, *args, **kwargs):
+        spec = EXPORTS.get(dataset)
+        if spec is None:
+            raise Http404
+        export_format = request.query_params.get('output', 'ndjson')
+        if export_format not in EXPORT_FORMATS:
+            return Response({'error': f"output must be one of {', '.join(EXPORT_FORMATS)}"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        since = request.query_params.get('since')
+        if since is not None:
+            since = parse_datetime(since)
+            if since is None:
+                return Response({'error': 'since must be an ISO 8601 datetime'}, status=status.HTTP_400_BAD_REQUEST)
+
+        response = StreamingHttpResponse(
+            stream_export(spec, export_queryset(spec, since), export_format),
+            content_type=self.content_types[export_format],
+        )
+        response['Content-Disposition'] = f'attachment; filename="{dataset}.{export_format}"'
+        return response
+
+
+# ===============================
+# 📈 METRICS
+# ===============================
+def metrics_view(request):
+    """Prometheus scrape target; limited to API_METRICS_ALLOWED_IPS."""
+    allowed = getattr(settings, 'API_METRICS_ALLOWED_IPS', None)
+    if allowed is not None and request.META.get('REMOTE_ADDR') not in allowed:
+        raise Http404
+    return HttpResponse(metrics.render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
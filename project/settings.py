@@ -10,9 +10,18 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 
+def env_bool(name, default):
+    return os.environ.get(name, str(default)).strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def env_int(name, default):
+    return int(os.environ.get(name, default))
+
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -49,6 +58,7 @@ APPEND_SLASH = True
 
 
 MIDDLEWARE = [
+    'API.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -58,6 +68,7 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
+    'API.middleware.ReplicaRoutingMiddleware',
 ]
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:3000",
@@ -98,26 +109,114 @@ WSGI_APPLICATION = 'project.wsgi.application'
 # }
 
 
+# Connection management, all overridable from the environment:
+#   DB_ENGINE              postgresql (default) or sqlite3 as a local stand-in
+#   DB_CONN_MAX_AGE        seconds a connection is reused across requests;
+#                          0 closes it after every request, -1 keeps it forever
+#   DB_CONN_HEALTH_CHECKS  ping reused connections before handing them out
+#   DB_POOL                use a psycopg3 connection pool (PostgreSQL only,
+#                          needs `psycopg[pool]`); replaces CONN_MAX_AGE
+#   DB_POOL_MIN_SIZE / DB_POOL_MAX_SIZE / DB_POOL_TIMEOUT (seconds to wait
+#                          for a free connection)
+DB_ENGINE = os.environ.get('DB_ENGINE', 'postgresql')
+DB_CONN_MAX_AGE = env_int('DB_CONN_MAX_AGE', 60)
+
 DATABASES = {
     "default": {
-        "ENGINE": "django.db.backends.postgresql",
-        "NAME": "MealsRater",
-        "USER": "postgres",
-        "PASSWORD": "2002",
-        "HOST": "127.0.0.1",
-        "PORT": "5432",
+        "ENGINE": f"django.db.backends.{DB_ENGINE}",
+        "NAME": os.environ.get('DB_NAME', 'MealsRater' if DB_ENGINE == 'postgresql' else str(BASE_DIR / 'db.sqlite3')),
+        "USER": os.environ.get('DB_USER', 'postgres'),
+        "PASSWORD": os.environ.get('DB_PASSWORD', '2002'),
+        "HOST": os.environ.get('DB_HOST', '127.0.0.1'),
+        "PORT": os.environ.get('DB_PORT', '5432'),
+        "CONN_MAX_AGE": None if DB_CONN_MAX_AGE < 0 else DB_CONN_MAX_AGE,
+        "CONN_HEALTH_CHECKS": env_bool('DB_CONN_HEALTH_CHECKS', True),
+        "OPTIONS": {},
     }
 }
+if DB_ENGINE == 'postgresql' and env_bool('DB_POOL', False):
+    # Django rejects persistent connections on top of a pool
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+    DATABASES['default']['OPTIONS']['pool'] = {
+        'min_size': env_int('DB_POOL_MIN_SIZE', 2),
+        'max_size': env_int('DB_POOL_MAX_SIZE', 10),
+        'timeout': env_int('DB_POOL_TIMEOUT', 10),
+    }
+
+# Read replicas: DB_REPLICAS="host-a=3,host-b=1" adds aliases replica1,
+# replica2, ... that copy `default` with HOST (NAME for sqlite3) replaced,
+# weighted 3:1 for safe-request reads (see API.db_router).
+REPLICA_WEIGHTS = {}
+for number, entry in enumerate(filter(None, os.environ.get('DB_REPLICAS', '').split(',')), start=1):
+    target, _, weight = entry.partition('=')
+    alias = f'replica{number}'
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        'HOST' if DB_ENGINE == 'postgresql' else 'NAME': target.strip(),
+        'TEST': {'MIRROR': 'default'},
+    }
+    REPLICA_WEIGHTS[alias] = int(weight or 1)
+DATABASE_ROUTERS = ['API.db_router.ReplicaRouter']
+REPLICA_STICKY_SECONDS = env_int('DB_REPLICA_STICKY_SECONDS', 5)  # primary-only reads after a write
+REPLICA_RETRY_SECONDS = env_int('DB_REPLICA_RETRY_SECONDS', 30)  # back-off for a failed replica
 # settings.py
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.TokenAuthentication',
+        'API.authentication.CachedTokenAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
     'DEFAULT_PAGINATION_CLASS': 'API.pagination.StandardResultsSetPagination',
+    'DEFAULT_THROTTLE_CLASSES': (
+        'API.throttling.SlidingWindowThrottle',
+    ),
+    # Scopes are set per view (`throttle_scope`); unscoped views are not limited
+    'DEFAULT_THROTTLE_RATES': {
+        'register': '5/hour',
+        'token': '10/min',
+        'review-create': '30/min',
+    },
 }
+# Throttle counters: CacheCounterStore keeps them in API_THROTTLE_CACHE_ALIAS
+# (shared by every worker); MemoryCounterStore is per process.
+API_THROTTLE_STORE = 'API.throttling.CacheCounterStore'
+API_THROTTLE_CACHE_ALIAS = 'default'
+
+# Background jobs (API.jobs), run by `manage.py run_workers`
+API_JOBS_SYNC = env_bool('API_JOBS_SYNC', False)  # run jobs inline in the request instead
+API_JOBS_RETRY_DELAY = 5  # seconds before the first retry, doubled for every further attempt
+API_JOBS_LEASE_SECONDS = 300  # a running job whose worker went away is claimed again after this
+API_JOBS_KEEP_DAYS = 7  # finished jobs (and their idempotency keys) are purged after this
+API_JOBS_PURGE_INTERVAL = 3600  # seconds between a worker's purges of finished jobs
+TEST_RUNNER = 'API.test_runner.InlineJobsTestRunner'
+
+# Metrics (API.metrics, served at /metrics)
+API_METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']  # None allows every address
+API_N_PLUS_ONE_THRESHOLD = 10  # identical query templates per request before flagging
+API_PROFILE_SAMPLE_RATE = float(os.environ.get('API_PROFILE_SAMPLE_RATE', 0))  # share of requests under cProfile
+API_PROFILE_SLOW_MS = 500  # sampled requests slower than this are dumped
+API_PROFILE_DIR = BASE_DIR / 'profiles'
+# Caches
+# Version counters for invalidation live in `default`, so every worker must
+# share it in production (e.g. django.core.cache.backends.redis.RedisCache).
+# `responses` holds serialized read payloads and may be file- or Redis-backed.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'api-default',
+    },
+    'responses': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'api-responses',
+    },
+}
+API_RESPONSE_CACHE_ALIAS = 'responses'
+API_RESPONSE_CACHE_TIMEOUT = 300  # seconds
+
+# Token -> user cache used by CachedTokenAuthentication
+API_TOKEN_CACHE_SIZE = 10000
+API_TOKEN_CACHE_TTL = 300  # seconds
 
 
 
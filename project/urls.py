@@ -16,12 +16,13 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path ,include
-from rest_framework.authtoken.views import obtain_auth_token
+from API.views import TokenRequestView, metrics_view
 
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/',include('API.urls')),
-    path('tokenrequest/',obtain_auth_token),
+    path('tokenrequest/',TokenRequestView.as_view()),
+    path('metrics', metrics_view, name='metrics'),
 
 ]